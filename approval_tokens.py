@@ -0,0 +1,118 @@
+# approval_tokens.py (signed, expiring tokens for the approve/reject links in supervisor emails)
+import base64
+import hashlib
+import hmac
+import os
+import time
+from datetime import date
+
+# Approval link configuration from environment variables
+#   APPROVAL_SECRET              key the tokens are signed with; every bot and web process must share it
+#   APPROVAL_TOKEN_TTL_SECONDS   how long a link stays valid (4 days, one more than the auto-approval window)
+APPROVAL_TOKEN_TTL_SECONDS = int(os.getenv("APPROVAL_TOKEN_TTL_SECONDS", 4 * 24 * 60 * 60))
+APPROVAL_ACTIONS = ("approve", "reject")
+# Action field of bulk review tokens; never one of APPROVAL_ACTIONS, so the two kinds of token cannot be swapped
+BULK_REVIEW_ACTION = "bulk-review"
+# Action field of the tokens that link a supervisor's email to their Telegram chat, and how long such a link lasts
+SUPERVISOR_LINK_ACTION = "link-telegram"
+SUPERVISOR_LINK_TTL_SECONDS = 24 * 60 * 60
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _secret():
+    secret = os.getenv("APPROVAL_SECRET")
+    if secret:
+        return secret.encode()
+    # Without a dedicated secret fall back to one derived from the bot token, which every process already has
+    bot_token = os.getenv("BOT_TOKEN")
+    if not bot_token:
+        raise RuntimeError("APPROVAL_SECRET (or BOT_TOKEN) must be set to sign approval links")
+    return hmac.new(bot_token.encode(), b"leave-approval-links", hashlib.sha256).digest()
+
+
+def _signature(payload):
+    return _b64encode(hmac.new(_secret(), payload.encode(), hashlib.sha256).digest())
+
+
+# This function creates the token carried by an approve or reject link.
+# start_date (a date) names the application's partition of the leave log, so the link's lookups stay in it
+def create_approval_token(application_id, action, ttl_seconds=APPROVAL_TOKEN_TTL_SECONDS, start_date=None):
+    if action not in APPROVAL_ACTIONS:
+        raise ValueError(f"Unknown approval action: {action}")
+    expires_at = int(time.time()) + ttl_seconds
+    fields = [application_id] + ([start_date.isoformat()] if start_date else []) + [action, str(expires_at)]
+    payload = _b64encode("|".join(fields).encode())
+    return f"{payload}.{_signature(payload)}"
+
+
+# This function checks a token's signature and expiry
+# Returns (application_id, action, start_date), or None if the token is malformed, forged or expired;
+# start_date is None for tokens created without one (links sent before tokens carried it)
+def verify_approval_token(token, now=None):
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _signature(payload)):
+            return None
+        fields = _b64decode(payload).decode().split("|")
+        if len(fields) == 3:
+            (application_id, action, expires_at), start_date = fields, None
+        else:
+            application_id, start_date, action, expires_at = fields
+            start_date = date.fromisoformat(start_date)
+        if action not in APPROVAL_ACTIONS or int(expires_at) < (now or time.time()):
+            return None
+        return application_id, action, start_date
+    except (AttributeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+# This function creates the token carried by a supervisor's bulk review link; it names the supervisor, not an application
+def create_bulk_review_token(supervisor_email, ttl_seconds=APPROVAL_TOKEN_TTL_SECONDS):
+    expires_at = int(time.time()) + ttl_seconds
+    payload = _b64encode(f"{supervisor_email}|{BULK_REVIEW_ACTION}|{expires_at}".encode())
+    return f"{payload}.{_signature(payload)}"
+
+
+# This function checks a bulk review token's signature and expiry
+# Returns the supervisor's email, or None if the token is malformed, forged, expired or an approve/reject token
+def verify_bulk_review_token(token, now=None):
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _signature(payload)):
+            return None
+        supervisor_email, action, expires_at = _b64decode(payload).decode().rsplit("|", 2)
+        if action != BULK_REVIEW_ACTION or int(expires_at) < (now or time.time()):
+            return None
+        return supervisor_email
+    except (AttributeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+# This function creates the token carried by the link emailed to a supervisor who asked the bot to send them
+# their applications; opening it proves they read that mailbox
+def create_supervisor_link_token(supervisor_email, chat_id, telegram_handle, ttl_seconds=SUPERVISOR_LINK_TTL_SECONDS):
+    expires_at = int(time.time()) + ttl_seconds
+    payload = _b64encode(f"{supervisor_email}|{chat_id}|{telegram_handle or ''}|{SUPERVISOR_LINK_ACTION}|{expires_at}".encode())
+    return f"{payload}.{_signature(payload)}"
+
+
+# This function checks a supervisor link token's signature and expiry
+# Returns (supervisor_email, chat_id, telegram_handle), or None if the token is malformed, forged, expired or another kind
+def verify_supervisor_link_token(token, now=None):
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _signature(payload)):
+            return None
+        supervisor_email, chat_id, telegram_handle, action, expires_at = _b64decode(payload).decode().rsplit("|", 4)
+        if action != SUPERVISOR_LINK_ACTION or int(expires_at) < (now or time.time()):
+            return None
+        return supervisor_email, int(chat_id), telegram_handle or None
+    except (AttributeError, ValueError, UnicodeDecodeError):
+        return None
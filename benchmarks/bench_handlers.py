@@ -0,0 +1,196 @@
+# benchmarks/bench_handlers.py (throughput of the leave application and cancellation conversations)
+#
+# Drives the conversation handlers in intern_bot directly with synthetic updates for N concurrent
+# interns, against a disposable PostgreSQL database with SMTP and Telegram stubbed out.
+#
+#   python -m benchmarks.bench_handlers --interns 50 --rounds 3
+#   python -m benchmarks.bench_handlers --save-baseline
+#
+# Reports p50/p95/p99 per handler step and completed conversations per second, and compares them
+# with benchmarks/baselines/handlers.json (exit status 1 when a step regresses past the tolerance).
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.fakes import (FakeApplication, FakeBot, FakeJobQueue, FakeSMTP, handler_context, job_context,
+                              message_update, stub_smtp)
+from benchmarks.local_postgres import export_database_env, temporary_database
+from benchmarks.roster import write_active_roster
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "handlers.json")
+
+APPLY_STEPS = ["apply_leave_start", "leave_type_handler", "day_portion_handler", "start_date_handler",
+               "end_date_handler", "confirmation_handler"]
+CANCEL_STEPS = ["cancel_leave_start", "choose_leave_handler", "confirm_cancel_handler"]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def leave_window(round_number):
+    """A Monday-to-Wednesday window, a different week for each round so rounds never overlap"""
+    monday = date.today() + timedelta(days=7 - date.today().weekday())
+    start_date = monday + timedelta(weeks=round_number + 1)
+    return start_date, start_date + timedelta(days=2)
+
+
+async def timed(timings, step, handler, update, context):
+    started = time.perf_counter()
+    result = await handler(update, context)
+    timings.setdefault(step, []).append((time.perf_counter() - started) * 1000)
+    return result
+
+
+async def run_conversation(bot, username, user_id, round_number, application, timings, latency):
+    """One intern applies for leave, has it auto-approved, then cancels it"""
+    start_date, end_date = leave_window(round_number)
+    context = handler_context(application)
+
+    def say(text):
+        return message_update(username, user_id, text, latency)
+
+    await timed(timings, "apply_leave_start", bot.apply_leave_start, say("/apply"), context)
+    await timed(timings, "leave_type_handler", bot.leave_type_handler, say("Annual Leave"), context)
+    await timed(timings, "day_portion_handler", bot.day_portion_handler, say("Full Day"), context)
+    await timed(timings, "start_date_handler", bot.start_date_handler, say(start_date.strftime("%d-%m-%Y")), context)
+    await timed(timings, "end_date_handler", bot.end_date_handler, say(end_date.strftime("%d-%m-%Y")), context)
+    confirmation = say("Yes")
+    await timed(timings, "confirmation_handler", bot.confirmation_handler, confirmation, context)
+
+    # In buffered write mode the supervisor is contacted by a task once the application's batch commits
+    await application.drain()
+
+    # Approve through the same job the bot schedules, outside the timed steps
+    pending = application.bot_data["leave_registry"].for_username(username, "Pending")
+    if not pending:
+        raise RuntimeError(f"{username} round {round_number}: application was not submitted: {confirmation.message.replies}")
+    job = application.job_queue.jobs.pop(f"auto_approve_{pending[0].id}")
+    await bot.auto_approve_leave(job_context(application, job))
+
+    context = handler_context(application)
+    await timed(timings, "cancel_leave_start", bot.cancel_leave_start, say("/cancel_leave"), context)
+    choice = f"Annual Leave ({start_date:%d-%m-%Y} to {end_date:%d-%m-%Y})"
+    await timed(timings, "choose_leave_handler", bot.choose_leave_handler, say(choice), context)
+    await timed(timings, "confirm_cancel_handler", bot.confirm_cancel_handler, say("Yes"), context)
+
+
+def summarise(timings, conversations, elapsed):
+    steps = {}
+    for step in APPLY_STEPS + CANCEL_STEPS:
+        samples = timings.get(step, [])
+        steps[step] = {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 0.50), 3),
+            "p95_ms": round(percentile(samples, 0.95), 3),
+            "p99_ms": round(percentile(samples, 0.99), 3),
+        }
+    return {
+        "conversations": conversations,
+        "elapsed_s": round(elapsed, 3),
+        "conversations_per_s": round(conversations / elapsed, 2) if elapsed else 0.0,
+        "steps": steps,
+    }
+
+
+def compare_with_baseline(result, baseline, tolerance):
+    """Return a list of regressions: steps whose p95 grew, or throughput that fell, by more than tolerance"""
+    regressions = []
+    for step, stats in result["steps"].items():
+        previous = baseline.get("steps", {}).get(step)
+        if previous and previous["p95_ms"] and stats["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{step}: p95 {stats['p95_ms']}ms vs baseline {previous['p95_ms']}ms")
+    previous_rate = baseline.get("conversations_per_s")
+    if previous_rate and result["conversations_per_s"] < previous_rate * (1 - tolerance):
+        regressions.append(f"throughput: {result['conversations_per_s']}/s vs baseline {previous_rate}/s")
+    return regressions
+
+
+def print_report(result):
+    print(f"{'step':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, stats in result["steps"].items():
+        print(f"{step:<24}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"{result['conversations']} conversations in {result['elapsed_s']}s "
+          f"({result['conversations_per_s']} conversations/s)")
+
+
+async def run_benchmark(bot, handles, rounds, latency):
+    from leave_registry import LeaveRegistry
+
+    application = FakeApplication({"leave_registry": LeaveRegistry()}, FakeJobQueue(), FakeBot(latency))
+    # Same write path as the bot in the configured LEAVE_LOG_WRITE_MODE
+    if bot.LEAVE_LOG_WRITE_MODE != "direct":
+        application.bot_data["leave_log_writer"] = bot.LeaveLogWriter().start()
+    timings = {}
+    started = time.perf_counter()
+    try:
+        for round_number in range(rounds):
+            await asyncio.gather(*(
+                run_conversation(bot, username, 100000 + index, round_number, application, timings, latency)
+                for index, username in enumerate(handles)
+            ))
+    finally:
+        if "leave_log_writer" in application.bot_data:
+            application.bot_data["leave_log_writer"].stop()
+    elapsed = time.perf_counter() - started
+    return summarise(timings, len(handles) * rounds, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the leave application and cancellation handlers")
+    parser.add_argument("--interns", type=int, default=50, help="concurrent interns per round")
+    parser.add_argument("--rounds", type=int, default=3, help="conversations per intern")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="simulated seconds per Bot API call")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown before failing (0.20 = 20%%)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    stub_smtp()
+
+    with temporary_database() as config, tempfile.TemporaryDirectory() as workdir:
+        export_database_env(config)
+        roster_path = os.path.join(workdir, "interns.csv")
+        handles = write_active_roster(roster_path, args.interns)
+        os.environ["INTERNS_DB"] = roster_path
+
+        # intern_bot loads the roster and the registered interns at import time
+        import intern_bot
+        result = asyncio.run(run_benchmark(intern_bot, handles, args.rounds, args.telegram_latency))
+        result["emails_sent"] = FakeSMTP.sent
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as handle:
+            json.dump(result, handle, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline stored yet; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline) as handle:
+        regressions = compare_with_baseline(result, json.load(handle), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+# benchmarks/bench_roster_import.py (how create_interns_table_from_csv scales with roster size)
+#
+# Generates synthetic rosters and times the import against a disposable PostgreSQL database:
+# first into an empty table, then again over the same rows (what every bot restart does).
+#
+#   python -m benchmarks.bench_roster_import --sizes 1000,10000,100000 --duplicates 0.05 --returning 0.1 --completed 0.3
+#
+# Each size runs in its own process so peak RSS is that import's alone. Results (rows/s, peak RSS,
+# database round trips) are appended to benchmarks/results/roster_import.jsonl with the git commit,
+# and each run is compared with the previous run of the same size and mix.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.local_postgres import export_database_env, temporary_database
+from benchmarks.roster import ROSTER_COLUMNS, write_roster
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results", "roster_import.jsonl")
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _install_counting_pool(db_utils):
+    """Swap db_utils' pool for one whose connections count every statement and commit sent to the server"""
+    import psycopg2.extensions
+    import psycopg2.pool
+
+    counter = {"round_trips": 0}
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            counter["round_trips"] += 1
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            vars_list = list(vars_list)
+            counter["round_trips"] += len(vars_list)
+            return super().executemany(query, vars_list)
+
+    class CountingConnection(psycopg2.extensions.connection):
+        def cursor(self, *args, **kwargs):
+            kwargs.setdefault("cursor_factory", CountingCursor)
+            return super().cursor(*args, **kwargs)
+
+        def commit(self):
+            counter["round_trips"] += 1
+            return super().commit()
+
+        def rollback(self):
+            counter["round_trips"] += 1
+            return super().rollback()
+
+    if db_utils.connection_pool is not None:
+        db_utils.connection_pool.closeall()
+    db_utils.connection_pool = psycopg2.pool.ThreadedConnectionPool(
+        1, 20, connection_factory=CountingConnection, **db_utils.DB_CONFIG
+    )
+    return counter
+
+
+def run_worker(roster_path, result_path):
+    """Runs in the child process: import the roster twice and write the measurements as JSON"""
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as empty_roster:
+        empty_roster.write(",".join(f'"{column}"' for column in ROSTER_COLUMNS) + "\n")
+    # db_utils creates its tables and imports INTERNS_DB when it is first imported
+    os.environ["INTERNS_DB"] = empty_roster.name
+    import db_utils
+    os.unlink(empty_roster.name)
+
+    counter = _install_counting_pool(db_utils)
+    rss_before = _peak_rss_mb()
+    passes = {}
+    for name in ("cold", "reimport"):
+        counter["round_trips"] = 0
+        started = time.perf_counter()
+        if not db_utils.create_interns_table_from_csv(roster_path):
+            raise RuntimeError(f"{name} import failed; see the db_utils log above")
+        elapsed = time.perf_counter() - started
+        passes[name] = {"elapsed_s": round(elapsed, 3), "round_trips": counter["round_trips"], "peak_rss_mb": _peak_rss_mb()}
+
+    with open(result_path, "w") as handle:
+        json.dump({"rss_before_import_mb": rss_before, "passes": passes}, handle)
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark_size(rows, args, workdir):
+    roster_path = os.path.join(workdir, f"roster_{rows}.csv")
+    result_path = os.path.join(workdir, f"result_{rows}.json")
+    mix = write_roster(roster_path, rows, duplicate_ratio=args.duplicates, returning_ratio=args.returning,
+                       completed_ratio=args.completed, supervisors=args.supervisors, seed=args.seed)
+
+    with temporary_database() as config:
+        export_database_env(config)
+        env = dict(os.environ, LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"))
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_roster_import", "--worker", roster_path, result_path],
+                       cwd=REPO_ROOT, env=env, check=True)
+
+    with open(result_path) as handle:
+        measured = json.load(handle)
+    for stats in measured["passes"].values():
+        stats["rows_per_s"] = round(rows / stats["elapsed_s"], 1) if stats["elapsed_s"] else 0.0
+        stats["round_trips_per_row"] = round(stats["round_trips"] / rows, 2)
+    return {
+        "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "rows": rows,
+        "mix": {"duplicates": args.duplicates, "returning": args.returning, "completed": args.completed,
+                "supervisors": args.supervisors, "seed": args.seed},
+        "written": mix,
+        "rss_before_import_mb": measured["rss_before_import_mb"],
+        "passes": measured["passes"],
+    }
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def previous_run(history, result):
+    for entry in reversed(history):
+        if entry["rows"] == result["rows"] and entry["mix"] == result["mix"]:
+            return entry
+    return None
+
+
+def print_result(result, previous):
+    for name, stats in result["passes"].items():
+        line = (f"{result['rows']:>8} rows {name:<9}{stats['elapsed_s']:>9}s{stats['rows_per_s']:>11} rows/s"
+                f"{stats['peak_rss_mb']:>9} MB{stats['round_trips']:>10} round trips ({stats['round_trips_per_row']}/row)")
+        if previous and name in previous["passes"]:
+            before = previous["passes"][name]["rows_per_s"]
+            if before:
+                line += f"  {(stats['rows_per_s'] - before) / before:+.0%} vs {previous['commit']}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the intern roster import")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated roster sizes")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="fraction of rows repeated verbatim")
+    parser.add_argument("--returning", type=float, default=0.10, help="fraction of rows that are a second internship")
+    parser.add_argument("--completed", type=float, default=0.30, help="fraction of first internships already ended")
+    parser.add_argument("--supervisors", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON lines file the results are appended to")
+    parser.add_argument("--no-record", action="store_true", help="print results without appending them")
+    parser.add_argument("--worker", nargs=2, metavar=("ROSTER", "RESULT"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(*args.worker)
+        return 0
+
+    history = load_results(args.results)
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in (int(size) for size in args.sizes.split(",")):
+            result = benchmark_size(rows, args, workdir)
+            print_result(result, previous_run(history, result))
+            if not args.no_record:
+                os.makedirs(os.path.dirname(args.results), exist_ok=True)
+                with open(args.results, "a") as handle:
+                    handle.write(json.dumps(result) + "\n")
+            history.append(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
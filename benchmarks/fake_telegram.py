@@ -0,0 +1,163 @@
+# benchmarks/fake_telegram.py (a local stand-in for the Telegram Bot API)
+#
+# Serves the subset of the Bot API the bot uses (getMe, getUpdates long polling, sendMessage,
+# editMessageText, answerCallbackQuery, ...) under /bot<token>/<method>. Point the bot at it with
+# BOT_API_BASE_URL=http://127.0.0.1:<port>. Tests inject user messages with inject_message and read
+# what the bot sent with wait_for_reply.
+import itertools
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 999999, "is_bot": True, "first_name": "Leave Bot", "username": "leave_bench_bot"}
+
+
+class _BotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parameters(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        parameters = {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+        query = self.path.partition("?")[2]
+        parameters.update({key: values[-1] for key, values in parse_qs(query).items()})
+        return parameters
+
+    def _respond(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self):
+        path = self.path.partition("?")[0].strip("/")
+        prefix, _, method = path.partition("/")
+        if not prefix.startswith("bot") or not method:
+            self._respond({"ok": False, "error_code": 404, "description": "Not Found"}, 404)
+            return
+        result = self.server.api.call(method, self._parameters())
+        self._respond({"ok": True, "result": result})
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+
+class _ThreadingBotAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class FakeBotAPI:
+    """In-process Bot API server; replies sent by the bot are timestamped and queued per chat"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._server = _ThreadingBotAPIServer((host, port), _BotAPIHandler)
+        self._server.api = self
+        self.host, self.port = self._server.server_address[:2]
+        self.base_url = f"http://{self.host}:{self.port}"
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._replies = {}
+        self._replies_lock = threading.Lock()
+        self.polling = threading.Event()
+        self.calls = {}
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ---- driver side ----
+
+    def inject_message(self, user_id, username, text):
+        """Queue a private text message from the user for the bot's next getUpdates; returns the injection time"""
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "username": username, "first_name": username},
+            "from": {"id": user_id, "is_bot": False, "first_name": username, "username": username},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        with self._condition:
+            injected_at = time.perf_counter()
+            self._updates.append({"update_id": next(self._update_ids), "message": message})
+            self._condition.notify_all()
+        return injected_at
+
+    def _reply_queue(self, chat_id):
+        with self._replies_lock:
+            return self._replies.setdefault(int(chat_id), queue.Queue())
+
+    def wait_for_reply(self, chat_id, predicate=None, timeout=30.0):
+        """Return (text, sent_at) of the next message to the chat matching predicate; earlier ones are discarded"""
+        replies = self._reply_queue(chat_id)
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"no matching reply to chat {chat_id} within {timeout}s")
+            try:
+                text, sent_at = replies.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if predicate is None or predicate(text):
+                return text, sent_at
+
+    # ---- Bot API side ----
+
+    def call(self, method, parameters):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        handler = getattr(self, f"_api_{method.lower()}", None)
+        return handler(parameters) if handler else True
+
+    def _api_getme(self, parameters):
+        return BOT_USER
+
+    def _api_getupdates(self, parameters):
+        offset = int(parameters.get("offset") or 0)
+        limit = int(parameters.get("limit") or 100)
+        timeout = float(parameters.get("timeout") or 0)
+        self.polling.set()
+        with self._condition:
+            # Updates below the offset have been confirmed by the bot
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            if not self._updates and timeout:
+                self._condition.wait(timeout)
+            return self._updates[:limit]
+
+    def _sent_message(self, parameters):
+        chat_id = int(parameters["chat_id"])
+        text = parameters.get("text", "")
+        self._reply_queue(chat_id).put((text, time.perf_counter()))
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    def _api_sendmessage(self, parameters):
+        return self._sent_message(parameters)
+
+    def _api_editmessagetext(self, parameters):
+        if "chat_id" not in parameters:
+            return True
+        return self._sent_message(parameters)
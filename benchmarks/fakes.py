@@ -0,0 +1,132 @@
+# benchmarks/fakes.py (stand-ins for Telegram updates, handler context and SMTP)
+import asyncio
+import itertools
+import smtplib
+from types import SimpleNamespace
+
+_message_ids = itertools.count(1)
+
+
+class FakeMessage:
+    """Records replies instead of calling the Bot API; latency simulates the Telegram round trip"""
+
+    def __init__(self, text, chat_id, latency=0.0):
+        self.text = text
+        self.chat_id = chat_id
+        self.message_id = next(_message_ids)
+        self.latency = latency
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, parse_mode=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.replies.append(text)
+        return FakeMessage(text, self.chat_id, self.latency)
+
+
+def message_update(username, user_id, text, latency=0.0):
+    """An Update carrying a text message from the given intern"""
+    return SimpleNamespace(
+        update_id=next(_message_ids),
+        message=FakeMessage(text, user_id, latency),
+        callback_query=None,
+        effective_user=SimpleNamespace(id=user_id, username=username),
+        effective_chat=SimpleNamespace(id=user_id),
+    )
+
+
+class FakeJobQueue:
+    """Collects scheduled jobs without running them; unnamed ones (dispatcher wake-ups) are only counted"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.unnamed = 0
+
+    def run_once(self, callback, when, data=None, name=None, **kwargs):
+        job = SimpleNamespace(callback=callback, when=when, data=data, name=name, removed=False)
+        job.schedule_removal = lambda: setattr(job, "removed", True)
+        if name is None:
+            self.unnamed += 1
+        else:
+            self.jobs[name] = job
+        return job
+
+    def get_jobs_by_name(self, name):
+        job = self.jobs.get(name)
+        return [job] if job else []
+
+
+class FakeBot:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+class FakeApplication:
+    """The parts of telegram.ext.Application handlers reach through context.application"""
+
+    def __init__(self, bot_data, job_queue, bot):
+        self.bot_data = bot_data
+        self.job_queue = job_queue
+        self.bot = bot
+        self.tasks = set()
+
+    def create_task(self, coroutine, update=None, **kwargs):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def drain(self):
+        """Wait for the tasks handlers started, as the application does on shutdown"""
+        while self.tasks:
+            await asyncio.gather(*self.tasks)
+
+
+def handler_context(application, args=None):
+    """A per-user CallbackContext stand-in; user_data persists across the user's steps"""
+    return SimpleNamespace(user_data={}, bot_data=application.bot_data, job_queue=application.job_queue,
+                           bot=application.bot, application=application, args=args or [])
+
+
+def job_context(application, job):
+    """The CallbackContext a job callback receives"""
+    return SimpleNamespace(job=job, bot_data=application.bot_data, job_queue=application.job_queue,
+                           bot=application.bot, application=application)
+
+
+class FakeSMTP:
+    """Drop-in for smtplib.SMTP that accepts every message without touching the network"""
+
+    sent = 0
+
+    def __init__(self, host=None, port=None, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self, *args, **kwargs):
+        pass
+
+    def login(self, *args, **kwargs):
+        pass
+
+    def send_message(self, msg, *args, **kwargs):
+        FakeSMTP.sent += 1
+        return {}
+
+    def quit(self):
+        pass
+
+
+def stub_smtp():
+    smtplib.SMTP = FakeSMTP
@@ -0,0 +1,192 @@
+# benchmarks/ledger_concurrency.py (concurrent balance changes to one intern against a disposable database)
+#
+# Starts --workers threads that deduct from the same intern's Annual Leave at the same moment, then restore
+# half of it the same way, and checks that:
+#   - interns_new ends at exactly the balance the changes add up to (no change was lost),
+#   - every change appended its leave_events row,
+#   - replaying the ledger gives the same balances as interns_new (rebuild_leave_balances finds no drift).
+# Then it approves --workers pending applications of one intern at the same moment, twice:
+#   - one day each on different dates, with balance for half of them: exactly that half is approved, the
+#     others are rejected for insufficient balance and the balance ends at 0,
+#   - all on the same date: exactly one is approved and the others are rejected as overlapping leave,
+# and no approval fails with a database error.
+#
+#   python -m benchmarks.ledger_concurrency --workers 16 --rounds 5
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from benchmarks.local_postgres import export_database_env, temporary_database
+from benchmarks.roster import write_active_roster
+
+
+def run_concurrently(workers, change):
+    """Run change(index) on `workers` threads released together; returns how many reported failure"""
+    barrier = threading.Barrier(workers)
+    failures = []
+
+    def worker(index):
+        barrier.wait()
+        if not change(index):
+            failures.append(index)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(failures)
+
+
+def annual_leave(db_utils, handle):
+    """(al_balance, al_taken, deduct/restore events in the ledger) as committed"""
+    conn = db_utils.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COALESCE(al_balance, 0), COALESCE(al_taken, 0),
+                   (SELECT COUNT(*) FROM leave_events e
+                    WHERE e.intern_id = i.id AND e.event_type IN ('deduct', 'restore'))
+            FROM interns_new i
+            WHERE telegram_handle = %s
+        """, (handle,))
+        return cursor.fetchone()
+    finally:
+        conn.rollback()
+        db_utils.release_connection(conn)
+
+
+def restore(db_utils, handle, amount):
+    """Restore through the path a cancellation takes, in a transaction of its own"""
+    conn = db_utils.get_connection()
+    try:
+        db_utils._apply_balance_change(conn.cursor(), handle, "restore", "al_balance", "al_taken", amount)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        return False
+    finally:
+        db_utils.release_connection(conn)
+
+
+def weekdays(count):
+    """The next `count` weekdays, starting next Monday"""
+    day = date.today() + timedelta(days=7 - date.today().weekday())
+    days = []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def pending_applications(db_utils, handle, name, days, label):
+    """Save one pending one-day Annual Leave per date; returns their ids"""
+    applications = [{
+        'id': f"bench-{label}-{index}", 'employee_name': name, 'submission_time': datetime.now(),
+        'leave_type': 'Annual Leave', 'start_date': day, 'end_date': day, 'leave_duration': Decimal(1),
+        'day_portion': 'Full Day', 'status': 'Pending', 'remarks': '', 'username': handle, 'chat_id': None,
+        'supervisor_email': None, 'balance_type': 'al_balance', 'taken_type': 'al_taken'
+    } for index, day in enumerate(days)]
+    if not db_utils.save_leave_applications(applications):
+        raise RuntimeError("could not save the pending applications")
+    return [application['id'] for application in applications]
+
+
+def approve_concurrently(db_utils, application_ids):
+    """Approve every application at once as a supervisor would; returns (failures, Counter of outcomes)"""
+    outcomes = []
+
+    def approve(index):
+        decided, status, refusal = db_utils.transition_leave_status(application_ids[index], "Approved",
+                                                                     refusal_status="Rejected")
+        outcomes.append((status, refusal.reason if refusal else None))
+        return decided
+
+    failed = run_concurrently(len(application_ids), approve)
+    return failed, Counter(outcomes)
+
+
+def check_concurrent_approvals(db_utils, workers, handle, name, failures):
+    """Approvals racing for one intern's balance, then for one date"""
+    # Bring the balance down to what half of the applications need, through the ledger
+    allowed = workers // 2
+    balance, _, _ = annual_leave(db_utils, handle)
+    db_utils.update_leave_balance(handle, "al_balance", balance - allowed, "al_taken")
+
+    failed, outcomes = approve_concurrently(
+        db_utils, pending_applications(db_utils, handle, name, weekdays(workers), "balance"))
+    balance, _, _ = annual_leave(db_utils, handle)
+    expected = Counter({("Approved", None): allowed, ("Rejected", "insufficient balance"): workers - allowed})
+    if failed or outcomes != expected:
+        failures.append(f"approvals racing for a balance of {allowed}: {dict(outcomes)}, {failed} database error(s)")
+    if balance != 0:
+        failures.append(f"al_balance is {balance} after the racing approvals, expected 0")
+
+    # Restore enough balance for every application, so only the overlap can refuse them
+    restore(db_utils, handle, Decimal(workers))
+    same_day = weekdays(workers + 1)[-1:] * workers
+    failed, outcomes = approve_concurrently(db_utils, pending_applications(db_utils, handle, name, same_day, "overlap"))
+    expected = Counter({("Approved", None): 1, ("Rejected", "overlapping leave"): workers - 1})
+    if failed or outcomes != expected:
+        failures.append(f"approvals racing for one date: {dict(outcomes)}, {failed} database error(s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that concurrent balance changes to one intern are not lost")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent changes per round (the pool holds 20)")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+    failures = []
+
+    with temporary_database() as config, tempfile.TemporaryDirectory() as workdir:
+        export_database_env(config)
+        roster_path = os.path.join(workdir, "interns.csv")
+        # A balance large enough that no deduction is refused
+        handle, approvals_handle = write_active_roster(roster_path, 2, al=10 * args.workers * args.rounds)
+        os.environ["INTERNS_DB"] = roster_path
+        # db_utils creates the schema and imports the roster when first imported
+        import db_utils
+
+        start_balance, start_taken, start_events = annual_leave(db_utils, handle)
+        amount = Decimal("0.5")
+        deductions, restores = args.workers, args.workers // 2
+        for _ in range(args.rounds):
+            failed = run_concurrently(deductions, lambda index: db_utils.update_leave_balance(
+                handle, "al_balance", amount, "al_taken"))
+            failed += run_concurrently(restores, lambda index: restore(db_utils, handle, amount))
+            if failed:
+                failures.append(f"{failed} balance change(s) reported a database error")
+
+        net_changes = args.rounds * (deductions - restores)
+        expected_balance = start_balance - amount * net_changes
+        expected_taken = start_taken + amount * net_changes
+        balance, taken, events = annual_leave(db_utils, handle)
+        events -= start_events
+        if balance != expected_balance:
+            failures.append(f"al_balance is {balance}, expected {expected_balance}: concurrent changes were lost")
+        if taken != expected_taken:
+            failures.append(f"al_taken is {taken}, expected {expected_taken}: concurrent changes were lost")
+        if events != args.rounds * (deductions + restores):
+            failures.append(f"{events} ledger event(s) for {args.rounds * (deductions + restores)} change(s)")
+        check_concurrent_approvals(db_utils, args.workers, approvals_handle, "Bench Intern 000001", failures)
+
+        drifted = db_utils.rebuild_leave_balances()
+        if drifted:
+            failures.append(f"{drifted} intern(s) disagree with the ledger replay")
+
+    print(f"{args.rounds} round(s) of {deductions} concurrent deduction(s) and {restores} restore(s): "
+          f"al_balance {start_balance} -> {balance}, al_taken {start_taken} -> {taken}, {events} ledger event(s)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# benchmarks/load_e2e.py (end-to-end load test of the deployed bot process)
+#
+# Runs intern_bot.py as it is deployed (bot, job queue and web server in one process) against a
+# disposable PostgreSQL database, the fake Bot API in fake_telegram.py and the SMTP sink in
+# smtp_sink.py. Simulated interns apply for leave over Telegram while simulated supervisors click
+# the approval links from the emails the bot sends.
+#
+#   python -m benchmarks.load_e2e --levels 10,25,50,100,200,400
+#
+# For each concurrency level it reports end-to-end latency from injecting an update to the bot's
+# sendMessage, email and approval-click latencies, conversations per second and the bot's CPU use,
+# and stops once throughput no longer grows with concurrency (the saturation point).
+import argparse
+import json
+import os
+import queue
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from benchmarks.fake_telegram import FakeBotAPI
+from benchmarks.local_postgres import export_database_env, temporary_database
+from benchmarks.roster import write_active_roster
+from benchmarks.smtp_sink import SMTPSink, message_text
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPROVE_LINK = re.compile(r"APPROVE:\s*(\S+)")
+ERROR_REPLIES = ("invalid", "cannot", "not registered", "cancelled", "overlap", "try again", "insufficient")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))], 2)
+
+
+def latency_summary(samples):
+    return {"count": len(samples), "p50_ms": percentile(samples, 0.50), "p95_ms": percentile(samples, 0.95),
+            "p99_ms": percentile(samples, 0.99)}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_cpu_seconds(pid):
+    """User plus system CPU time of a process from /proc (None where /proc is unavailable)"""
+    try:
+        with open(f"/proc/{pid}/stat") as handle:
+            fields = handle.read().rpartition(")")[2].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class LoadDriver:
+    """Simulated interns and supervisors talking to one bot process"""
+
+    def __init__(self, api, timeout):
+        self.api = api
+        self.timeout = timeout
+        self.approval_links = {}
+        self._links_lock = threading.Lock()
+        self.leaves_applied = {}
+
+    # Called by the SMTP sink for every email the bot sends
+    def on_email(self, recipients, message, received_at):
+        subject = message.get("Subject", "")
+        match = APPROVE_LINK.search(message_text(message))
+        if match and subject.startswith("Leave Application from ") and "(" not in subject:
+            self._links(subject[len("Leave Application from "):]).put((match.group(1), received_at))
+
+    def _links(self, employee_name):
+        with self._links_lock:
+            return self.approval_links.setdefault(employee_name, queue.Queue())
+
+    def _step(self, user_id, username, text, expected, samples):
+        injected_at = self.api.inject_message(user_id, username, text)
+        reply, sent_at = self.api.wait_for_reply(
+            user_id, lambda reply: expected in reply or any(error in reply.lower() for error in ERROR_REPLIES),
+            timeout=self.timeout
+        )
+        samples.append((sent_at - injected_at) * 1000)
+        if expected not in reply:
+            raise RuntimeError(f"{username}: sent {text!r}, bot replied {reply!r}")
+        return injected_at
+
+    def conversation(self, index, samples):
+        """One intern applies for a one-day Annual Leave and their supervisor approves it from the email"""
+        username = f"bench_intern_{index:06d}"
+        employee_name = f"Bench Intern {index:06d}"
+        user_id = 100000 + index
+        week = self.leaves_applied.get(index, 0) + 1
+        self.leaves_applied[index] = week
+        leave_day = date.today() + timedelta(days=7 - date.today().weekday(), weeks=week)
+        leave_day_text = leave_day.strftime("%d-%m-%Y")
+
+        self._step(user_id, username, "/applyleave", "Please choose the type of leave", samples["reply"])
+        self._step(user_id, username, "Annual Leave", "Please select leave duration type", samples["reply"])
+        self._step(user_id, username, "Full Day", "Please enter the start date", samples["reply"])
+        self._step(user_id, username, leave_day_text, "Please enter the end date", samples["reply"])
+        self._step(user_id, username, leave_day_text, "Do you confirm?", samples["reply"])
+        submitted_at = self._step(user_id, username, "Yes", "has been submitted", samples["reply"])
+
+        link, received_at = self._links(employee_name).get(timeout=self.timeout)
+        samples["email"].append((received_at - submitted_at) * 1000)
+
+        clicked_at = time.perf_counter()
+        try:
+            with urllib.request.urlopen(link, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"{username}: approval link returned {e.code}")
+        samples["click"].append((time.perf_counter() - clicked_at) * 1000)
+        _, notified_at = self.api.wait_for_reply(user_id, lambda reply: "has been approved" in reply, timeout=self.timeout)
+        samples["notification"].append((notified_at - clicked_at) * 1000)
+
+    def run_level(self, concurrency, rounds, bot_pid):
+        samples = {"reply": [], "email": [], "click": [], "notification": []}
+        failures = []
+
+        def intern(index):
+            for _ in range(rounds):
+                try:
+                    self.conversation(index, samples)
+                except Exception as e:
+                    failures.append(str(e))
+                    return
+
+        cpu_before = _process_cpu_seconds(bot_pid)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(intern, range(concurrency)))
+        elapsed = time.perf_counter() - started
+        cpu_after = _process_cpu_seconds(bot_pid)
+
+        completed = concurrency * rounds - len(failures)
+        return {
+            "concurrency": concurrency,
+            "conversations": completed,
+            "failures": len(failures),
+            "failure_examples": failures[:3],
+            "elapsed_s": round(elapsed, 2),
+            "conversations_per_s": round(completed / elapsed, 2),
+            "bot_cpu_percent": round(100 * (cpu_after - cpu_before) / elapsed, 1) if cpu_before is not None else None,
+            "update_to_reply": latency_summary(samples["reply"]),
+            "submit_to_email": latency_summary(samples["email"]),
+            "approval_click": latency_summary(samples["click"]),
+            "click_to_notification": latency_summary(samples["notification"]),
+        }
+
+
+def start_bot(env, log_path):
+    log = open(log_path, "w")
+    process = subprocess.Popen([sys.executable, "intern_bot.py"], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, log
+
+
+def print_level(result):
+    reply = result["update_to_reply"]
+    click = result["approval_click"]
+    print(f"{result['concurrency']:>6} interns {result['conversations_per_s']:>8} conv/s  "
+          f"reply p50/p95/p99 {reply['p50_ms']}/{reply['p95_ms']}/{reply['p99_ms']} ms  "
+          f"click p95 {click['p95_ms']} ms  cpu {result['bot_cpu_percent']}%  failures {result['failures']}")
+    for example in result["failure_examples"]:
+        print(f"        {example}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end load test of the bot process")
+    parser.add_argument("--levels", default="10,25,50,100,200,400", help="comma-separated concurrent intern counts")
+    parser.add_argument("--rounds", type=int, default=2, help="conversations per intern at each level")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for any single reply or email")
+    parser.add_argument("--saturation-gain", type=float, default=0.10,
+                        help="throughput growth below this fraction between levels counts as saturated")
+    parser.add_argument("--keep-going", action="store_true", help="run every level even after saturation")
+    parser.add_argument("--json-out", help="write all level results to this file")
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.levels.split(",")]
+
+    api = FakeBotAPI().start()
+    driver = LoadDriver(api, args.timeout)
+    sink = SMTPSink(driver.on_email).start()
+    results = []
+    saturated_at = None
+
+    with temporary_database() as config, tempfile.TemporaryDirectory() as workdir:
+        export_database_env(config)
+        roster_path = os.path.join(workdir, "interns.csv")
+        # One-day leaves, one week apart, so no intern runs out of balance or overlaps themselves
+        write_active_roster(roster_path, max(levels), al=len(levels) * args.rounds + 14)
+        web_port = _free_port()
+        env = dict(
+            os.environ,
+            INTERNS_DB=roster_path,
+            BOT_TOKEN="123456:bench",
+            BOT_API_BASE_URL=api.base_url,
+            SMTP_HOST=sink.host,
+            SMTP_PORT=str(sink.port),
+            SMTP_STARTTLS="false",
+            SENDER_EMAIL="leave-bot@example.com",
+            SENDER_PASSWORD="",
+            PORT=str(web_port),
+            PUBLIC_BASE_URL=f"http://127.0.0.1:{web_port}",
+            LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+        )
+        log_path = os.path.join(workdir, "bot.log")
+        process, log = start_bot(env, log_path)
+        try:
+            if not api.polling.wait(120) or process.poll() is not None:
+                raise RuntimeError(f"bot did not start polling; log follows\n{open(log_path).read()}")
+            best = 0.0
+            for concurrency in levels:
+                result = driver.run_level(concurrency, args.rounds, process.pid)
+                results.append(result)
+                print_level(result)
+                if saturated_at is None and best and result["conversations_per_s"] < best * (1 + args.saturation_gain):
+                    saturated_at = results[-2]["concurrency"] if len(results) > 1 else concurrency
+                    print(f"Throughput stopped growing past {saturated_at} concurrent interns "
+                          f"({best} conversations/s)")
+                    if not args.keep_going:
+                        break
+                best = max(best, result["conversations_per_s"])
+        finally:
+            process.terminate()
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+            sink.stop()
+            api.stop()
+
+    if saturated_at is None:
+        print("No saturation within the tested levels; try higher --levels")
+    if args.json_out:
+        with open(args.json_out, "w") as handle:
+            json.dump({"levels": results, "saturated_at": saturated_at, "bot_api_calls": api.calls}, handle, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# benchmarks/local_postgres.py (throwaway PostgreSQL databases for the benchmark harnesses)
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import psycopg2
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _pg_bin(name):
+    """Locate a PostgreSQL server binary (PG_BIN overrides the PATH lookup)"""
+    if os.getenv("PG_BIN"):
+        return os.path.join(os.getenv("PG_BIN"), name)
+    found = shutil.which(name)
+    if not found:
+        raise RuntimeError(f"{name} not found; install PostgreSQL, set PG_BIN, or point BENCH_DB_HOST at a server")
+    return found
+
+
+@contextmanager
+def temporary_cluster(extra_settings=None):
+    """Start a PostgreSQL cluster in a temporary directory and yield its connection settings.
+
+    The cluster trusts local connections, runs with fsync off and is deleted on exit.
+    """
+    data_dir = tempfile.mkdtemp(prefix="leavebot_pg_")
+    port = _free_port()
+    settings = {"listen_addresses": "127.0.0.1", "fsync": "off", "max_connections": "200"}
+    settings.update(extra_settings or {})
+    options = " ".join(f"-c {key}={value}" for key, value in settings.items())
+    try:
+        subprocess.run([_pg_bin("initdb"), "-D", data_dir, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([_pg_bin("pg_ctl"), "-D", data_dir, "-l", os.path.join(data_dir, "server.log"), "-w",
+                        "-o", f"-p {port} -k {data_dir} {options}", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+        yield {
+            "host": "127.0.0.1",
+            "port": str(port),
+            "database": "postgres",
+            "user": "postgres",
+            "password": "",
+            "data_dir": data_dir,
+        }
+    finally:
+        subprocess.run([_pg_bin("pg_ctl"), "-D", data_dir, "-m", "immediate", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@contextmanager
+def temporary_replica(primary):
+    """Start a streaming replica of a temporary_cluster() primary and yield its connection settings.
+
+    The replica is cloned with pg_basebackup -R (the primary's default pg_hba trusts local replication
+    connections) and serves read-only queries as a hot standby; it is deleted on exit.
+    """
+    data_dir = tempfile.mkdtemp(prefix="leavebot_pg_replica_")
+    port = _free_port()
+    try:
+        subprocess.run([_pg_bin("pg_basebackup"), "-h", primary["host"], "-p", str(primary["port"]), "-U", primary["user"],
+                        "-D", data_dir, "-R", "-X", "stream"], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([_pg_bin("pg_ctl"), "-D", data_dir, "-l", os.path.join(data_dir, "server.log"), "-w",
+                        "-o", f"-p {port} -k {data_dir} -c hot_standby=on", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+        yield dict(primary, port=str(port), data_dir=data_dir)
+    finally:
+        subprocess.run([_pg_bin("pg_ctl"), "-D", data_dir, "-m", "immediate", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@contextmanager
+def temporary_database():
+    """Yield settings for a disposable database.
+
+    With BENCH_DB_HOST set, a uniquely named database is created on that server (BENCH_DB_PORT,
+    BENCH_DB_USER, BENCH_DB_PASSWORD) and dropped afterwards; otherwise a temporary cluster is started.
+    """
+    if not os.getenv("BENCH_DB_HOST"):
+        with temporary_cluster() as config:
+            yield config
+        return
+
+    server = {
+        "host": os.getenv("BENCH_DB_HOST"),
+        "port": os.getenv("BENCH_DB_PORT", "5432"),
+        "user": os.getenv("BENCH_DB_USER", "postgres"),
+        "password": os.getenv("BENCH_DB_PASSWORD", ""),
+    }
+    database = f"leavebot_bench_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(dbname="postgres", **server)
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cursor:
+            cursor.execute(f'CREATE DATABASE "{database}"')
+        yield dict(server, database=database)
+    finally:
+        with admin.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)')
+        admin.close()
+
+
+def export_database_env(config):
+    """Point db_utils at the given database (it reads DB_* when it is first imported)"""
+    os.environ["DB_HOST"] = config["host"]
+    os.environ["DB_PORT"] = str(config["port"])
+    os.environ["DB_NAME"] = config["database"]
+    os.environ["DB_USER"] = config["user"]
+    os.environ["DB_PASSWORD"] = config["password"]
+
+
+def export_replica_env(config):
+    """Point db_utils' read pool at the given replica"""
+    os.environ["DB_REPLICA_DSN"] = (f"host={config['host']} port={config['port']} dbname={config['database']} "
+                                    f"user={config['user']} password={config['password']}")
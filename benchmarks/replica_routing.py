@@ -0,0 +1,119 @@
+# benchmarks/replica_routing.py (read/write routing against a primary and a streaming replica)
+#
+# Starts two local PostgreSQL instances, a primary and a pg_basebackup replica of it, points db_utils at
+# both (DB_* and DB_REPLICA_DSN) and checks that:
+#   - read-only lookups are served by the replica,
+#   - a user who just submitted a leave reads from the primary for READ_YOUR_WRITES_SECONDS,
+#   - reads fall back to the primary while the replica lags past REPLICA_MAX_LAG_SECONDS.
+# It also reports the replica's measured lag and how long a committed write takes to become visible on it.
+#
+#   python -m benchmarks.replica_routing --interns 200 --reads 2000
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from benchmarks.local_postgres import export_database_env, export_replica_env, temporary_cluster, temporary_replica
+from benchmarks.roster import write_active_roster
+
+
+def timed_reads(db_utils, handles, reads, primary=False):
+    started = time.perf_counter()
+    for index in range(reads):
+        db_utils.get_intern_by_telegram(handles[index % len(handles)], primary=primary)
+    return round(reads / (time.perf_counter() - started), 1)
+
+
+def served_by_replica(db_utils, telegram_handle=None):
+    conn = db_utils.get_read_connection(telegram_handle)
+    try:
+        return isinstance(conn, db_utils.ReplicaConnection)
+    finally:
+        db_utils.release_connection(conn)
+
+
+def replication_delay_ms(db_utils, handle, timeout=10.0):
+    """Time from committing a leave on the primary until the replica returns it"""
+    application_id = f"replica_probe_{uuid.uuid4().hex[:8]}"
+    leave_day = date.today() + timedelta(days=400)
+    employee_name = db_utils.get_intern_by_telegram(handle, primary=True)["name"]
+    db_utils.save_leave_application({
+        "id": application_id, "employee_name": employee_name, "submission_time": datetime.now(), "decision_time": None,
+        "leave_type": "No Pay Leave", "start_date": leave_day, "end_date": leave_day, "leave_duration": 1,
+        "day_portion": "Full Day", "status": "Pending", "remarks": "", "username": handle,
+    })
+    committed_at = time.perf_counter()
+    conn = db_utils.replica_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        while time.perf_counter() - committed_at < timeout:
+            cursor.execute("SELECT 1 FROM leave_logs_new WHERE application_id = %s", (application_id,))
+            found = cursor.fetchone()
+            conn.rollback()
+            if found:
+                return round((time.perf_counter() - committed_at) * 1000, 1)
+            time.sleep(0.005)
+        return None
+    finally:
+        db_utils.replica_pool.putconn(conn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check read/write routing against a primary and a replica")
+    parser.add_argument("--interns", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=2000, help="intern lookups timed on each server")
+    args = parser.parse_args(argv)
+    failures = []
+
+    with temporary_cluster({"wal_level": "replica"}) as primary, temporary_replica(primary) as replica, \
+            tempfile.TemporaryDirectory() as workdir:
+        export_database_env(primary)
+        export_replica_env(replica)
+        roster_path = os.path.join(workdir, "interns.csv")
+        handles = write_active_roster(roster_path, args.interns)
+        os.environ["INTERNS_DB"] = roster_path
+        os.environ["READ_YOUR_WRITES_SECONDS"] = "2"
+        # db_utils creates the schema and imports the roster on the primary when first imported
+        import db_utils
+
+        # The replica has to catch up with the import before it may serve reads
+        db_utils.init_replica_pool()
+        deadline = time.time() + 30
+        while (db_utils.measure_replica_lag() or {}).get("lag_seconds", float("inf")) > 0 and time.time() < deadline:
+            time.sleep(0.1)
+
+        if not served_by_replica(db_utils):
+            failures.append("plain reads were not sent to the replica")
+        replica_rate = timed_reads(db_utils, handles, args.reads)
+        primary_rate = timed_reads(db_utils, handles, args.reads, primary=True)
+
+        writer, bystander = handles[0], handles[1]
+        delay = replication_delay_ms(db_utils, writer)
+        if served_by_replica(db_utils, writer):
+            failures.append("reads right after a write were not kept on the primary")
+        if not served_by_replica(db_utils, bystander):
+            failures.append("another user's reads were pinned to the primary")
+        time.sleep(db_utils.READ_YOUR_WRITES_SECONDS + 0.1)
+        if not served_by_replica(db_utils, writer):
+            failures.append("reads did not return to the replica after READ_YOUR_WRITES_SECONDS")
+        lag = db_utils.measure_replica_lag()
+
+        # Simulate a lagging replica until the next measurement
+        db_utils.replica_lag_seconds = db_utils.REPLICA_MAX_LAG_SECONDS + 1
+        if served_by_replica(db_utils, bystander):
+            failures.append("reads were sent to a replica lagging past REPLICA_MAX_LAG_SECONDS")
+
+    print(f"intern lookups: replica {replica_rate}/s, primary {primary_rate}/s")
+    print(f"replica lag {lag['lag_seconds'] if lag else 'unknown'} s "
+          f"(receive {lag['receive_lsn'] if lag else '-'}, replay {lag['replay_lsn'] if lag else '-'}); "
+          f"write visible on replica after {delay} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# benchmarks/roster.py (synthetic intern rosters in the interns_new.csv column layout)
+import csv
+import random
+from datetime import date, timedelta
+
+ROSTER_COLUMNS = [
+    "Name of Intern", "Telegram Handle", "Start Date", "End Date", "Supervisor Email",
+    "Bal Vacation Leave Taken", "Bal Medical Leave", "Balance OIL Taken",
+]
+
+
+def roster_date(value):
+    """Dates in the roster CSV look like 05-Jan-25"""
+    return value.strftime("%d-%b-%y")
+
+
+def intern_row(index, start_date, end_date, supervisors=10, al=14, mc=14, oil=2):
+    return {
+        "Name of Intern": f"Bench Intern {index:06d}",
+        "Telegram Handle": f"bench_intern_{index:06d}",
+        "Start Date": roster_date(start_date),
+        "End Date": roster_date(end_date),
+        "Supervisor Email": f"supervisor{index % supervisors:03d}@example.com",
+        "Bal Vacation Leave Taken": al,
+        "Bal Medical Leave": mc,
+        "Balance OIL Taken": oil,
+    }
+
+
+def write_active_roster(path, interns, supervisors=10, al=14):
+    """Write a roster of interns whose internships are running now and for the next two years"""
+    start_date = date.today() - timedelta(days=30)
+    end_date = date.today() + timedelta(days=730)
+    with open(path, "w", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=ROSTER_COLUMNS)
+        writer.writeheader()
+        for index in range(interns):
+            writer.writerow(intern_row(index, start_date, end_date, supervisors=supervisors, al=al))
+    return [f"bench_intern_{index:06d}" for index in range(interns)]
+
+
+def write_roster(path, rows, duplicate_ratio=0.0, returning_ratio=0.0, completed_ratio=0.0, supervisors=50, seed=0):
+    """Write a roster of exactly `rows` rows with a controlled mix of the cases the import distinguishes.
+
+    duplicate_ratio   rows repeated verbatim (skipped by the import)
+    returning_ratio   interns listed again for a second internship after their first one
+    completed_ratio   first internships that have already ended
+    The remaining rows are distinct interns. Returns a summary of what was written.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    duplicates = int(rows * duplicate_ratio)
+    returning = int(rows * returning_ratio)
+    distinct = rows - duplicates - returning
+    if distinct <= 0 or returning > distinct:
+        raise ValueError("ratios leave too few distinct interns for the requested duplicates and returning interns")
+
+    first_rows = []
+    for index in range(distinct):
+        if rng.random() < completed_ratio:
+            start_date = today - timedelta(days=rng.randint(200, 900))
+            end_date = start_date + timedelta(days=rng.randint(60, 180))
+        else:
+            start_date = today - timedelta(days=rng.randint(0, 150))
+            end_date = today + timedelta(days=rng.randint(30, 365))
+        first_rows.append((index, start_date, end_date))
+
+    extra_rows = []
+    for index, start_date, end_date in rng.sample(first_rows, returning):
+        second_start = max(end_date, today) + timedelta(days=rng.randint(14, 120))
+        extra_rows.append(intern_row(index, second_start, second_start + timedelta(days=rng.randint(60, 180)), supervisors))
+    written = [intern_row(index, start_date, end_date, supervisors) for index, start_date, end_date in first_rows]
+    extra_rows.extend(dict(row) for row in rng.choices(written, k=duplicates))
+    rng.shuffle(extra_rows)
+
+    with open(path, "w", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=ROSTER_COLUMNS)
+        writer.writeheader()
+        writer.writerows(written)
+        writer.writerows(extra_rows)
+
+    return {
+        "rows": rows,
+        "distinct_interns": distinct,
+        "duplicates": duplicates,
+        "returning": returning,
+        "completed": sum(1 for _, _, end_date in first_rows if end_date < today),
+    }
@@ -1,12 +1,22 @@
 # db_pool.py (revised for establishing PostgreSQL connection via pgAdmin)
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import pool
-from datetime import datetime, date
+from psycopg2.extras import execute_values, Json
+from datetime import datetime, date, timedelta
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import pandas as pd
+import logging
+from collections import namedtuple
+from types import MappingProxyType
+from single_flight import SingleFlight
 
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -22,12 +32,12 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT")
 }
 
-# Initialize the connection pool
+# Initialize the connection pool (thread-safe: the web server thread shares it with the bot)
 def init_db_pool():
     global connection_pool
     if connection_pool is None:
         try:
-            connection_pool = psycopg2.pool.SimpleConnectionPool(
+            connection_pool = psycopg2.pool.ThreadedConnectionPool(
                 1, 20,
                 host=DB_CONFIG["host"],
                 database=DB_CONFIG["database"],
@@ -35,9 +45,9 @@ def init_db_pool():
                 password=DB_CONFIG["password"],
                 port=DB_CONFIG["port"]
             )
-            print("Database connection pool initialized.")
+            logger.info("Database connection pool initialized.")
         except Exception as e:
-            print(f"Failed to initialize database pool: {e}")
+            logger.error("Failed to initialize database pool: %s", e)
     return connection_pool
 
 def get_connection():
@@ -46,9 +56,136 @@ def get_connection():
     return connection_pool.getconn()
 
 def release_connection(conn):
-    if connection_pool:
+    if isinstance(conn, ReplicaConnection):
+        if replica_pool:
+            replica_pool.putconn(conn)
+    elif connection_pool:
         connection_pool.putconn(conn)
 
+# Read replica configuration from environment variables
+#   DB_REPLICA_DSN            libpq connection string of a streaming replica; unset sends every read to the primary
+#   READ_YOUR_WRITES_SECONDS  how long a user's reads stay on the primary after they submit, cancel or are decided (30)
+#   REPLICA_MAX_LAG_SECONDS   reads go to the primary while the replica is further behind than this (10)
+DB_REPLICA_DSN = os.getenv("DB_REPLICA_DSN")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 30))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 10))
+
+replica_pool = None
+# Last measured replay lag of the replica in seconds (infinite while it cannot be reached)
+replica_lag_seconds = None
+_replica_lag_measured_at = 0.0
+# Reads re-measure the lag once it is older than this, so processes without the bot's lag job stay current
+REPLICA_LAG_CHECK_SECONDS = 30
+_recent_writes = {}
+_recent_writes_lock = threading.Lock()
+
+class ReplicaConnection(psycopg2.extensions.connection):
+    """Connection handed out by the replica pool, so release_connection returns it to that pool"""
+
+# Initialize the replica pool; its connections are read-only sessions
+def init_replica_pool():
+    global replica_pool
+    if replica_pool is None and DB_REPLICA_DSN:
+        try:
+            replica_pool = psycopg2.pool.ThreadedConnectionPool(
+                1, 20, DB_REPLICA_DSN, connection_factory=ReplicaConnection, options="-c default_transaction_read_only=on"
+            )
+            logger.info("Replica connection pool initialized.")
+            measure_replica_lag()
+        except Exception as e:
+            logger.error("Failed to initialize replica pool: %s", e)
+    return replica_pool
+
+# In-memory table of current interns' profiles, installed by the bot (see intern_cache.py); None reads the database
+intern_cache = None
+
+# This function installs the cache get_intern_by_telegram answers from
+def set_intern_cache(cache):
+    global intern_cache
+    intern_cache = cache
+
+# Concurrent identical per-user reads (an intern tapping quickly, a supervisor link and the auto-approval job
+# landing together) share one query; see lookup_coalescing_stats()
+_lookups = SingleFlight()
+
+# This function returns the queries run and the duplicates suppressed per coalesced lookup since the last reset
+def lookup_coalescing_stats(reset=False):
+    return _lookups.stats(reset)
+
+# This function makes a user's next reads start new queries instead of joining ones that began before their write
+def _forget_lookups(telegram_handle):
+    for key in (('get_intern_by_telegram', telegram_handle, False), ('get_intern_by_telegram', telegram_handle, True),
+                ('get_approved_leaves', telegram_handle)):
+        _lookups.forget(key)
+
+# This function records that a user's data just changed on the primary, so their next reads see it
+# (the intern cache drops its copy until the change notification reloads it)
+def mark_recent_write(telegram_handle):
+    if intern_cache is not None and telegram_handle:
+        intern_cache.discard(telegram_handle)
+    if telegram_handle:
+        _forget_lookups(telegram_handle)
+    if not DB_REPLICA_DSN or not telegram_handle:
+        return
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[telegram_handle] = now
+        if len(_recent_writes) > 1000:
+            for handle, written_at in list(_recent_writes.items()):
+                if now - written_at > READ_YOUR_WRITES_SECONDS:
+                    del _recent_writes[handle]
+
+def _wrote_recently(telegram_handle):
+    with _recent_writes_lock:
+        written_at = _recent_writes.get(telegram_handle)
+    return written_at is not None and time.monotonic() - written_at <= READ_YOUR_WRITES_SECONDS
+
+# This function gets a connection for a read-only lookup: the replica when one is configured and caught up,
+# the primary for a user who wrote within READ_YOUR_WRITES_SECONDS or when the replica is lagging or down
+def get_read_connection(telegram_handle=None):
+    if DB_REPLICA_DSN and not (telegram_handle and _wrote_recently(telegram_handle)):
+        pool = init_replica_pool()
+        if pool and time.monotonic() - _replica_lag_measured_at > REPLICA_LAG_CHECK_SECONDS:
+            measure_replica_lag()
+        if pool and replica_lag_seconds is not None and replica_lag_seconds <= REPLICA_MAX_LAG_SECONDS:
+            try:
+                return pool.getconn()
+            except Exception as e:
+                logger.warning("Replica unavailable, reading from the primary: %s", e)
+    return get_connection()
+
+# This function measures how far the replica's replay is behind and stores it for get_read_connection
+# Returns {'lag_seconds': ..., 'receive_lsn': ..., 'replay_lsn': ...}, or None without a reachable replica
+def measure_replica_lag():
+    global replica_lag_seconds, _replica_lag_measured_at
+    if not DB_REPLICA_DSN or replica_pool is None:
+        return None
+    _replica_lag_measured_at = time.monotonic()
+    conn = None
+    try:
+        conn = replica_pool.getconn()
+        cursor = conn.cursor()
+        # An idle primary writes no transactions to replay, so a replica that has replayed everything it
+        # received counts as caught up rather than as old as the last replayed transaction
+        cursor.execute("""
+            SELECT CASE
+                       WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                       ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                   END,
+                   pg_last_wal_receive_lsn()::text, pg_last_wal_replay_lsn()::text
+        """)
+        lag_seconds, receive_lsn, replay_lsn = cursor.fetchone()
+        conn.rollback()
+        replica_lag_seconds = float(lag_seconds)
+        return {'lag_seconds': replica_lag_seconds, 'receive_lsn': receive_lsn, 'replay_lsn': replay_lsn}
+    except Exception as e:
+        replica_lag_seconds = float('inf')
+        logger.error("Failed to measure replica lag: %s", e)
+        return None
+    finally:
+        if conn:
+            replica_pool.putconn(conn)
+
 def adapt_date(date_obj):
     if isinstance(date_obj, date):
         return date_obj
@@ -80,7 +217,7 @@ def create_interns_table_from_csv(csv_file_path):
         table_exists = cursor.fetchone()[0]
 
         if not table_exists:
-            print("Creating 'interns_new' table as it doesn't exist.")
+            logger.info("Creating 'interns_new' table as it doesn't exist.")
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS interns_new (
                     id SERIAL PRIMARY KEY,
@@ -107,7 +244,10 @@ def create_interns_table_from_csv(csv_file_path):
                 )
             """)
         else:
-            print("Table 'interns_new' already exists, proceeding to import data.")
+            logger.info("Table 'interns_new' already exists, proceeding to import data.")
+
+        # Team lookups (availability calendar, rollups) filter interns by supervisor
+        cursor.execute("CREATE INDEX IF NOT EXISTS interns_new_supervisor_idx ON interns_new (supervisor_email, status)")
 
         cursor.execute("""
             UPDATE interns_new
@@ -116,7 +256,7 @@ def create_interns_table_from_csv(csv_file_path):
             AND status = 'Active'
         """)
         conn.commit()
-        print("Updated status to 'Completed' for interns whose end date has passed.")
+        logger.info("Updated status to 'Completed' for interns whose end date has passed.")
 
         # Have to edit the CSV file to match the expected column names in case of any changes
         mappings = {
@@ -149,7 +289,7 @@ def create_interns_table_from_csv(csv_file_path):
 
             intern_key = f"{telegram_handle}_{start_date}_{end_date}"
             if intern_key in processed_interns:
-                print(f"Skipping duplicate entry in CSV for {telegram_handle} ({start_date} to {end_date})")
+                logger.debug("Skipping duplicate entry in CSV for %s (%s to %s)", telegram_handle, start_date, end_date)
                 continue
 
             processed_interns.add(intern_key)
@@ -174,7 +314,8 @@ def create_interns_table_from_csv(csv_file_path):
 
             # Check if the intern already exists with the same telegram handle and dates
             cursor.execute("""
-                SELECT id, al_taken, mc_taken, compassionate_taken, oil_taken, status
+                SELECT id, al_taken, mc_taken, compassionate_taken, oil_taken, status,
+                       al_balance, mc_balance, compassionate_balance, oil_balance
                 FROM interns_new 
                 WHERE telegram_handle = %s
                 AND start_date = %s
@@ -199,7 +340,7 @@ def create_interns_table_from_csv(csv_file_path):
                 oil_balance = oil_entitlement - oil_taken
 
                 
-                print(f"Updating exact match record for {telegram_handle} ({start_date} to {end_date})")
+                logger.debug("Updating exact match record for %s (%s to %s)", telegram_handle, start_date, end_date)
                 cursor.execute("""
                     UPDATE interns_new
                     SET name = %s,
@@ -228,6 +369,12 @@ def create_interns_table_from_csv(csv_file_path):
                     current_status,
                     intern_id
                 ))
+                _record_balance_events(cursor, intern_id, telegram_handle, 'adjust', {
+                    'al_balance': al_balance - float(exact_match[6] or 0),
+                    'mc_balance': mc_balance - float(exact_match[7] or 0),
+                    'compassionate_balance': compassionate_balance - float(exact_match[8] or 0),
+                    'oil_balance': oil_balance - float(exact_match[9] or 0)
+                })
             else:
                 if current_status == 'Completed':
                     cursor.execute("""
@@ -241,11 +388,12 @@ def create_interns_table_from_csv(csv_file_path):
 
                     duplicate_count = cursor.fetchone()[0]
                     if duplicate_count > 0:
-                        print(f"Skipping duplicate completed internship for {telegram_handle} ({start_date} to {end_date})")
+                        logger.debug("Skipping duplicate completed internship for %s (%s to %s)", telegram_handle, start_date, end_date)
                         continue
 
                 cursor.execute("""
-                    SELECT id, al_taken, mc_taken, compassionate_taken, oil_taken, status, start_date, end_date
+                    SELECT id, al_taken, mc_taken, compassionate_taken, oil_taken, status, start_date, end_date,
+                           al_balance, mc_balance, compassionate_balance, oil_balance
                     FROM interns_new 
                     WHERE telegram_handle = %s
                     ORDER BY status = 'Active' DESC, id DESC
@@ -267,7 +415,7 @@ def create_interns_table_from_csv(csv_file_path):
                     # Calculate oil balance
                     oil_balance = oil_entitlement - oil_taken
 
-                    print(f"Updating existing active record for {telegram_handle}")
+                    logger.debug("Updating existing active record for %s", telegram_handle)
                     cursor.execute("""
                         UPDATE interns_new
                         SET name = %s,
@@ -300,6 +448,12 @@ def create_interns_table_from_csv(csv_file_path):
                         current_status,
                         intern_id
                     ))
+                    _record_balance_events(cursor, intern_id, telegram_handle, 'adjust', {
+                        'al_balance': al_balance - float(existing_intern[8] or 0),
+                        'mc_balance': mc_balance - float(existing_intern[9] or 0),
+                        'compassionate_balance': compassionate_balance - float(existing_intern[10] or 0),
+                        'oil_balance': oil_balance - float(existing_intern[11] or 0)
+                    })
 
                 else:
                     # For new records, taken values are 0 by default
@@ -309,7 +463,7 @@ def create_interns_table_from_csv(csv_file_path):
                     oil_balance = oil_entitlement  # Added oil_balance for new records
 
                     if current_status == 'Completed':
-                        print(f"Creating new completed record for {telegram_handle} ({start_date} to {end_date})")
+                        logger.debug("Creating new completed record for %s (%s to %s)", telegram_handle, start_date, end_date)
 
                     cursor.execute("""
                         INSERT INTO interns_new (
@@ -328,6 +482,7 @@ def create_interns_table_from_csv(csv_file_path):
                             oil_balance,
                             status
                         ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        RETURNING id
                     """, (
                         row[mappings['name']].strip(),
                         telegram_handle,
@@ -344,335 +499,2506 @@ def create_interns_table_from_csv(csv_file_path):
                         oil_balance,
                         current_status
                     ))
+                    _record_balance_events(cursor, cursor.fetchone()[0], telegram_handle, 'grant', {
+                        'al_balance': al_balance,
+                        'mc_balance': mc_balance,
+                        'compassionate_balance': compassionate_balance,
+                        'oil_balance': oil_balance
+                    })
+
+        # Balances were recomputed above, so rebuild the per-supervisor entitlement rollup in the same transaction
+        cursor.execute("SELECT to_regclass('entitlement_rollup') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            cursor.execute("DELETE FROM entitlement_rollup")
+            cursor.execute(f"""
+                INSERT INTO entitlement_rollup (supervisor_email, interns, al_balance, mc_balance, compassionate_balance, oil_balance)
+                {EXPECTED_ENTITLEMENT_SQL}
+            """)
 
         conn.commit()
-        print(f"Successfully processed intern data from {csv_file_path}")
+        logger.info("Successfully processed intern data from %s", csv_file_path)
         return True
 
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Database error: {e}")
+        logger.error("Database error: %s", e)
+        return False
+
+# leave_logs_new is partitioned by year of start_date (leave_logs_y<year>), so queries filtering on dates only
+# touch the current partitions and old years can be detached and archived (see leave_archive.py).
+# The primary key has to include the partition key, hence (application_id, start_date).
+LEAVE_LOG_COLUMNS = (
+    'application_id', 'name', 'submission_date', 'supervisor_review', 'leave_type', 'start_date', 'end_date',
+    'number_of_leaves_taken', 'day_portion', 'status', 'remarks', 'telegram_handle', 'chat_id', 'supervisor_email',
+    'balance_type', 'taken_type'
+)
+LEAVE_LOG_PARTITION_PREFIX = 'leave_logs_y'
+# Years of partitions kept ready beyond the current one, so applications for next year always have a partition
+LEAVE_LOG_PARTITIONS_AHEAD = 2
+
+# This function creates the partition of leave_logs_new holding leaves that start in the given year, with its
+# own overlap constraint: PostgreSQL cannot enforce an exclusion constraint across partitions, so approved leaves
+# are kept from overlapping within a year here and across years by the application's overlap checks
+def _create_leave_log_partition(cursor, year, with_constraint=True):
+    partition = f"{LEAVE_LOG_PARTITION_PREFIX}{int(year)}"
+    cursor.execute("SELECT to_regclass(%s) IS NULL", (partition,))
+    if not cursor.fetchone()[0]:
         return False
+    cursor.execute(f"""
+        CREATE TABLE {partition} PARTITION OF leave_logs_new
+        FOR VALUES FROM ('{int(year)}-01-01') TO ('{int(year) + 1}-01-01')
+    """)
+    if with_constraint:
+        _add_leave_log_overlap_constraint(cursor, partition)
+    logger.info("Created leave log partition %s", partition)
+    return True
+
+# The part of the calendar a leave occupies, at half-day resolution: a full day takes the whole day, a morning
+# the first twelve hours and an afternoon the last twelve, so an AM and a PM leave on the same date do not
+# overlap while either of them overlaps a full day. Used by the overlap constraint, its index and the probes
+LEAVE_SLOT_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION leave_slot(start_date DATE, end_date DATE, day_portion TEXT) RETURNS TSRANGE
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT tsrange(
+            start_date + CASE WHEN day_portion = 'Half Day (PM)' THEN interval '12 hours' ELSE interval '0 hours' END,
+            end_date + CASE WHEN day_portion = 'Half Day (AM)' THEN interval '12 hours' ELSE interval '1 day' END,
+            '[)'
+        )
+    $$
+"""
+
+# This function adds the no-overlap constraint to one partition, replacing an older one of the same name;
+# a partition whose approved leaves already overlap keeps working without it (as the unpartitioned table did)
+# and a warning is logged
+def _add_leave_log_overlap_constraint(cursor, partition):
+    cursor.execute("SAVEPOINT leave_log_overlap")
+    try:
+        cursor.execute(f"""
+            ALTER TABLE {partition}
+            DROP CONSTRAINT IF EXISTS {partition}_no_overlap,
+            ADD CONSTRAINT {partition}_no_overlap
+            EXCLUDE USING gist (name WITH =, leave_slot(start_date, end_date, day_portion) WITH &&)
+            WHERE (status IN ('Approved', 'Auto-Approved'))
+        """)
+        cursor.execute("RELEASE SAVEPOINT leave_log_overlap")
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT leave_log_overlap")
+        logger.warning("Could not add overlap constraint to %s (existing approved leaves overlap?): %s", partition, e)
+
+# This function moves the rows of an unpartitioned leave_logs_new into the partitioned layout in one transaction.
+# The old table is kept as leave_logs_legacy (with its indexes renamed) and can be dropped once checked.
+def _migrate_leave_logs_to_partitions(cursor):
+    cursor.execute("ALTER TABLE leave_logs_new RENAME TO leave_logs_legacy")
+    for suffix in ('pkey', 'open_period_idx', 'no_overlap'):
+        cursor.execute(f"ALTER INDEX IF EXISTS leave_logs_new_{suffix} RENAME TO leave_logs_legacy_{suffix}")
+    # Tables from before these columns existed get them empty, so the copy below has every column
+    cursor.execute("""
+        ALTER TABLE leave_logs_legacy
+        ADD COLUMN IF NOT EXISTS telegram_handle VARCHAR(100),
+        ADD COLUMN IF NOT EXISTS chat_id BIGINT,
+        ADD COLUMN IF NOT EXISTS supervisor_email VARCHAR(255),
+        ADD COLUMN IF NOT EXISTS balance_type VARCHAR(50),
+        ADD COLUMN IF NOT EXISTS taken_type VARCHAR(50)
+    """)
 
-# This function creates a new table for leave logs if it doesn't exist
+    cursor.execute(CREATE_LEAVE_LOGS_SQL)
+    cursor.execute("SELECT DISTINCT EXTRACT(YEAR FROM start_date)::int FROM leave_logs_legacy")
+    years = [row[0] for row in cursor.fetchall()]
+    for year in years:
+        _create_leave_log_partition(cursor, year, with_constraint=False)
+
+    columns = ", ".join(LEAVE_LOG_COLUMNS)
+    cursor.execute(f"INSERT INTO leave_logs_new ({columns}) SELECT {columns} FROM leave_logs_legacy")
+    logger.info("Moved %s leave application(s) into the partitioned leave_logs_new; the old table is kept as "
+                "leave_logs_legacy", cursor.rowcount)
+    for year in years:
+        _add_leave_log_overlap_constraint(cursor, f"{LEAVE_LOG_PARTITION_PREFIX}{year}")
+
+CREATE_LEAVE_LOGS_SQL = """
+    CREATE TABLE IF NOT EXISTS leave_logs_new (
+        application_id VARCHAR(100) NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        submission_date TIMESTAMP NOT NULL,
+        supervisor_review TIMESTAMP,
+        leave_type VARCHAR(50) NOT NULL,
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        number_of_leaves_taken NUMERIC(5,1) NOT NULL,
+        day_portion VARCHAR(50) NOT NULL,
+        status VARCHAR(50) NOT NULL,
+        remarks TEXT,
+        -- Everything a web worker needs to apply a decision from the database alone
+        telegram_handle VARCHAR(100),
+        chat_id BIGINT,
+        supervisor_email VARCHAR(255),
+        balance_type VARCHAR(50),
+        taken_type VARCHAR(50),
+        -- Leave period as a daterange with a GiST index, so overlap checks are a single index probe
+        leave_period DATERANGE GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED,
+        PRIMARY KEY (application_id, start_date)
+    ) PARTITION BY RANGE (start_date)
+"""
+
+# This function creates a new table for leave logs if it doesn't exist, migrating an unpartitioned one
 def create_leave_logs_new():
     conn = None
     try:
         conn = get_connection()
         if conn is None:
-            print("Failed to get DB connection.")
+            logger.error("Failed to get DB connection.")
             return False
         
         cursor = conn.cursor()
-        print("Connected to database, creating leave_logs_new table...")
+        logger.info("Connected to database, creating leave_logs_new table...")
 
-        create_table_sql = """
-            CREATE TABLE IF NOT EXISTS leave_logs_new (
-                application_id VARCHAR(100) PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                submission_date TIMESTAMP NOT NULL,
-                supervisor_review TIMESTAMP,
-                leave_type VARCHAR(50) NOT NULL,
-                start_date DATE NOT NULL,
-                end_date DATE NOT NULL,
-                number_of_leaves_taken NUMERIC(5,1) NOT NULL,
-                day_portion VARCHAR(50) NOT NULL,
-                status VARCHAR(50) NOT NULL,
-                remarks TEXT
-            )
-        """
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        cursor.execute(LEAVE_SLOT_FUNCTION_SQL)
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('leave_logs_new')")
+        row = cursor.fetchone()
+        if row and row[0] == 'r':
+            # A plain table from before partitioning
+            _migrate_leave_logs_to_partitions(cursor)
+        else:
+            cursor.execute(CREATE_LEAVE_LOGS_SQL)
 
-        cursor.execute(create_table_sql)
+        # Created on the parent, so every partition (including future ones) gets the index
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS leave_logs_new_open_period_idx
+            ON leave_logs_new USING gist (name, leave_period)
+            WHERE status IN ('Pending', 'Approved', 'Auto-Approved')
+        """)
+        # Overlap probes compare half-day slots, so AM and PM leaves on the same date can coexist
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS leave_logs_new_open_slot_idx
+            ON leave_logs_new USING gist (name, leave_slot(start_date, end_date, day_portion))
+            WHERE status IN ('Pending', 'Approved', 'Auto-Approved')
+        """)
+        # Partitions whose overlap constraint still compares whole days get the half-day one
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_constraint k
+            JOIN pg_class c ON c.oid = k.conrelid
+            WHERE k.contype = 'x'
+            AND k.conname = c.relname || '_no_overlap'
+            AND c.relname LIKE %s
+            AND pg_get_constraintdef(k.oid) NOT LIKE '%%leave_slot%%'
+        """, (LEAVE_LOG_PARTITION_PREFIX + '%',))
+        for (partition,) in cursor.fetchall():
+            _add_leave_log_overlap_constraint(cursor, partition)
+        # A supervisor's pending queue is read in (submission_date, application_id) order straight off this index
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS leave_logs_new_supervisor_status_idx
+            ON leave_logs_new (supervisor_email, status, submission_date, application_id)
+        """)
+        # An intern's history is paged in (start_date, application_id) order off this index
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS leave_logs_new_history_idx
+            ON leave_logs_new (name, start_date, application_id)
+        """)
+        _ensure_leave_log_partitions(cursor)
         conn.commit()
-        print("Successfully created leave_logs_new table")
+        logger.info("Successfully created leave_logs_new table")
         return True
     
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Database error while creating leave_logs_new: {e}")
+        logger.error("Database error while creating leave_logs_new: %s", e)
         return False
     
     finally:
         if conn:
             release_connection(conn)
 
- # Creation of tables if needed
-create_interns_table_from_csv(os.getenv("INTERNS_DB"))
-create_leave_logs_new()        
+# This function makes sure partitions exist from last year (backdated applications early in the year)
+# to LEAVE_LOG_PARTITIONS_AHEAD years ahead
+def _ensure_leave_log_partitions(cursor):
+    this_year = date.today().year
+    return sum(
+        1 for year in range(this_year - 1, this_year + LEAVE_LOG_PARTITIONS_AHEAD + 1)
+        if _create_leave_log_partition(cursor, year)
+    )
 
-# This function retrieves all registered interns and their IDs
-def get_registered_interns():
+# This function creates any missing upcoming leave log partitions (run daily, so a new year never lacks one)
+# Returns the number of partitions created, or None on error
+def ensure_leave_log_partitions():
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, telegram_handle FROM interns_new")
-        rows = cursor.fetchall()
-        return {row[2]: row[0] for row in rows}
+        created = _ensure_leave_log_partitions(cursor)
+        conn.commit()
+        return created
     except Exception as e:
-        print(f"Database error: {e}")
-        return {}
+        if conn:
+            conn.rollback()
+        logger.error("Database error while creating leave log partitions: %s", e)
+        return None
     finally:
         if conn:
             release_connection(conn)
 
-# This function retrieves intern information by their Telegram handle
-def get_intern_by_telegram(telegram_handle):
+# This function lists the attached leave log partitions, oldest first, with their year, row estimate,
+# on-disk size and number of applications still pending
+def get_leave_log_partitions():
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT id, name, telegram_handle, supervisor_email, al_balance, mc_balance, end_date, start_date, compassionate_balance, oil_balance
-            FROM interns_new 
-            WHERE telegram_handle = %s
-        """, (telegram_handle,))
-        intern = cursor.fetchone()
-        if intern:
-            return {
-                'id': intern[0],
-                'start_date': intern[7],
-                'end_date': intern[6],
-                'name': intern[1],
-                'telegram_handle': intern[2],
-                'supervisor_email': intern[3],
-                'al_balance': intern[4],
-                'mc_balance': intern[5],
-                'compassionate_balance':intern[8],
-                'oil_balance': intern[9]
-            }
-        return None
+            SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'leave_logs_new'::regclass
+            AND c.relname LIKE %s
+            ORDER BY c.relname
+        """, (LEAVE_LOG_PARTITION_PREFIX + '%',))
+        partitions = []
+        for name, estimated_rows, size_bytes in cursor.fetchall():
+            cursor.execute(f"SELECT COUNT(*) FROM {name} WHERE status = 'Pending'")
+            partitions.append({
+                'name': name,
+                'year': int(name[len(LEAVE_LOG_PARTITION_PREFIX):]),
+                'estimated_rows': max(estimated_rows, 0),
+                'size_bytes': size_bytes,
+                'pending': cursor.fetchone()[0]
+            })
+        return partitions
     except Exception as e:
-        print(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return None
     finally:
         if conn:
             release_connection(conn)
 
-# This function updates the leave balance in the database
-def update_leave_balance(username, balance_type, leave_duration, taken_type):
+# This function detaches one year's partition from leave_logs_new without blocking reads and writes on the
+# other partitions (DETACH ... CONCURRENTLY, which must run outside a transaction); the detached table is left
+# in place for the caller to archive. Returns True on success
+def detach_leave_log_partition(year):
+    partition = f"{LEAVE_LOG_PARTITION_PREFIX}{int(year)}"
+    if int(year) >= date.today().year - 1:
+        raise ValueError(f"{partition} may still receive applications and cannot be detached")
     conn = None
     try:
         conn = get_connection()
+        conn.autocommit = True
         cursor = conn.cursor()
-        
-        # Deduct leave balance
-        cursor.execute(
-            f"UPDATE interns_new SET {balance_type} = COALESCE({balance_type}, 0) - %s WHERE telegram_handle = %s",
-            (leave_duration, username)
-        )
-
-        # Update leave taken field
-        cursor.execute(
-            f"UPDATE interns_new SET {taken_type} = COALESCE({taken_type}, 0) + %s WHERE telegram_handle = %s",
-            (leave_duration, username)
-        )
+        cursor.execute(f"ALTER TABLE leave_logs_new DETACH PARTITION {partition} CONCURRENTLY")
+        logger.info("Detached leave log partition %s", partition)
+        return True
+    except Exception as e:
+        logger.error("Database error while detaching %s: %s", partition, e)
+        return False
+    finally:
+        if conn:
+            conn.autocommit = False
+            release_connection(conn)
 
+# This function loads archived rows (a CSV file object with a header, as written by leave_archive.py) into a new
+# partition for the given year and attaches it to leave_logs_new. Returns True on success
+def attach_leave_log_partition(year, csv_file):
+    partition = f"{LEAVE_LOG_PARTITION_PREFIX}{int(year)}"
+    columns = ", ".join(LEAVE_LOG_COLUMNS)
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        # Loaded as a standalone table and attached afterwards, so the parent is only locked for the attach
+        cursor.execute(f"CREATE TABLE {partition} (LIKE leave_logs_new INCLUDING DEFAULTS INCLUDING GENERATED)")
+        cursor.copy_expert(f"COPY {partition} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER)", csv_file)
+        cursor.execute(f"""
+            ALTER TABLE leave_logs_new ATTACH PARTITION {partition}
+            FOR VALUES FROM ('{int(year)}-01-01') TO ('{int(year) + 1}-01-01')
+        """)
+        _add_leave_log_overlap_constraint(cursor, partition)
         conn.commit()
+        logger.info("Attached leave log partition %s", partition)
         return True
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Database error: {e}")
+        logger.error("Database error while attaching %s: %s", partition, e)
         return False
     finally:
         if conn:
             release_connection(conn)
 
-# This function is used to just update the leave taken field in the database (for leaves that are not AL or MC)
-def update_leave_taken(username, leave_duration, taken_type):
+# Leave statuses that count towards usage rollups
+APPROVED_STATUSES = ('Approved', 'Auto-Approved')
+
+# This function creates the rollup tables read by /stats and the stats endpoint
+# leave_usage_rollup holds approved days per month, leave type and supervisor
+# entitlement_rollup holds remaining balances of current interns per supervisor
+def create_leave_rollups():
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        
-        # Update leave taken field
-        cursor.execute(
-            f"UPDATE interns_new SET {taken_type} = COALESCE({taken_type}, 0) + %s WHERE telegram_handle = %s",
-            (leave_duration, username)
-        )
 
+        cursor.execute("SELECT to_regclass('leave_usage_rollup') IS NULL")
+        newly_created = cursor.fetchone()[0]
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leave_usage_rollup (
+                month DATE NOT NULL,
+                leave_type VARCHAR(50) NOT NULL,
+                supervisor_email VARCHAR(255) NOT NULL DEFAULT '',
+                days_taken NUMERIC(8,1) NOT NULL DEFAULT 0,
+                applications INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (month, supervisor_email, leave_type)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS entitlement_rollup (
+                supervisor_email VARCHAR(255) PRIMARY KEY,
+                interns INTEGER NOT NULL DEFAULT 0,
+                al_balance NUMERIC(8,1) NOT NULL DEFAULT 0,
+                mc_balance NUMERIC(8,1) NOT NULL DEFAULT 0,
+                compassionate_balance NUMERIC(8,1) NOT NULL DEFAULT 0,
+                oil_balance NUMERIC(8,1) NOT NULL DEFAULT 0
+            )
+        """)
         conn.commit()
-        return True
+        logger.info("Leave rollup tables ready")
+        return newly_created
+
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Database error: {e}")
+        logger.error("Database error while creating leave rollups: %s", e)
         return False
+
     finally:
         if conn:
             release_connection(conn)
 
-# This function saves a leave application to the database after intern take leave
-def save_leave_application(application):
-    print("Function called with application:", application['id'])  # Debug at start
-    conn = None
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        print("About to execute INSERT")  # Debug before insert
-        cursor.execute("""
-            INSERT INTO leave_logs_new 
-            (application_id, name, submission_date, supervisor_review, leave_type, 
-             start_date, end_date, number_of_leaves_taken, day_portion, status, remarks)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            application['id'],
-            application['employee_name'],
-            application['submission_time'],
-            application.get('decision_time', None),
-            application['leave_type'],
-            adapt_date(application['start_date']),
-            adapt_date(application['end_date']),
-            application['leave_duration'],
-            application['day_portion'],
-            application['status'],
-            application["remarks"]
-        ))
-        print("Insert executed successfully",flush=True)  # Debug after insert
+# This function splits the working days of a leave across the months it touches
+# Single day leaves keep their duration (half days count as 0.5), longer leaves count weekdays only
+def leave_days_by_month(start_date, end_date, leave_duration):
+    start_date = adapt_date(start_date)
+    end_date = adapt_date(end_date)
+
+    if start_date == end_date:
+        return {start_date.replace(day=1): float(leave_duration)}
+
+    monthly_breakdown = {}
+    current_date = start_date
+    while current_date <= end_date:
+        if current_date.weekday() < 5:  # Skip weekends
+            month_key = current_date.replace(day=1)
+            monthly_breakdown[month_key] = monthly_breakdown.get(month_key, 0) + 1
+        current_date += timedelta(days=1)
+    return monthly_breakdown
+
+# This function adds (sign=1) or removes (sign=-1) an approved leave from leave_usage_rollup
+# It runs on the caller's cursor so the rollup commits together with the leave log change
+def _apply_usage_rollup(cursor, employee_name, leave_type, start_date, end_date, leave_duration, sign):
+    cursor.execute("""
+        SELECT supervisor_email FROM interns_new
+        WHERE name = %s
+        ORDER BY id DESC
+        LIMIT 1
+    """, (employee_name,))
+    row = cursor.fetchone()
+    supervisor_email = (row[0] if row else None) or ''
+
+    start_month = adapt_date(start_date).replace(day=1)
+    for month, days in leave_days_by_month(start_date, end_date, leave_duration).items():
+        cursor.execute("""
+            INSERT INTO leave_usage_rollup (month, leave_type, supervisor_email, days_taken, applications)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (month, supervisor_email, leave_type) DO UPDATE
+            SET days_taken = leave_usage_rollup.days_taken + EXCLUDED.days_taken,
+                applications = leave_usage_rollup.applications + EXCLUDED.applications
+        """, (month, leave_type, supervisor_email, sign * days, sign if month == start_month else 0))
+
+# This function moves a balance column of entitlement_rollup by delta for the intern's supervisor
+def _apply_entitlement_rollup(cursor, telegram_handle, balance_type, delta):
+    if balance_type not in LEDGER_BALANCE_COLUMNS:
+        return
+    cursor.execute(f"""
+        UPDATE entitlement_rollup r
+        SET {balance_type} = r.{balance_type} + %s
+        FROM interns_new i
+        WHERE i.telegram_handle = %s
+        AND i.status IN ('Active', 'Pending Start')
+        AND r.supervisor_email = COALESCE(i.supervisor_email, '')
+    """, (delta, telegram_handle))
+
+# Expected rollup contents computed from the base tables (used by the consistency check)
+EXPECTED_USAGE_SQL = """
+    SELECT date_trunc('month', d.day)::date AS month,
+           d.leave_type,
+           d.supervisor_email,
+           SUM(d.amount) AS days_taken,
+           COUNT(DISTINCT d.application_id) FILTER (
+               WHERE date_trunc('month', d.day) = date_trunc('month', d.start_date)
+           ) AS applications
+    FROM (
+        SELECT l.application_id, l.leave_type, l.start_date,
+               COALESCE(s.supervisor_email, '') AS supervisor_email,
+               g.day::date AS day,
+               CASE WHEN l.start_date = l.end_date THEN l.number_of_leaves_taken ELSE 1 END AS amount
+        FROM leave_logs_new l
+        LEFT JOIN LATERAL (
+            SELECT supervisor_email FROM interns_new
+            WHERE name = l.name
+            ORDER BY id DESC
+            LIMIT 1
+        ) s ON TRUE
+        CROSS JOIN generate_series(l.start_date, l.end_date, interval '1 day') AS g(day)
+        WHERE l.status IN ('Approved', 'Auto-Approved')
+        AND (l.start_date = l.end_date OR EXTRACT(ISODOW FROM g.day) < 6)
+    ) d
+    GROUP BY 1, 2, 3
+"""
+
+EXPECTED_ENTITLEMENT_SQL = """
+    SELECT COALESCE(supervisor_email, '') AS supervisor_email,
+           COUNT(*) AS interns,
+           SUM(COALESCE(al_balance, 0)) AS al_balance,
+           SUM(COALESCE(mc_balance, 0)) AS mc_balance,
+           SUM(COALESCE(compassionate_balance, 0)) AS compassionate_balance,
+           SUM(COALESCE(oil_balance, 0)) AS oil_balance
+    FROM interns_new
+    WHERE status IN ('Active', 'Pending Start')
+    GROUP BY 1
+"""
+
+# This function compares the rollups against the base tables and rewrites them when they drift
+# Returns the number of mismatching rollup rows, or None on error
+def check_leave_rollups(repair=True):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        # Block incremental rollup writers while the expected values are computed and compared
+        cursor.execute("LOCK TABLE leave_usage_rollup, entitlement_rollup IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TEMP TABLE expected_usage ON COMMIT DROP AS {EXPECTED_USAGE_SQL}")
+        cursor.execute(f"CREATE TEMP TABLE expected_entitlement ON COMMIT DROP AS {EXPECTED_ENTITLEMENT_SQL}")
+
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM expected_usage e
+            FULL JOIN leave_usage_rollup r USING (month, supervisor_email, leave_type)
+            WHERE COALESCE(e.days_taken, 0) <> COALESCE(r.days_taken, 0)
+            OR COALESCE(e.applications, 0) <> COALESCE(r.applications, 0)
+        """)
+        usage_mismatches = cursor.fetchone()[0]
+
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM expected_entitlement e
+            FULL JOIN entitlement_rollup r USING (supervisor_email)
+            WHERE COALESCE(e.interns, 0) <> COALESCE(r.interns, 0)
+            OR COALESCE(e.al_balance, 0) <> COALESCE(r.al_balance, 0)
+            OR COALESCE(e.mc_balance, 0) <> COALESCE(r.mc_balance, 0)
+            OR COALESCE(e.compassionate_balance, 0) <> COALESCE(r.compassionate_balance, 0)
+            OR COALESCE(e.oil_balance, 0) <> COALESCE(r.oil_balance, 0)
+        """)
+        entitlement_mismatches = cursor.fetchone()[0]
+
+        if repair and usage_mismatches:
+            cursor.execute("DELETE FROM leave_usage_rollup")
+            cursor.execute("""
+                INSERT INTO leave_usage_rollup (month, leave_type, supervisor_email, days_taken, applications)
+                SELECT month, leave_type, supervisor_email, days_taken, applications FROM expected_usage
+            """)
+        if repair and entitlement_mismatches:
+            cursor.execute("DELETE FROM entitlement_rollup")
+            cursor.execute("""
+                INSERT INTO entitlement_rollup (supervisor_email, interns, al_balance, mc_balance, compassionate_balance, oil_balance)
+                SELECT supervisor_email, interns, al_balance, mc_balance, compassionate_balance, oil_balance FROM expected_entitlement
+            """)
+
         conn.commit()
-        print("Commit successful",flush=True)  # Debug after commit
-        print(f"Leave application on {adapt_date(application['start_date'])} for {application['employee_name']} saved successfully in leave_logs_new",flush=True)
-        return True
+        mismatches = usage_mismatches + entitlement_mismatches
+        if mismatches:
+            logger.warning("Leave rollups had %s mismatching row(s)%s", mismatches, " (repaired)" if repair else "")
+        return mismatches
+
     except Exception as e:
-        print(f"Error occurred: {e}")  # Print any exceptions
         if conn:
             conn.rollback()
-        return False
+        logger.error("Database error while checking leave rollups: %s", e)
+        return None
+
     finally:
         if conn:
-            conn.close()
+            release_connection(conn)
 
-# This function retrieves the status of a leave application by its ID
-def get_leave_application(application_id):
+# This function reads month-by-leave-type usage from the rollup (optionally for one supervisor's team)
+# and the remaining entitlement of current interns; it never touches leave_logs_new or interns_new
+def get_leave_stats(month, supervisor_email=None):
     conn = None
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT status FROM leave_logs_new WHERE application_id = %s", (application_id,))
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-        return None
+        month = adapt_date(month).replace(day=1)
+
+        if supervisor_email is None:
+            cursor.execute("""
+                SELECT leave_type, SUM(days_taken), SUM(applications)
+                FROM leave_usage_rollup
+                WHERE month = %s
+                GROUP BY leave_type
+                ORDER BY leave_type
+            """, (month,))
+        else:
+            cursor.execute("""
+                SELECT leave_type, days_taken, applications
+                FROM leave_usage_rollup
+                WHERE month = %s
+                AND supervisor_email = %s
+                ORDER BY leave_type
+            """, (month, supervisor_email))
+        usage = {
+            row[0]: {'days_taken': float(row[1]), 'applications': int(row[2])}
+            for row in cursor.fetchall()
+        }
+
+        if supervisor_email is None:
+            cursor.execute("""
+                SELECT SUM(interns), SUM(al_balance), SUM(mc_balance), SUM(compassionate_balance), SUM(oil_balance)
+                FROM entitlement_rollup
+            """)
+        else:
+            cursor.execute("""
+                SELECT interns, al_balance, mc_balance, compassionate_balance, oil_balance
+                FROM entitlement_rollup
+                WHERE supervisor_email = %s
+            """, (supervisor_email,))
+        row = cursor.fetchone()
+        entitlement = {
+            'interns': int(row[0] or 0) if row else 0,
+            'al_balance': float(row[1] or 0) if row else 0.0,
+            'mc_balance': float(row[2] or 0) if row else 0.0,
+            'compassionate_balance': float(row[3] or 0) if row else 0.0,
+            'oil_balance': float(row[4] or 0) if row else 0.0,
+        }
+
+        return {
+            'month': month.strftime("%Y-%m"),
+            'supervisor_email': supervisor_email,
+            'usage': usage,
+            'remaining_entitlement': entitlement
+        }
     except Exception as e:
-        print(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return None
     finally:
         if conn:
             release_connection(conn)
 
-# This function retrieves all approved leaves for a given intern by their Telegram handle
-def get_approved_leaves(telegram_handle):
+# Columns of interns_new tracked by the leave_events ledger
+LEDGER_BALANCE_COLUMNS = ('al_balance', 'mc_balance', 'compassionate_balance', 'oil_balance')
+LEDGER_TAKEN_COLUMNS = ('al_taken', 'mc_taken', 'compassionate_taken', 'oil_taken', 'npl_taken')
+LEDGER_COLUMNS = LEDGER_BALANCE_COLUMNS + LEDGER_TAKEN_COLUMNS
+
+# This function creates the append-only leave_events ledger and the per-intern balance snapshots
+def create_leave_ledger():
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
+
+        cursor.execute("SELECT to_regclass('leave_balance_snapshots') IS NULL")
+        newly_created = cursor.fetchone()[0]
+
         cursor.execute("""
-            SELECT application_id, name, leave_type, start_date, end_date, 
-                   number_of_leaves_taken, day_portion, status, remarks
-            FROM leave_logs_new  
-            WHERE name = (SELECT name FROM interns_new WHERE telegram_handle = %s)
-            AND status IN ('Approved', 'Auto-Approved')
-            AND start_date >= CURRENT_DATE
-            ORDER BY start_date ASC
-        """, (telegram_handle,))
-        
-        leaves = []
-        for row in cursor.fetchall():
-            leaves.append({
-                'application_id': row[0],
-                'name': row[1],
-                'leave_type': row[2],
-                'start_date': row[3],
-                'end_date': row[4],
-                'leave_duration': row[5],
-                'day_portion': row[6],
-                'status': row[7],
-                'remarks': row[8]
-            })
-        return leaves
+            CREATE TABLE IF NOT EXISTS leave_events (
+                event_id BIGSERIAL PRIMARY KEY,
+                intern_id INTEGER NOT NULL,
+                telegram_handle VARCHAR(100) NOT NULL,
+                event_type VARCHAR(20) NOT NULL CHECK (event_type IN ('grant', 'deduct', 'restore', 'adjust')),
+                balance_column VARCHAR(50),
+                balance_delta NUMERIC(6,1) NOT NULL DEFAULT 0,
+                taken_column VARCHAR(50),
+                taken_delta NUMERIC(6,1) NOT NULL DEFAULT 0,
+                application_id VARCHAR(100),
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS leave_events_intern_idx ON leave_events (intern_id, event_id)")
+
+        # The ledger is append-only: updates and deletes are refused by the database itself
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION leave_events_append_only() RETURNS trigger AS $$
+            BEGIN
+                RAISE EXCEPTION 'leave_events is append-only';
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS leave_events_append_only ON leave_events")
+        cursor.execute("""
+            CREATE TRIGGER leave_events_append_only
+            BEFORE UPDATE OR DELETE ON leave_events
+            FOR EACH ROW EXECUTE FUNCTION leave_events_append_only()
+        """)
+
+        snapshot_columns = ",\n".join(f"{column} NUMERIC(6,1) NOT NULL DEFAULT 0" for column in LEDGER_COLUMNS)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS leave_balance_snapshots (
+                intern_id INTEGER NOT NULL,
+                last_event_id BIGINT NOT NULL,
+                taken_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                {snapshot_columns},
+                PRIMARY KEY (intern_id, last_event_id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS leave_balance_snapshots_taken_idx ON leave_balance_snapshots (intern_id, taken_at)")
+
+        conn.commit()
+        logger.info("Leave ledger tables ready")
+        return newly_created
+
     except Exception as e:
-        print(f"Database error: {e}")
-        return []
+        if conn:
+            conn.rollback()
+        logger.error("Database error while creating leave ledger: %s", e)
+        return False
+
     finally:
         if conn:
             release_connection(conn)
 
-# This function cancels a leave application and restores the leave balance
-def cancel_leave_application(application_id, telegram_handle):
+# This function applies a deduct/restore to an intern's balance and taken columns and appends the
+# matching leave_events rows in the same statement, so the ledger can never disagree with interns_new
+# Deduct lowers the balance and raises taken; restore does the opposite (taken never drops below 0).
+# The intern's rows are locked before they are read, so concurrent changes to the same intern queue up
+# and each one starts from the value the previous one committed
+def _apply_balance_change(cursor, telegram_handle, event_type, balance_column, taken_column, amount, application_id=None):
+    if balance_column and balance_column not in LEDGER_BALANCE_COLUMNS:
+        raise ValueError(f"Unknown balance column: {balance_column}")
+    if taken_column and taken_column not in LEDGER_TAKEN_COLUMNS:
+        raise ValueError(f"Unknown taken column: {taken_column}")
+
+    sign = -1 if event_type == 'deduct' else 1
+    locked_columns = ["id"]
+    set_clauses = []
+    balance_delta_sql = "0"
+    taken_delta_sql = "0"
+    if balance_column:
+        locked_columns.append(balance_column)
+        set_clauses.append(f"{balance_column} = COALESCE(n.{balance_column}, 0) + %(balance_delta)s")
+        balance_delta_sql = f"n.{balance_column} - COALESCE(old.{balance_column}, 0)"
+    if taken_column:
+        locked_columns.append(taken_column)
+        set_clauses.append(f"{taken_column} = GREATEST(0, COALESCE(n.{taken_column}, 0) + %(taken_delta)s)")
+        taken_delta_sql = f"n.{taken_column} - COALESCE(old.{taken_column}, 0)"
+
+    cursor.execute(f"""
+        WITH old AS (
+            SELECT {", ".join(locked_columns)}
+            FROM interns_new
+            WHERE telegram_handle = %(telegram_handle)s
+            FOR UPDATE
+        ),
+        changed AS (
+            UPDATE interns_new n
+            SET {", ".join(set_clauses)}
+            FROM old
+            WHERE n.id = old.id
+            RETURNING n.id, n.telegram_handle, {balance_delta_sql} AS balance_delta, {taken_delta_sql} AS taken_delta
+        )
+        INSERT INTO leave_events (intern_id, telegram_handle, event_type, balance_column, balance_delta,
+                                  taken_column, taken_delta, application_id)
+        SELECT id, telegram_handle, %(event_type)s, %(balance_column)s, balance_delta,
+               %(taken_column)s, taken_delta, %(application_id)s
+        FROM changed
+    """, {
+        'telegram_handle': telegram_handle,
+        'event_type': event_type,
+        'balance_column': balance_column or None,
+        'taken_column': taken_column or None,
+        'balance_delta': sign * amount,
+        'taken_delta': -sign * amount,
+        'application_id': application_id
+    })
+    return cursor.rowcount
+
+# This function appends one grant/adjust event per balance column that changed (used by the CSV import)
+def _record_balance_events(cursor, intern_id, telegram_handle, event_type, balance_deltas):
+    rows = [
+        (intern_id, telegram_handle, event_type, column, delta)
+        for column, delta in balance_deltas.items()
+        if delta
+    ]
+    if rows:
+        execute_values(cursor, """
+            INSERT INTO leave_events (intern_id, telegram_handle, event_type, balance_column, balance_delta)
+            VALUES %s
+        """, rows)
+
+# SQL computing ledger balances per intern: latest snapshot matching snapshot_filter plus every later
+# event matching event_filter; interns without a snapshot start from zero and replay all their events
+def _ledger_replay_sql(snapshot_filter="TRUE", event_filter="TRUE"):
+    replayed = ",\n".join(
+        f"COALESCE(s.{column}, 0) + COALESCE(e.{column}, 0) AS {column}" for column in LEDGER_COLUMNS
+    )
+    snapshot_columns = ", ".join(LEDGER_COLUMNS)
+    event_sums = ",\n".join(
+        [f"SUM(balance_delta) FILTER (WHERE balance_column = '{column}') AS {column}" for column in LEDGER_BALANCE_COLUMNS]
+        + [f"SUM(taken_delta) FILTER (WHERE taken_column = '{column}') AS {column}" for column in LEDGER_TAKEN_COLUMNS]
+    )
+    return f"""
+        SELECT i.id, i.telegram_handle, e.events, {replayed}
+        FROM interns_new i
+        LEFT JOIN LATERAL (
+            SELECT last_event_id, {snapshot_columns}
+            FROM leave_balance_snapshots
+            WHERE intern_id = i.id
+            AND {snapshot_filter}
+            ORDER BY last_event_id DESC
+            LIMIT 1
+        ) s ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS events, {event_sums}
+            FROM leave_events
+            WHERE intern_id = i.id
+            AND event_id > COALESCE(s.last_event_id, 0)
+            AND {event_filter}
+        ) e ON TRUE
+    """
+
+# This function snapshots the balances of every intern whose ledger moved since their last snapshot
+# Point-in-time queries and rebuilds then only replay the events after the latest snapshot
+def snapshot_leave_balances():
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        
-        # Get the leave details first
-        cursor.execute("""
-            SELECT leave_type, number_of_leaves_taken 
-            FROM leave_logs_new  
-            WHERE application_id = %s
-        """, (application_id,))
-        
-        leave_info = cursor.fetchone()
-        if not leave_info:
-            return False
-            
-        leave_type, leave_duration = leave_info
-        
-        # Update status to Cancelled
-        cursor.execute("""
-            UPDATE leave_logs_new  
-            SET status = 'Cancelled', 
-                remarks = CONCAT(COALESCE(remarks, ''), ' [Cancelled by intern]')
-            WHERE application_id = %s
-        """, (application_id,))
-        
-        # Restore leave balance based on leave type
-        if leave_type == 'Annual Leave':
-            cursor.execute("""
-                UPDATE interns_new 
-                SET al_balance = al_balance + %s,
-                    al_taken = GREATEST(0, al_taken - %s)
-                WHERE telegram_handle = %s
-            """, (leave_duration, leave_duration, telegram_handle))
-        elif leave_type == 'Medical Leave':
-            cursor.execute("""
-                UPDATE interns_new 
-                SET mc_balance = mc_balance + %s,
-                    mc_taken = GREATEST(0, mc_taken - %s)
-                WHERE telegram_handle = %s
-            """, (leave_duration, leave_duration, telegram_handle))
-        elif leave_type == 'No Pay Leave':
-            cursor.execute("""
-                UPDATE interns_new 
-                SET npl_taken = GREATEST(0, npl_taken - %s)
-                WHERE telegram_handle = %s
-            """, (leave_duration, telegram_handle))
-        elif leave_type == 'Compassionate Leave':
-            cursor.execute("""
-                UPDATE interns_new 
-                SET compassionate_taken = GREATEST(0, compassionate_taken - %s)
-                WHERE telegram_handle = %s
-            """, (leave_duration, telegram_handle))
-        elif leave_type == 'Off in Lieu':
-            cursor.execute("""
-                UPDATE interns_new 
-                SET oil_taken = GREATEST(0, oil_taken - %s)
-                WHERE telegram_handle = %s
-            """, (leave_duration, telegram_handle))
-        
+        snapshot_columns = ", ".join(LEDGER_COLUMNS)
+        current_values = ", ".join(f"COALESCE(i.{column}, 0)" for column in LEDGER_COLUMNS)
+        cursor.execute(f"""
+            INSERT INTO leave_balance_snapshots (intern_id, last_event_id, {snapshot_columns})
+            SELECT i.id, e.last_event_id, {current_values}
+            FROM interns_new i
+            CROSS JOIN LATERAL (
+                SELECT COALESCE(MAX(event_id), 0) AS last_event_id FROM leave_events WHERE intern_id = i.id
+            ) e
+            LEFT JOIN LATERAL (
+                SELECT MAX(last_event_id) AS last_event_id FROM leave_balance_snapshots WHERE intern_id = i.id
+            ) s ON TRUE
+            WHERE s.last_event_id IS NULL
+            OR e.last_event_id > s.last_event_id
+        """)
+        snapshots = cursor.rowcount
         conn.commit()
-        return True
+        logger.info("Took %s leave balance snapshot(s)", snapshots)
+        return snapshots
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Database error when cancelling leave: {e}")
-        return False
+        logger.error("Database error while snapshotting leave balances: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function returns an intern's balances as they stood at as_of, replayed from the ledger
+def get_balance_at(telegram_handle, as_of):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT * FROM ({_ledger_replay_sql("taken_at <= %(as_of)s", "created_at <= %(as_of)s")}
+                           WHERE i.telegram_handle = %(telegram_handle)s) balances
+            ORDER BY id DESC
+            LIMIT 1
+        """, {'as_of': as_of, 'telegram_handle': telegram_handle})
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {column: row[index + 3] for index, column in enumerate(LEDGER_COLUMNS)}
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return None
     finally:
         if conn:
             release_connection(conn)
 
+# This function rebuilds every intern's balances from their latest snapshot and the events after it
+# With repair=False it only reports how many interns disagree with the ledger
+def rebuild_leave_balances(repair=False):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        drift = " OR ".join(f"COALESCE(i.{column}, 0) <> r.{column}" for column in LEDGER_COLUMNS)
+        cursor.execute(f"""
+            CREATE TEMP TABLE replayed_balances ON COMMIT DROP AS {_ledger_replay_sql()}
+        """)
+        cursor.execute(f"""
+            SELECT COUNT(*) FROM interns_new i JOIN replayed_balances r ON r.id = i.id WHERE {drift}
+        """)
+        drifted = cursor.fetchone()[0]
+
+        if repair and drifted:
+            assignments = ", ".join(f"{column} = r.{column}" for column in LEDGER_COLUMNS)
+            cursor.execute(f"""
+                UPDATE interns_new i SET {assignments}
+                FROM replayed_balances r
+                WHERE r.id = i.id AND ({drift})
+            """)
+
+        conn.commit()
+        if drifted:
+            logger.warning("%s intern(s) disagree with the leave ledger%s", drifted, " (rebuilt)" if repair else "")
+        return drifted
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while rebuilding leave balances: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# Notification outbox configuration
+#   NOTIFICATION_MAX_ATTEMPTS       sends tried before a notification is marked failed (8)
+#   NOTIFICATION_LEASE_SECONDS      how long a claimed notification is hidden from other dispatchers; a dispatcher
+#                                   that dies mid-send leaves it to be picked up again after this (300)
+#   NOTIFICATION_RETENTION_DAYS     how long sent and failed notifications are kept (14)
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 8))
+NOTIFICATION_LEASE_SECONDS = int(os.getenv("NOTIFICATION_LEASE_SECONDS", 300))
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 14))
+NOTIFICATION_CHANNELS = ('telegram', 'email')
+
+# This function creates the outbox that Telegram messages and emails are written to in the same transaction as
+# the decision they report; the bot's dispatcher sends them afterwards (see notifications.py)
+def create_notification_outbox():
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                idempotency_key VARCHAR(200) NOT NULL UNIQUE,
+                channel VARCHAR(20) NOT NULL CHECK (channel IN ('telegram', 'email')),
+                recipient VARCHAR(255) NOT NULL,
+                payload JSONB NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                progress INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP,
+                last_error TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS notification_outbox_due_idx ON notification_outbox (next_attempt_at, id)
+            WHERE status = 'pending'
+        """)
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while creating the notification outbox: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function adds notifications to the outbox inside the caller's transaction, so they are sent if and only if
+# that transaction commits. Each notification is a dict with idempotency_key, channel, recipient and payload;
+# one whose key is already in the outbox is skipped, so repeating a step never queues a second message
+def _enqueue_notifications(cursor, notifications):
+    if not notifications:
+        return
+    execute_values(cursor, """
+        INSERT INTO notification_outbox (idempotency_key, channel, recipient, payload)
+        VALUES %s
+        ON CONFLICT (idempotency_key) DO NOTHING
+    """, [
+        (notification['idempotency_key'], notification['channel'], str(notification['recipient']),
+         Json(notification['payload']))
+        for notification in notifications
+    ])
+
+# This function adds notifications to the outbox in their own transaction, for events that have no database
+# change of their own to ride on (see _enqueue_notifications). Returns True once they are committed
+def enqueue_notifications(notifications):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        _enqueue_notifications(cursor, notifications)
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while queueing notifications: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function creates the table of supervisors who receive and decide applications in Telegram
+def create_supervisors_table():
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS supervisors (
+                supervisor_email VARCHAR(255) PRIMARY KEY,
+                telegram_handle VARCHAR(100),
+                chat_id BIGINT NOT NULL UNIQUE,
+                registered_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while creating the supervisors table: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function looks up an email among the supervisors of current interns, ignoring case
+# Returns the email as the roster spells it (which leave_logs_new stores), or None if nobody reports to it
+def find_supervisor_email(supervisor_email):
+    conn = None
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT supervisor_email FROM interns_new
+            WHERE LOWER(supervisor_email) = LOWER(%s)
+            AND status IN ('Active', 'Pending Start')
+            LIMIT 1
+        """, (supervisor_email,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logger.error("Database error while looking up supervisor %s: %s", supervisor_email, e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function links a supervisor's email to the Telegram chat their applications are sent to
+# A chat can only stand for one supervisor, so linking it moves it away from any other email
+def register_supervisor_chat(supervisor_email, telegram_handle, chat_id, notifications=None):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM supervisors WHERE chat_id = %s AND supervisor_email <> %s", (chat_id, supervisor_email))
+        cursor.execute("""
+            INSERT INTO supervisors (supervisor_email, telegram_handle, chat_id)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (supervisor_email) DO UPDATE
+            SET telegram_handle = EXCLUDED.telegram_handle,
+                chat_id = EXCLUDED.chat_id,
+                registered_at = CURRENT_TIMESTAMP
+        """, (supervisor_email, telegram_handle, chat_id))
+        _enqueue_notifications(cursor, notifications)
+        conn.commit()
+        logger.info("Supervisor %s linked to Telegram @%s", supervisor_email, telegram_handle)
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while registering supervisor %s: %s", supervisor_email, e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function unlinks a supervisor's Telegram chat; their applications go back to email
+# Returns the email that was unlinked, or None
+def unregister_supervisor_chat(chat_id):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM supervisors WHERE chat_id = %s RETURNING supervisor_email", (chat_id,))
+        row = cursor.fetchone()
+        conn.commit()
+        return row[0] if row else None
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while unregistering supervisor chat %s: %s", chat_id, e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function returns the Telegram chat a supervisor's applications are sent to, or None to email them
+def get_supervisor_chat(supervisor_email):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT chat_id FROM supervisors WHERE supervisor_email = %s", (supervisor_email,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logger.error("Database error while looking up the chat of supervisor %s: %s", supervisor_email, e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function returns the supervisor email linked to a Telegram chat, or None
+def get_supervisor_email_by_chat(chat_id):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT supervisor_email FROM supervisors WHERE chat_id = %s", (chat_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logger.error("Database error while looking up supervisor chat %s: %s", chat_id, e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function claims up to limit due notifications for one dispatcher. Rows locked by another dispatcher are
+# skipped, and claimed rows are leased for NOTIFICATION_LEASE_SECONDS, so concurrent dispatchers never send
+# the same notification twice unless one of them dies mid-send.
+# Returns a list of dicts in id order, or None on error
+def claim_notifications(limit):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE notification_outbox o
+            SET attempts = o.attempts + 1,
+                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE o.id IN (
+                SELECT id FROM notification_outbox
+                WHERE status = 'pending'
+                AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING o.id, o.idempotency_key, o.channel, o.recipient, o.payload, o.attempts, o.progress
+        """, (NOTIFICATION_LEASE_SECONDS, limit))
+        rows = cursor.fetchall()
+        conn.commit()
+        return [
+            {'id': row[0], 'idempotency_key': row[1], 'channel': row[2], 'recipient': row[3], 'payload': row[4],
+             'attempts': row[5], 'progress': row[6]}
+            for row in sorted(rows)
+        ]
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while claiming notifications: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function records the result of sending claimed notifications.
+# failures is a list of (id, error, progress, retry_in_seconds): progress is how many of the notification's
+# messages were delivered (a retry resumes after them) and retry_in_seconds None marks a permanent failure.
+# A notification that has used NOTIFICATION_MAX_ATTEMPTS is marked failed instead of retried.
+def complete_notifications(sent_ids, failures):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        if sent_ids:
+            cursor.execute("""
+                UPDATE notification_outbox
+                SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL
+                WHERE id = ANY(%s)
+            """, (list(sent_ids),))
+        if failures:
+            finished = execute_values(cursor, f"""
+                UPDATE notification_outbox o
+                SET status = CASE WHEN f.retry_in IS NULL OR o.attempts >= {NOTIFICATION_MAX_ATTEMPTS} THEN 'failed' ELSE 'pending' END,
+                    next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => COALESCE(f.retry_in, 0)),
+                    progress = f.progress,
+                    last_error = f.error
+                FROM (VALUES %s) AS f(id, error, progress, retry_in)
+                WHERE o.id = f.id
+                RETURNING o.id, o.idempotency_key, o.status
+            """, [
+                (notification_id, str(error)[:1000], progress, retry_in)
+                for notification_id, error, progress, retry_in in failures
+            ], template="(%s::bigint, %s::text, %s::integer, %s::double precision)", fetch=True)
+            for notification_id, idempotency_key, status in finished:
+                if status == 'failed':
+                    logger.error("Notification %s (%s) failed permanently", notification_id, idempotency_key)
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while recording notification results: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function deletes sent and failed notifications older than retention_days
+def prune_notification_outbox(retention_days=NOTIFICATION_RETENTION_DAYS):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM notification_outbox
+            WHERE status IN ('sent', 'failed')
+            AND created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        """, (retention_days,))
+        pruned = cursor.rowcount
+        conn.commit()
+        logger.info("Pruned %s notification(s) from the outbox", pruned)
+        return pruned
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while pruning the notification outbox: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function counts the outbox by status, with the age of the oldest due notification, for the dispatcher's report
+def get_notification_outbox_stats():
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FILTER (WHERE status = 'pending'),
+                   COUNT(*) FILTER (WHERE status = 'failed'),
+                   EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(next_attempt_at) FILTER (
+                       WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP))
+            FROM notification_outbox
+        """)
+        pending, failed, oldest_due = cursor.fetchone()
+        conn.commit()
+        return {'pending': pending, 'failed': failed, 'oldest_due_seconds': float(oldest_due or 0)}
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while reading notification outbox stats: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# Channel interns_new changes are announced on, for the bot's intern cache (see intern_cache.py)
+INTERN_CHANGES_CHANNEL = 'interns_new_changed'
+# Longest payload sent on it; a statement touching more handles than fit announces '*' (reload everything)
+INTERN_CHANGES_MAX_PAYLOAD = 7900
+
+# This function makes every statement that changes interns_new announce the telegram handles it touched on
+# INTERN_CHANGES_CHANNEL. Notifications are delivered when the transaction commits, and never for a rollback.
+def create_intern_change_notifications():
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('interns_new') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            conn.rollback()
+            return False
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION interns_new_notify_changes() RETURNS trigger AS $$
+            DECLARE
+                handles TEXT;
+            BEGIN
+                SELECT string_agg(DISTINCT telegram_handle, ',') INTO handles FROM changed_interns;
+                IF handles IS NOT NULL THEN
+                    IF length(handles) > {INTERN_CHANGES_MAX_PAYLOAD} THEN
+                        handles := '*';
+                    END IF;
+                    PERFORM pg_notify('{INTERN_CHANGES_CHANNEL}', handles);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        # A trigger with a transition table covers one event, so there is one per event; each fires once per statement
+        for event, transition in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f"DROP TRIGGER IF EXISTS interns_new_notify_{event.lower()} ON interns_new")
+            cursor.execute(f"""
+                CREATE TRIGGER interns_new_notify_{event.lower()}
+                AFTER {event} ON interns_new
+                REFERENCING {transition} TABLE AS changed_interns
+                FOR EACH STATEMENT EXECUTE FUNCTION interns_new_notify_changes()
+            """)
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while creating the intern change notifications: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# Leave-type policies: which interns_new columns a leave type draws from, whether it needs documents, whether
+# its balance is checked before approval and how approvals are broken down in the remarks. They live in the
+# leave_types table and are read once per process (LEAVE_TYPES), so adding a leave type is an INSERT that the
+# bot and web workers pick up when they restart.
+#   name              the leave type as interns choose it and leave_logs_new stores it
+#   balance_column    interns_new balance it deducts from (None if it has no balance)
+#   taken_column      interns_new column counting the days taken
+#   abbreviation      short name used in messages ("Remaining AL Balance")
+#   document          documents the intern is asked to submit (None if none are needed)
+#   checks_balance    approvals are rejected when the balance is short
+#   breakdown         'monthly' adds a per-month breakdown of the days to an approval's remarks, 'none' does not
+#   show_balance      listed by /balance
+LeaveTypePolicy = namedtuple('LeaveTypePolicy', (
+    'name', 'balance_column', 'taken_column', 'abbreviation', 'document', 'checks_balance', 'breakdown', 'show_balance'
+))
+LEAVE_BREAKDOWN_RULES = ('none', 'monthly')
+
+# The leave types leave_types is seeded with, in menu order
+DEFAULT_LEAVE_TYPES = (
+    LeaveTypePolicy('Annual Leave', 'al_balance', 'al_taken', 'AL', None, True, 'monthly', True),
+    LeaveTypePolicy('Medical Leave', 'mc_balance', 'mc_taken', 'MC', 'medical certificate', True, 'monthly', True),
+    LeaveTypePolicy('No Pay Leave', None, 'npl_taken', 'NPL', None, False, 'monthly', False),
+    # Compassionate leave is 3 days by default, so /balance does not list it
+    LeaveTypePolicy('Compassionate Leave', 'compassionate_balance', 'compassionate_taken', 'CL', 'supporting documents',
+                    True, 'monthly', False),
+    LeaveTypePolicy('Off in Lieu', 'oil_balance', 'oil_taken', 'OIL', None, True, 'monthly', True),
+)
+
+# This function creates the leave_types table and seeds it with DEFAULT_LEAVE_TYPES
+# Rows already there are left alone, so policies edited in the database survive restarts
+def create_leave_types_table():
+    balance_columns = ", ".join(f"'{column}'" for column in LEDGER_BALANCE_COLUMNS)
+    taken_columns = ", ".join(f"'{column}'" for column in LEDGER_TAKEN_COLUMNS)
+    breakdown_rules = ", ".join(f"'{rule}'" for rule in LEAVE_BREAKDOWN_RULES)
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS leave_types (
+                leave_type VARCHAR(50) PRIMARY KEY,
+                balance_column VARCHAR(50) CHECK (balance_column IN ({balance_columns})),
+                taken_column VARCHAR(50) NOT NULL CHECK (taken_column IN ({taken_columns})),
+                abbreviation VARCHAR(10) NOT NULL,
+                document VARCHAR(100),
+                checks_balance BOOLEAN NOT NULL DEFAULT FALSE,
+                breakdown VARCHAR(20) NOT NULL DEFAULT 'none' CHECK (breakdown IN ({breakdown_rules})),
+                show_balance BOOLEAN NOT NULL DEFAULT FALSE,
+                menu_order SMALLINT NOT NULL DEFAULT 0,
+                CHECK (NOT checks_balance OR balance_column IS NOT NULL)
+            )
+        """)
+        execute_values(cursor, """
+            INSERT INTO leave_types (leave_type, balance_column, taken_column, abbreviation, document, checks_balance,
+                                     breakdown, show_balance, menu_order)
+            VALUES %s
+            ON CONFLICT (leave_type) DO NOTHING
+        """, [tuple(policy) + (order,) for order, policy in enumerate(DEFAULT_LEAVE_TYPES)])
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while creating the leave_types table: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function reads the leave-type policies in menu order
+# Returns a read-only mapping of leave type to LeaveTypePolicy; DEFAULT_LEAVE_TYPES if the table cannot be read
+def load_leave_types():
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT leave_type, balance_column, taken_column, abbreviation, document, checks_balance, breakdown, show_balance
+            FROM leave_types
+            ORDER BY menu_order, leave_type
+        """)
+        policies = [LeaveTypePolicy(*row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error("Database error while loading the leave types, using the defaults: %s", e)
+        policies = DEFAULT_LEAVE_TYPES
+    finally:
+        if conn:
+            release_connection(conn)
+    return MappingProxyType({policy.name: policy for policy in policies})
+
+# This function returns the policy of a leave type, or None for a type that is not configured
+def get_leave_type(leave_type):
+    return LEAVE_TYPES.get(leave_type)
+
+# This function words an approval's remarks by the leave type's breakdown rule ("" when it has none)
+def leave_breakdown_remarks(leave_type, start_date, end_date, leave_duration):
+    policy = LEAVE_TYPES.get(leave_type)
+    if policy is None or policy.breakdown != 'monthly':
+        return ""
+    months = leave_days_by_month(start_date, end_date, leave_duration)
+    return "Leave breakdown: " + ", ".join(
+        f"{month.strftime('%b %Y')}: {days:g} day(s)" for month, days in sorted(months.items())
+    )
+
+# This function checks an application against its leave type's balance
+# Returns None when it may be approved, else the reason for the supervisor and intern
+def check_leave_balance(leave_type, leave_duration, intern_info):
+    policy = LEAVE_TYPES.get(leave_type)
+    if policy is None or not policy.checks_balance:
+        return None
+    current_balance = intern_info[policy.balance_column]
+    if leave_duration > current_balance:
+        return f"{leave_type} balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
+    return None
+
+ # Creation of tables if needed
+# The ledger has to exist before the CSV import, which records grant/adjust events
+ledger_created = create_leave_ledger()
+# Web workers run without INTERNS_DB; only the bot process imports the roster
+if os.getenv("INTERNS_DB"):
+    create_interns_table_from_csv(os.getenv("INTERNS_DB"))
+create_intern_change_notifications()
+create_leave_logs_new()
+create_notification_outbox()
+create_supervisors_table()
+create_leave_types_table()
+LEAVE_TYPES = load_leave_types()
+if create_leave_rollups():
+    check_leave_rollups(repair=True)
+if ledger_created:
+    # Baseline snapshot so balances from before the ledger existed can still be replayed
+    snapshot_leave_balances()
+
+# This function moves internships along Pending Start -> Active -> Completed by date, in set-based statements,
+# and expires the pending leave applications of interns who no longer have a current internship.
+# Interns leaving Active/Pending Start are taken out of entitlement_rollup in the same transaction, and the
+# interns of expired applications are told through the notification outbox.
+# Returns {'activated': n, 'completed': n, 'expired': [(application_id, chat_id), ...]}, or None on error
+def advance_internship_statuses():
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE interns_new
+            SET status = 'Active'
+            WHERE status = 'Pending Start'
+            AND start_date <= CURRENT_DATE
+            AND end_date >= CURRENT_DATE
+        """)
+        activated = cursor.rowcount
+
+        cursor.execute("""
+            WITH completed AS (
+                UPDATE interns_new
+                SET status = 'Completed'
+                WHERE status IN ('Active', 'Pending Start')
+                AND end_date < CURRENT_DATE
+                RETURNING COALESCE(supervisor_email, '') AS supervisor_email, al_balance, mc_balance,
+                          compassionate_balance, oil_balance
+            ),
+            totals AS (
+                SELECT supervisor_email, COUNT(*) AS interns,
+                       SUM(COALESCE(al_balance, 0)) AS al_balance,
+                       SUM(COALESCE(mc_balance, 0)) AS mc_balance,
+                       SUM(COALESCE(compassionate_balance, 0)) AS compassionate_balance,
+                       SUM(COALESCE(oil_balance, 0)) AS oil_balance
+                FROM completed
+                GROUP BY supervisor_email
+            ),
+            rolled AS (
+                UPDATE entitlement_rollup r
+                SET interns = r.interns - t.interns,
+                    al_balance = r.al_balance - t.al_balance,
+                    mc_balance = r.mc_balance - t.mc_balance,
+                    compassionate_balance = r.compassionate_balance - t.compassionate_balance,
+                    oil_balance = r.oil_balance - t.oil_balance
+                FROM totals t
+                WHERE r.supervisor_email = t.supervisor_email
+            )
+            SELECT COALESCE(SUM(interns), 0) FROM totals
+        """)
+        completed = cursor.fetchone()[0]
+
+        # The intern's notice is queued in the same statement, so it is sent exactly when the expiry commits
+        cursor.execute("""
+            WITH expired AS (
+                UPDATE leave_logs_new l
+                SET status = 'Expired',
+                    remarks = CONCAT(l.remarks, ' [Expired: internship ended before a decision]')
+                WHERE l.status = 'Pending'
+                AND NOT EXISTS (
+                    SELECT 1 FROM interns_new i
+                    WHERE (i.telegram_handle = l.telegram_handle OR (l.telegram_handle IS NULL AND i.name = l.name))
+                    AND i.status IN ('Active', 'Pending Start')
+                )
+                AND EXISTS (
+                    SELECT 1 FROM interns_new i
+                    WHERE (i.telegram_handle = l.telegram_handle OR (l.telegram_handle IS NULL AND i.name = l.name))
+                    AND i.status = 'Completed'
+                )
+                RETURNING l.application_id, l.chat_id
+            ),
+            notified AS (
+                INSERT INTO notification_outbox (idempotency_key, channel, recipient, payload)
+                SELECT 'expired:' || application_id || ':telegram', 'telegram', chat_id::text,
+                       jsonb_build_object('messages', jsonb_build_array(jsonb_build_object(
+                           'text', 'Your pending leave application has expired as your internship has ended.',
+                           'reply_markup', NULL)))
+                FROM expired
+                WHERE chat_id IS NOT NULL
+                ON CONFLICT (idempotency_key) DO NOTHING
+            )
+            SELECT application_id, chat_id FROM expired
+        """)
+        expired = cursor.fetchall()
+        conn.commit()
+        logger.info("Internship lifecycle: %s activated, %s completed, %s pending application(s) expired",
+                    activated, completed, len(expired))
+        return {'activated': activated, 'completed': completed, 'expired': expired}
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while advancing internship statuses: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function retrieves all registered interns and their IDs
+def get_registered_interns():
+    conn = None
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, telegram_handle FROM interns_new")
+        rows = cursor.fetchall()
+        return {row[2]: row[0] for row in rows}
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return {}
+    finally:
+        if conn:
+            release_connection(conn)
+
+# Columns of an intern profile, in the order get_intern_by_telegram and the intern cache read them
+INTERN_PROFILE_COLUMNS = ('id', 'name', 'telegram_handle', 'supervisor_email', 'al_balance', 'mc_balance', 'end_date',
+                          'start_date', 'compassionate_balance', 'oil_balance', 'status')
+
+# This function retrieves intern information by their Telegram handle
+# Current interns are answered from the intern cache when one is installed; other reads go to the replica when
+# configured. primary=True is for checks a decision relies on and always reads the primary.
+# Concurrent lookups of the same handle share one query
+def get_intern_by_telegram(telegram_handle, primary=False):
+    if not primary and intern_cache is not None:
+        cached = intern_cache.get(telegram_handle)
+        if cached is not None:
+            return cached
+    return _lookups.do(('get_intern_by_telegram', telegram_handle, primary), _query_intern_by_telegram, telegram_handle, primary)
+
+# Async handlers' form of get_intern_by_telegram: the query runs off the event loop and joins the same flights
+async def get_intern_by_telegram_async(telegram_handle, primary=False):
+    if not primary and intern_cache is not None:
+        cached = intern_cache.get(telegram_handle)
+        if cached is not None:
+            return cached
+    return await _lookups.do_async(('get_intern_by_telegram', telegram_handle, primary), _query_intern_by_telegram,
+                                   telegram_handle, primary)
+
+def _query_intern_by_telegram(telegram_handle, primary):
+    conn = None
+    try:
+        conn = get_connection() if primary else get_read_connection(telegram_handle)
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(INTERN_PROFILE_COLUMNS)}
+            FROM interns_new 
+            WHERE telegram_handle = %s
+            ORDER BY status = 'Active' DESC, status = 'Pending Start' DESC, id DESC
+            LIMIT 1
+        """, (telegram_handle,))
+        intern = cursor.fetchone()
+        if intern:
+            return dict(zip(INTERN_PROFILE_COLUMNS, intern))
+        return None
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function streams the profiles of current (Active or Pending Start) interns, one row per telegram handle
+# preferring the Active internship, through a server-side cursor so the whole roster is never held twice.
+# handles limits it to those handles. Reads the primary, which change notifications describe.
+# Yields tuples in INTERN_PROFILE_COLUMNS order; a database error is raised to the caller
+def iter_current_interns(handles=None, batch_size=2000):
+    conn = get_connection()
+    try:
+        cursor = conn.cursor(name='current_interns')
+        cursor.itersize = batch_size
+        cursor.execute(f"""
+            SELECT DISTINCT ON (telegram_handle) {', '.join(INTERN_PROFILE_COLUMNS)}
+            FROM interns_new
+            WHERE status IN ('Active', 'Pending Start')
+            AND telegram_handle IS NOT NULL
+            AND (%(handles)s::text[] IS NULL OR telegram_handle = ANY(%(handles)s))
+            ORDER BY telegram_handle, status = 'Active' DESC, id DESC
+        """, {'handles': list(handles) if handles is not None else None})
+        yield from cursor
+        cursor.close()
+    finally:
+        conn.rollback()
+        release_connection(conn)
+
+# This function opens a connection of its own (outside the pool) that listens on channel
+# The caller polls it for notifications and closes it
+def open_listen_connection(channel):
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    conn.cursor().execute(f"LISTEN {channel}")
+    return conn
+
+# This function updates the leave balance in the database
+def update_leave_balance(username, balance_type, leave_duration, taken_type, application_id=None):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        # Deduct leave balance and update leave taken field, recording the change in the ledger
+        _apply_balance_change(cursor, username, 'deduct', balance_type, taken_type, leave_duration, application_id)
+
+        _apply_entitlement_rollup(cursor, username, balance_type, -leave_duration)
+
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function is used to just update the leave taken field in the database (for leaves that are not AL or MC)
+def update_leave_taken(username, leave_duration, taken_type, application_id=None):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        # Update leave taken field, recording the change in the ledger
+        _apply_balance_change(cursor, username, 'deduct', None, taken_type, leave_duration, application_id)
+
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function builds the leave_logs_new row of an application, in the column order of LEAVE_LOG_COLUMNS
+def _leave_log_row(application):
+    return (
+        application['id'],
+        application['employee_name'],
+        application['submission_time'],
+        application.get('decision_time', None),
+        application['leave_type'],
+        adapt_date(application['start_date']),
+        adapt_date(application['end_date']),
+        application['leave_duration'],
+        application['day_portion'],
+        application['status'],
+        application["remarks"],
+        application.get('username'),
+        application.get('chat_id'),
+        application.get('supervisor_email'),
+        application.get('balance_type'),
+        application.get('taken_type')
+    )
+
+# This function saves a leave application to the database when it is submitted (as Pending)
+# Decisions and cancellations go through transition_leave_status
+def save_leave_application(application):
+    return save_leave_applications([application])
+
+# This function saves many leave applications with one multi-row INSERT and one commit (used by the
+# write-behind buffer in leave_log_writer.py); an application that is already saved is left as it is.
+# The conflict target is the primary key (application_id, start_date), as a partitioned table cannot have a unique
+# index without the partition key. It still catches every resave: nothing updates start_date, so each save of an
+# application carries the key it was first saved with, and ids (a timestamp and a random part, see
+# confirmation_handler in intern_bot.py) are not shared between applications.
+# Returns True when every row is saved, False when the batch failed and nothing was written
+def save_leave_applications(applications):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        inserted = execute_values(cursor, f"""
+            INSERT INTO leave_logs_new ({", ".join(LEAVE_LOG_COLUMNS)})
+            VALUES %s
+            ON CONFLICT (application_id, start_date) DO NOTHING
+            RETURNING application_id
+        """, [_leave_log_row(application) for application in applications], page_size=len(applications), fetch=True)
+        inserted_ids = {row[0] for row in inserted}
+
+        # Keep the usage rollup in step with approved leaves
+        for application in applications:
+            if application['id'] in inserted_ids and application['status'] in APPROVED_STATUSES:
+                _apply_usage_rollup(cursor, application['employee_name'], application['leave_type'],
+                                    application['start_date'], application['end_date'],
+                                    application['leave_duration'], 1)
+
+        conn.commit()
+        for application in applications:
+            mark_recent_write(application.get('username'))
+        logger.debug("Saved %s leave application(s) in leave_logs_new (%s new)", len(applications), len(inserted_ids))
+        return True
+    except Exception as e:
+        logger.error("Database error while saving leave application(s) %s: %s",
+                     ", ".join(application['id'] for application in applications), e)
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# Condition matching one application of leave_logs_new (aliased l) by %(application_id)s and, when it is not NULL,
+# %(start_date)s. application_id alone is not the partition key, so it is looked up in the primary key index of every
+# yearly partition; psycopg2 sends the parameters inline, so with a start_date the planner folds the condition to
+# l.start_date = <date> and prunes all other partitions
+LEAVE_APPLICATION_MATCH_SQL = """
+    l.application_id = %(application_id)s
+    AND (%(start_date)s::date IS NULL OR l.start_date = %(start_date)s::date)
+"""
+
+# Leave status machine: the statuses an application may move to from each status
+LEAVE_STATUS_TRANSITIONS = {
+    'Pending': ('Approved', 'Rejected', 'Auto-Approved', 'Auto-Rejected', 'Expired'),
+    'Approved': ('Cancelled',),
+    'Auto-Approved': ('Cancelled',)
+}
+
+# Why an approval was turned down by the checks in transition_leave_status: reason is 'insufficient balance' or
+# 'overlapping leave', message the details for the supervisor and the intern
+LeaveRefusal = namedtuple('LeaveRefusal', ('reason', 'message'))
+
+# This function checks an approval inside the deciding transaction. The intern's rows are locked first, the same
+# rows the deduction locks, so another approval or cancellation for the intern has either committed (and is seen
+# here) or waits until this transaction ends. Returns None when the application may be approved, else a LeaveRefusal
+def _approval_refusal(cursor, application_id, employee_name, telegram_handle, leave_type, start_date, end_date,
+                      day_portion, leave_duration):
+    cursor.execute("SELECT id FROM interns_new WHERE telegram_handle = %s ORDER BY id FOR UPDATE", (telegram_handle,))
+    cursor.execute(f"""
+        SELECT {", ".join(f"COALESCE({column}, 0)" for column in LEDGER_BALANCE_COLUMNS)}
+        FROM interns_new
+        WHERE telegram_handle = %s
+        ORDER BY status = 'Active' DESC, status = 'Pending Start' DESC, id DESC
+        LIMIT 1
+    """, (telegram_handle,))
+    row = cursor.fetchone()
+    balances = dict(zip(LEDGER_BALANCE_COLUMNS, row or (0,) * len(LEDGER_BALANCE_COLUMNS)))
+    message = check_leave_balance(leave_type, leave_duration, balances)
+    if message:
+        return LeaveRefusal('insufficient balance', message)
+
+    overlapping_leave = _find_overlapping_leave(cursor, employee_name, start_date, end_date, application_id,
+                                                APPROVED_STATUSES, day_portion)
+    if overlapping_leave:
+        return LeaveRefusal('overlapping leave', f"It overlaps an approved {overlapping_leave['leave_type']} from "
+                                                 f"{overlapping_leave['start_date']} to {overlapping_leave['end_date']}.")
+    return None
+
+# This function moves a leave application to new_status with one conditional UPDATE that only matches while
+# the current status may still move there, so of several concurrent deciders (supervisor link, auto-approval
+# job, other web workers) exactly one wins. The winner's balance change and rollups commit in the same transaction.
+# notifications (see _enqueue_notifications) are queued in that transaction too, so only the winner's are sent.
+# An approval is first checked against the intern's balance and approved leaves under the intern's row lock (see
+# _approval_refusal). When the check fails the application moves to refusal_status instead, with the reason in
+# its remarks and refusal_notifications(refusal) queued in place of notifications; without a refusal_status
+# nothing is written.
+# Returns (decided, status, refusal): (True, new_status, None) for the winner, (True, refusal_status, refusal)
+# for a refused approval and (False, current_status, refusal) otherwise; current_status is None when the
+# application does not exist or the database failed, and refusal is only set when the approval checks failed.
+# start_date, when the caller knows it, confines every statement to the application's partition (see
+# LEAVE_APPLICATION_MATCH_SQL); without it each one probes the primary key index of every partition
+def transition_leave_status(application_id, new_status, remarks=None, remarks_suffix=None, decision_time=None,
+                            telegram_handle=None, notifications=None, refusal_status=None, refusal_notifications=None,
+                            start_date=None):
+    expected_statuses = [status for status, targets in LEAVE_STATUS_TRANSITIONS.items() if new_status in targets]
+    if not expected_statuses:
+        raise ValueError(f"No transition leads to status {new_status}")
+    if refusal_status is not None and (refusal_status not in LEAVE_STATUS_TRANSITIONS['Pending']
+                                       or refusal_status in APPROVED_STATUSES):
+        raise ValueError(f"An approval cannot be refused with status {refusal_status}")
+
+    start_date = adapt_date(start_date)
+    conn = None
+    refusal = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        if new_status in APPROVED_STATUSES:
+            # Lock the application, then its intern, in the order every decision and cancellation takes them
+            cursor.execute(f"""
+                SELECT l.name,
+                       COALESCE(l.telegram_handle,
+                                (SELECT i.telegram_handle FROM interns_new i WHERE i.name = l.name ORDER BY i.id DESC LIMIT 1)),
+                       l.leave_type, l.start_date, l.end_date, l.day_portion, l.number_of_leaves_taken, l.status
+                FROM leave_logs_new l
+                WHERE {LEAVE_APPLICATION_MATCH_SQL}
+                AND l.status = ANY(%(expected_statuses)s)
+                FOR UPDATE OF l
+            """, {'application_id': application_id, 'start_date': start_date, 'expected_statuses': expected_statuses})
+            row = cursor.fetchone()
+            if row is not None:
+                refusal = _approval_refusal(cursor, application_id, *row[:7])
+            if refusal is not None:
+                if refusal_status is None:
+                    conn.rollback()
+                    return False, row[7], refusal
+                new_status = refusal_status
+                remarks = f"Auto-rejected due to {refusal.reason}: {refusal.message}"
+                remarks_suffix = None
+                notifications = refusal_notifications(refusal) if refusal_notifications else None
+
+        cursor.execute(f"""
+            UPDATE leave_logs_new l
+            SET status = %(new_status)s,
+                supervisor_review = COALESCE(%(decision_time)s, l.supervisor_review),
+                remarks = CASE
+                    WHEN %(remarks)s::text IS NOT NULL THEN %(remarks)s
+                    WHEN %(remarks_suffix)s::text IS NOT NULL THEN CONCAT(l.remarks, %(remarks_suffix)s)
+                    ELSE l.remarks
+                END
+            WHERE {LEAVE_APPLICATION_MATCH_SQL}
+            AND l.status = ANY(%(expected_statuses)s)
+            RETURNING l.name,
+                      COALESCE(l.telegram_handle,
+                               (SELECT i.telegram_handle FROM interns_new i WHERE i.name = l.name ORDER BY i.id DESC LIMIT 1)),
+                      l.leave_type, l.start_date, l.end_date, l.number_of_leaves_taken, l.balance_type, l.taken_type
+        """, {
+            'application_id': application_id,
+            'start_date': start_date,
+            'new_status': new_status,
+            'decision_time': decision_time,
+            'remarks': remarks,
+            'remarks_suffix': remarks_suffix,
+            'expected_statuses': expected_statuses
+        })
+        row = cursor.fetchone()
+
+        if row is None:
+            # Lost the race, or the transition is not allowed from the current status
+            conn.rollback()
+            cursor.execute(f"SELECT l.status FROM leave_logs_new l WHERE {LEAVE_APPLICATION_MATCH_SQL}",
+                           {'application_id': application_id, 'start_date': start_date})
+            current = cursor.fetchone()
+            conn.rollback()
+            return False, current[0] if current else None, None
+
+        employee_name, stored_handle, leave_type, start_date, end_date, leave_duration, balance_type, taken_type = row
+        telegram_handle = telegram_handle or stored_handle
+
+        # Applications saved before leave_logs_new stored the columns take them from the leave type's policy
+        if not balance_type and not taken_type and leave_type in LEAVE_TYPES:
+            balance_type, taken_type = LEAVE_TYPES[leave_type].balance_column, LEAVE_TYPES[leave_type].taken_column
+
+        if new_status in APPROVED_STATUSES:
+            # Deduct leave balance and update leave taken field, recording the change in the ledger
+            if balance_type or taken_type:
+                _apply_balance_change(cursor, telegram_handle, 'deduct', balance_type or None, taken_type or None,
+                                      leave_duration, application_id)
+            if balance_type:
+                _apply_entitlement_rollup(cursor, telegram_handle, balance_type, -leave_duration)
+            _apply_usage_rollup(cursor, employee_name, leave_type, start_date, end_date, leave_duration, 1)
+
+        elif new_status == 'Cancelled':
+            # Restore exactly what the approval deducted, recording the change in the ledger
+            if balance_type or taken_type:
+                _apply_balance_change(cursor, telegram_handle, 'restore', balance_type or None, taken_type or None,
+                                      leave_duration, application_id)
+            if balance_type:
+                _apply_entitlement_rollup(cursor, telegram_handle, balance_type, leave_duration)
+            # Take the leave back out of the rollups (only approved leaves can be cancelled)
+            _apply_usage_rollup(cursor, employee_name, leave_type, start_date, end_date, leave_duration, -1)
+
+        _enqueue_notifications(cursor, notifications)
+        conn.commit()
+        mark_recent_write(telegram_handle)
+        logger.info("Leave application %s moved to %s", application_id, new_status)
+        return True, new_status, refusal
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while moving leave application %s to %s: %s", application_id, new_status, e)
+        return False, None, None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# Most decisions one bulk request may carry
+MAX_BULK_DECISIONS = 200
+
+# This function applies a supervisor's approve/reject decisions for many pending applications in one transaction.
+# decisions is a list of (application_id, action) with action 'approve' or 'reject', applied in the order given.
+# Every step is one set-based statement over the whole batch, so the number of statements (and locks taken in
+# application_id order) does not grow with the batch:
+#   1. lock the supervisor's requested applications that are still Pending, then their interns' rows
+#   2. decide each one: approvals are rejected when they overlap an approved leave or an earlier approval in
+#      the batch, or when the running total of the batch's approvals exceeds the intern's balance
+#   3. write the statuses, 4. deduct balances and append the ledger events, 5. update both rollups
+# Returns a list of dicts per requested application (in request order) with 'outcome' one of 'Approved',
+# 'Rejected', 'not_found' or the status it already had, plus 'reason' for automatic rejections.
+# notifications_for(result) returns the notifications for each decided application, queued before the commit;
+# returns None on a database error, in which case nothing was applied
+def bulk_decide_leave_applications(supervisor_email, decisions, decision_time=None, notifications_for=None):
+    if len(decisions) > MAX_BULK_DECISIONS:
+        raise ValueError(f"At most {MAX_BULK_DECISIONS} decisions per request")
+    if any(action not in ('approve', 'reject') for _, action in decisions):
+        raise ValueError("Bulk decisions must be 'approve' or 'reject'")
+
+    application_ids = [application_id for application_id, _ in decisions]
+    actions = [action for _, action in decisions]
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        # 1. Lock the rows up front, in a fixed order, so concurrent bulk and single decisions cannot deadlock;
+        # a single link click arriving meanwhile waits here and then finds the application decided.
+        # The review form only posts application ids, so each partition's primary key index is probed for the batch
+        # (at most MAX_BULK_DECISIONS ids, once per request); the later steps find the rows locked here by their full key
+        cursor.execute("""
+            SELECT l.application_id, l.start_date,
+                   COALESCE(l.telegram_handle,
+                            (SELECT i.telegram_handle FROM interns_new i WHERE i.name = l.name ORDER BY i.id DESC LIMIT 1))
+            FROM leave_logs_new l
+            WHERE l.application_id = ANY(%s)
+            AND l.supervisor_email = %s
+            AND l.status = 'Pending'
+            ORDER BY l.application_id
+            FOR UPDATE OF l
+        """, (application_ids, supervisor_email))
+        locked = cursor.fetchall()
+        start_dates = {application_id: start_date for application_id, start_date, _ in locked}
+        telegram_handles = sorted({telegram_handle for _, _, telegram_handle in locked if telegram_handle})
+
+        # Then their interns, as a single approval does, so the balances read in step 2 cannot change before the
+        # deductions in step 4: another approval or cancellation for these interns waits for this transaction
+        cursor.execute("""
+            SELECT id FROM interns_new
+            WHERE telegram_handle = ANY(%s)
+            ORDER BY id
+            FOR UPDATE
+        """, (telegram_handles,))
+
+        # 2. Decide every application of the batch in one query
+        cursor.execute("""
+            CREATE TEMPORARY TABLE bulk_decisions ON COMMIT DROP AS
+            WITH requested AS (
+                SELECT DISTINCT ON (application_id) application_id, start_date, action, ord
+                FROM unnest(%(application_ids)s::text[], %(start_dates)s::date[], %(actions)s::text[])
+                    WITH ORDINALITY AS r(application_id, start_date, action, ord)
+                ORDER BY application_id, ord
+            ),
+            policies AS (
+                SELECT *
+                FROM unnest(%(policy_types)s::text[], %(policy_balance_columns)s::text[], %(policy_taken_columns)s::text[])
+                    AS p(leave_type, balance_column, taken_column)
+            ),
+            candidates AS (
+                SELECT l.application_id, r.action, r.ord, l.name, l.chat_id, l.leave_type, l.start_date, l.end_date,
+                       leave_slot(l.start_date, l.end_date, l.day_portion) AS leave_slot,
+                       l.number_of_leaves_taken AS leave_duration,
+                       COALESCE(l.telegram_handle,
+                                (SELECT i.telegram_handle FROM interns_new i WHERE i.name = l.name ORDER BY i.id DESC LIMIT 1))
+                           AS telegram_handle,
+                       -- Applications saved before the columns were stored take them from the leave type's policy
+                       COALESCE(NULLIF(l.balance_type, ''), p.balance_column) AS balance_type,
+                       COALESCE(NULLIF(l.taken_type, ''), p.taken_column) AS taken_type
+                FROM requested r
+                JOIN leave_logs_new l ON l.application_id = r.application_id AND l.start_date = r.start_date
+                LEFT JOIN policies p ON p.leave_type = l.leave_type
+                WHERE l.supervisor_email = %(supervisor_email)s
+                AND l.status = 'Pending'
+            ),
+            checked AS (
+                SELECT c.*,
+                       CASE c.balance_type
+                           WHEN 'al_balance' THEN b.al_balance
+                           WHEN 'mc_balance' THEN b.mc_balance
+                           WHEN 'compassionate_balance' THEN b.compassionate_balance
+                           WHEN 'oil_balance' THEN b.oil_balance
+                       END AS current_balance,
+                       c.action = 'approve' AND (
+                           EXISTS (
+                               SELECT 1 FROM leave_logs_new a
+                               WHERE a.name = c.name
+                               AND a.status IN ('Approved', 'Auto-Approved')
+                               AND leave_slot(a.start_date, a.end_date, a.day_portion) && c.leave_slot
+                           )
+                           OR EXISTS (
+                               SELECT 1 FROM candidates e
+                               WHERE e.name = c.name
+                               AND e.action = 'approve'
+                               AND e.ord < c.ord
+                               AND e.leave_slot && c.leave_slot
+                           )
+                       ) AS overlaps
+                FROM candidates c
+                LEFT JOIN LATERAL (
+                    SELECT COALESCE(al_balance, 0) AS al_balance, COALESCE(mc_balance, 0) AS mc_balance,
+                           COALESCE(compassionate_balance, 0) AS compassionate_balance, COALESCE(oil_balance, 0) AS oil_balance
+                    FROM interns_new
+                    WHERE telegram_handle = c.telegram_handle
+                    ORDER BY id DESC
+                    LIMIT 1
+                ) b ON TRUE
+            ),
+            totalled AS (
+                SELECT k.*,
+                       SUM(CASE WHEN k.action = 'approve' AND NOT k.overlaps THEN k.leave_duration ELSE 0 END)
+                           OVER (PARTITION BY k.telegram_handle, k.balance_type ORDER BY k.ord) AS running_total
+                FROM checked k
+            )
+            SELECT t.application_id, t.ord, t.name, t.chat_id, t.telegram_handle, t.leave_type, t.start_date,
+                   t.end_date, t.leave_duration, t.balance_type, t.taken_type,
+                   CASE
+                       WHEN t.action = 'reject' THEN 'Rejected'
+                       WHEN t.overlaps THEN 'Rejected'
+                       WHEN t.leave_type = ANY(%(balance_checked_types)s)
+                            AND t.balance_type IS NOT NULL AND t.running_total > COALESCE(t.current_balance, 0) THEN 'Rejected'
+                       ELSE 'Approved'
+                   END AS outcome,
+                   CASE
+                       WHEN t.action = 'reject' THEN NULL
+                       WHEN t.overlaps THEN 'overlapping leave'
+                       WHEN t.leave_type = ANY(%(balance_checked_types)s)
+                            AND t.balance_type IS NOT NULL AND t.running_total > COALESCE(t.current_balance, 0) THEN 'insufficient balance'
+                   END AS reason,
+                   t.current_balance
+            FROM totalled t
+        """, {
+            'application_ids': application_ids,
+            'start_dates': [start_dates.get(application_id) for application_id in application_ids],
+            'actions': actions,
+            'supervisor_email': supervisor_email,
+            'balance_checked_types': [leave_type for leave_type, policy in LEAVE_TYPES.items() if policy.checks_balance],
+            'policy_types': list(LEAVE_TYPES),
+            'policy_balance_columns': [policy.balance_column for policy in LEAVE_TYPES.values()],
+            'policy_taken_columns': [policy.taken_column for policy in LEAVE_TYPES.values()]
+        })
+
+        # 3. Write the outcomes; approvals get the same breakdown remark as a single approval, worded by
+        # leave_breakdown_remarks so half days and weekend days are counted the same way
+        cursor.execute("""
+            SELECT application_id, leave_type, start_date, end_date, leave_duration
+            FROM bulk_decisions
+            WHERE outcome = 'Approved'
+        """)
+        breakdowns = [
+            (application_id, leave_breakdown_remarks(leave_type, start_date, end_date, leave_duration))
+            for application_id, leave_type, start_date, end_date, leave_duration in cursor.fetchall()
+        ]
+        breakdowns = [(application_id, remarks) for application_id, remarks in breakdowns if remarks]
+        cursor.execute("""
+            UPDATE leave_logs_new l
+            SET status = d.outcome,
+                supervisor_review = COALESCE(%s, l.supervisor_review),
+                remarks = CASE
+                    WHEN d.reason = 'insufficient balance' THEN
+                        'Auto-rejected due to insufficient balance: Current: ' || d.current_balance
+                        || ' days, Required: ' || d.leave_duration || ' days.'
+                    WHEN d.reason IS NOT NULL THEN 'Auto-rejected due to ' || d.reason || '.'
+                    WHEN b.remarks IS NOT NULL THEN b.remarks
+                    ELSE l.remarks
+                END
+            FROM bulk_decisions d
+            LEFT JOIN unnest(%s::text[], %s::text[]) AS b(application_id, remarks) ON b.application_id = d.application_id
+            WHERE l.application_id = d.application_id
+            AND l.start_date = d.start_date
+        """, (decision_time, [application_id for application_id, _ in breakdowns], [remarks for _, remarks in breakdowns]))
+
+        # 4. Deduct the approved leaves from interns_new and append their ledger events in one statement
+        balance_sums = ", ".join(
+            f"SUM(leave_duration) FILTER (WHERE balance_type = '{column}') AS {column}" for column in LEDGER_BALANCE_COLUMNS
+        )
+        taken_sums = ", ".join(
+            f"SUM(leave_duration) FILTER (WHERE taken_type = '{column}') AS {column}" for column in LEDGER_TAKEN_COLUMNS
+        )
+        set_clauses = ", ".join(
+            [f"{column} = COALESCE(n.{column}, 0) - COALESCE(t.{column}, 0)" for column in LEDGER_BALANCE_COLUMNS]
+            + [f"{column} = COALESCE(n.{column}, 0) + COALESCE(t.{column}, 0)" for column in LEDGER_TAKEN_COLUMNS]
+        )
+        cursor.execute(f"""
+            WITH approved AS (
+                SELECT * FROM bulk_decisions WHERE outcome = 'Approved'
+            ),
+            totals AS (
+                SELECT telegram_handle, {balance_sums}, {taken_sums}
+                FROM approved
+                GROUP BY telegram_handle
+            ),
+            changed AS (
+                UPDATE interns_new n
+                SET {set_clauses}
+                FROM totals t
+                WHERE n.telegram_handle = t.telegram_handle
+                RETURNING n.id, n.telegram_handle
+            )
+            INSERT INTO leave_events (intern_id, telegram_handle, event_type, balance_column, balance_delta,
+                                      taken_column, taken_delta, application_id)
+            SELECT c.id, c.telegram_handle, 'deduct', a.balance_type,
+                   CASE WHEN a.balance_type IS NULL THEN 0 ELSE -a.leave_duration END,
+                   a.taken_type,
+                   CASE WHEN a.taken_type IS NULL THEN 0 ELSE a.leave_duration END,
+                   a.application_id
+            FROM changed c
+            JOIN approved a ON a.telegram_handle = c.telegram_handle
+        """)
+
+        # 5. Add the approved leaves to the usage rollup and take them off the supervisors' remaining entitlement
+        cursor.execute("""
+            INSERT INTO leave_usage_rollup (month, leave_type, supervisor_email, days_taken, applications)
+            SELECT date_trunc('month', x.day)::date, x.leave_type, x.supervisor_email, SUM(x.amount),
+                   COUNT(DISTINCT x.application_id) FILTER (
+                       WHERE date_trunc('month', x.day) = date_trunc('month', x.start_date)
+                   )
+            FROM (
+                SELECT d.application_id, d.leave_type, d.start_date, COALESCE(s.supervisor_email, '') AS supervisor_email,
+                       g.day, CASE WHEN d.start_date = d.end_date THEN d.leave_duration ELSE 1 END AS amount
+                FROM bulk_decisions d
+                LEFT JOIN LATERAL (
+                    SELECT supervisor_email FROM interns_new
+                    WHERE name = d.name
+                    ORDER BY id DESC
+                    LIMIT 1
+                ) s ON TRUE
+                CROSS JOIN generate_series(d.start_date, d.end_date, interval '1 day') AS g(day)
+                WHERE d.outcome = 'Approved'
+                AND (d.start_date = d.end_date OR EXTRACT(ISODOW FROM g.day) < 6)
+            ) x
+            GROUP BY 1, 2, 3
+            ON CONFLICT (month, supervisor_email, leave_type) DO UPDATE
+            SET days_taken = leave_usage_rollup.days_taken + EXCLUDED.days_taken,
+                applications = leave_usage_rollup.applications + EXCLUDED.applications
+        """)
+        entitlement_sums = ", ".join(
+            f"SUM(d.leave_duration) FILTER (WHERE d.balance_type = '{column}') AS {column}" for column in LEDGER_BALANCE_COLUMNS
+        )
+        entitlement_clauses = ", ".join(
+            f"{column} = r.{column} - COALESCE(t.{column}, 0)" for column in LEDGER_BALANCE_COLUMNS
+        )
+        cursor.execute(f"""
+            UPDATE entitlement_rollup r
+            SET {entitlement_clauses}
+            FROM (
+                SELECT i.supervisor_email, {entitlement_sums}
+                FROM bulk_decisions d
+                JOIN LATERAL (
+                    SELECT COALESCE(supervisor_email, '') AS supervisor_email FROM interns_new
+                    WHERE telegram_handle = d.telegram_handle
+                    AND status IN ('Active', 'Pending Start')
+                    ORDER BY id DESC
+                    LIMIT 1
+                ) i ON TRUE
+                WHERE d.outcome = 'Approved'
+                GROUP BY i.supervisor_email
+            ) t
+            WHERE r.supervisor_email = t.supervisor_email
+        """)
+
+        # Report every requested application, including those that were not this supervisor's or no longer pending
+        # (those are only known by id, so this probes every partition as step 1 does)
+        cursor.execute("""
+            SELECT r.application_id, d.outcome, d.reason, l.status, l.supervisor_email,
+                   d.name, d.chat_id, d.telegram_handle, d.leave_type, d.start_date, d.end_date, d.leave_duration
+            FROM unnest(%s::text[]) WITH ORDINALITY AS r(application_id, ord)
+            LEFT JOIN bulk_decisions d ON d.application_id = r.application_id
+            LEFT JOIN leave_logs_new l ON l.application_id = r.application_id
+            ORDER BY r.ord
+        """, (application_ids,))
+        rows = cursor.fetchall()
+
+        results = []
+        reported = set()
+        for (application_id, outcome, reason, status, owner, name, chat_id, telegram_handle,
+             leave_type, start_date, end_date, leave_duration) in rows:
+            if application_id in reported:
+                continue
+            reported.add(application_id)
+            if outcome is None:
+                # Someone else's application is reported as missing rather than revealing its status
+                outcome = status if status and owner == supervisor_email else 'not_found'
+            results.append({
+                'application_id': application_id,
+                'outcome': outcome,
+                'reason': reason,
+                'employee_name': name,
+                'chat_id': chat_id,
+                'telegram_handle': telegram_handle,
+                'leave_type': leave_type,
+                'start_date': start_date,
+                'end_date': end_date,
+                'leave_duration': leave_duration
+            })
+
+        # The interns are told through the outbox, committed with their decisions
+        if notifications_for is not None:
+            _enqueue_notifications(cursor, [
+                notification
+                for result in results if result['employee_name'] is not None
+                for notification in notifications_for(result)
+            ])
+        conn.commit()
+        for result in results:
+            mark_recent_write(result['telegram_handle'])
+        logger.info("Bulk decision by %s: %d application(s), %d decided", supervisor_email, len(results),
+                    sum(1 for result in results if result['employee_name']))
+        return results
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error while applying bulk decisions for %s: %s", supervisor_email, e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function lists a supervisor's pending leave applications, oldest first, for /pending and the review page.
+# It pages by keyset rather than OFFSET: after_application_id is the last application of the previous page and the
+# next page starts right after its (submission_date, application_id), so every page is one index range scan no
+# matter how deep it is, and applications decided in the meantime do not shift the pages.
+def get_pending_leave_applications(supervisor_email, after_application_id=None, limit=MAX_BULK_DECISIONS):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT application_id, name, leave_type, start_date, end_date, day_portion, number_of_leaves_taken, submission_date
+            FROM leave_logs_new
+            WHERE supervisor_email = %(supervisor_email)s
+            AND status = 'Pending'
+            -- The cursor row is found by application_id alone (one primary key probe per partition, once per page):
+            -- the cursor travels in Telegram callback data, which has no room for a start_date as well
+            AND (%(after)s::text IS NULL OR (submission_date, application_id) > (
+                SELECT submission_date, application_id FROM leave_logs_new WHERE application_id = %(after)s LIMIT 1
+            ))
+            ORDER BY submission_date, application_id
+            LIMIT %(limit)s
+        """, {'supervisor_email': supervisor_email, 'after': after_application_id, 'limit': limit})
+        return [
+            {
+                'application_id': row[0],
+                'employee_name': row[1],
+                'leave_type': row[2],
+                'start_date': row[3],
+                'end_date': row[4],
+                'day_portion': row[5],
+                'leave_duration': row[6],
+                'submission_date': row[7]
+            }
+            for row in cursor.fetchall()
+        ]
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function removes a pending application that never reached the supervisor
+def discard_pending_application(application_id, start_date=None):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            DELETE FROM leave_logs_new l
+            WHERE {LEAVE_APPLICATION_MATCH_SQL}
+            AND l.status = 'Pending'
+        """, {'application_id': application_id, 'start_date': adapt_date(start_date)})
+        conn.commit()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Database error: %s", e)
+        return False
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function returns the first pending or approved leave of an intern that overlaps the given dates and
+# day portion (see leave_slot), or None when they are free; it is a single probe on the GiST index over the
+# leaves' slots (the start_date bound lets the planner skip partitions of later years)
+def find_overlapping_leave(employee_name, start_date, end_date, exclude_application_id=None,
+                           statuses=('Pending',) + APPROVED_STATUSES, day_portion="Full Day"):
+    conn = None
+    try:
+        conn = get_connection()
+        return _find_overlapping_leave(conn.cursor(), employee_name, start_date, end_date, exclude_application_id,
+                                       statuses, day_portion)
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function is find_overlapping_leave on a cursor, for checks that have to see the caller's transaction
+def _find_overlapping_leave(cursor, employee_name, start_date, end_date, exclude_application_id=None,
+                            statuses=('Pending',) + APPROVED_STATUSES, day_portion="Full Day"):
+    cursor.execute("""
+        SELECT application_id, leave_type, start_date, end_date, day_portion, status
+        FROM leave_logs_new
+        WHERE name = %s
+        AND leave_slot(start_date, end_date, day_portion) && leave_slot(%s, %s, %s)
+        AND start_date <= %s
+        AND status IN ('Pending', 'Approved', 'Auto-Approved')
+        AND status = ANY(%s)
+        AND application_id IS DISTINCT FROM %s
+        ORDER BY start_date
+        LIMIT 1
+    """, (employee_name, adapt_date(start_date), adapt_date(end_date), day_portion, adapt_date(end_date),
+          list(statuses), exclude_application_id))
+    row = cursor.fetchone()
+    if row:
+        return {
+            'application_id': row[0],
+            'leave_type': row[1],
+            'start_date': row[2],
+            'end_date': row[3],
+            'day_portion': row[4],
+            'status': row[5]
+        }
+    return None
+
+# This function retrieves a supervisor's current interns and their approved leaves within a date window
+# The leave lookup is one range query on the GiST index over leave_period
+def get_team_leaves(supervisor_email, start_date, end_date):
+    conn = None
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, name, telegram_handle
+            FROM interns_new
+            WHERE supervisor_email = %s
+            AND status IN ('Active', 'Pending Start')
+            ORDER BY name
+        """, (supervisor_email,))
+        interns = [{'id': row[0], 'name': row[1], 'telegram_handle': row[2]} for row in cursor.fetchall()]
+        if not interns:
+            return [], []
+
+        cursor.execute("""
+            SELECT name, leave_type, start_date, end_date, day_portion
+            FROM leave_logs_new
+            WHERE name = ANY(%s)
+            AND leave_period && daterange(%s, %s, '[]')
+            AND start_date <= %s
+            AND status IN ('Approved', 'Auto-Approved')
+        """, ([intern['name'] for intern in interns], adapt_date(start_date), adapt_date(end_date), adapt_date(end_date)))
+        leaves = [
+            {'name': row[0], 'leave_type': row[1], 'start_date': row[2], 'end_date': row[3], 'day_portion': row[4]}
+            for row in cursor.fetchall()
+        ]
+        return interns, leaves
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return None, None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function retrieves the status of a leave application by its ID (and start_date when known, see
+# LEAVE_APPLICATION_MATCH_SQL)
+def get_leave_application(application_id, start_date=None):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT l.status FROM leave_logs_new l WHERE {LEAVE_APPLICATION_MATCH_SQL}",
+                       {'application_id': application_id, 'start_date': adapt_date(start_date)})
+        result = cursor.fetchone()
+        if result:
+            return result[0]
+        return None
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function loads a leave application with the fields of an in-memory LeaveApplication,
+# so a web worker without access to the bot's registry can decide it; returns None if it does not exist.
+# start_date, from an approval link, confines the lookup to the application's partition
+def get_leave_application_details(application_id, start_date=None):
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT l.application_id, l.telegram_handle, l.chat_id, l.name, l.supervisor_email, l.leave_type,
+                   l.start_date, l.end_date, l.day_portion, l.number_of_leaves_taken, l.status,
+                   l.submission_date, l.supervisor_review, l.balance_type, l.taken_type, l.remarks
+            FROM leave_logs_new l
+            WHERE {LEAVE_APPLICATION_MATCH_SQL}
+        """, {'application_id': application_id, 'start_date': adapt_date(start_date)})
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'username': row[1],
+            'chat_id': row[2],
+            'employee_name': row[3],
+            'supervisor_email': row[4],
+            'leave_type': row[5],
+            'start_date': row[6],
+            'end_date': row[7],
+            'day_portion': row[8],
+            'leave_duration': row[9],
+            'status': row[10],
+            'submission_time': row[11].strftime("%Y-%m-%d %H:%M:%S") if row[11] else None,
+            'decision_time': row[12].strftime("%Y-%m-%d %H:%M:%S") if row[12] else None,
+            'balance_type': row[13],
+            'taken_type': row[14],
+            'remarks': row[15]
+        }
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function retrieves all approved leaves for a given intern by their Telegram handle
+# Concurrent lookups of the same handle share one query
+def get_approved_leaves(telegram_handle):
+    return _lookups.do(('get_approved_leaves', telegram_handle), _query_approved_leaves, telegram_handle)
+
+# Async handlers' form of get_approved_leaves
+async def get_approved_leaves_async(telegram_handle):
+    return await _lookups.do_async(('get_approved_leaves', telegram_handle), _query_approved_leaves, telegram_handle)
+
+def _query_approved_leaves(telegram_handle):
+    conn = None
+    try:
+        conn = get_read_connection(telegram_handle)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT application_id, name, leave_type, start_date, end_date, 
+                   number_of_leaves_taken, day_portion, status, remarks
+            FROM leave_logs_new  
+            WHERE name = (SELECT name FROM interns_new WHERE telegram_handle = %s)
+            AND status IN ('Approved', 'Auto-Approved')
+            AND start_date >= CURRENT_DATE
+            ORDER BY start_date ASC
+        """, (telegram_handle,))
+        
+        leaves = []
+        for row in cursor.fetchall():
+            leaves.append({
+                'application_id': row[0],
+                'name': row[1],
+                'leave_type': row[2],
+                'start_date': row[3],
+                'end_date': row[4],
+                'leave_duration': row[5],
+                'day_portion': row[6],
+                'status': row[7],
+                'remarks': row[8]
+            })
+        return leaves
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        return []
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function returns one page of an intern's leave history in every status, newest leave first.
+# Pages are keyset-paginated on (start_date, application_id): with direction 'older' the page holds the leaves
+# right before cursor_application_id, with 'newer' the ones right after it, and without a cursor the newest ones.
+# Each page is one index range scan however far back it is. Returns a list of dicts, or None on error
+def get_leave_history(telegram_handle, cursor_application_id=None, direction='older', limit=10):
+    if direction not in ('older', 'newer'):
+        raise ValueError(f"Unknown history direction: {direction}")
+    comparison, order = ('<', 'DESC') if direction == 'older' else ('>', 'ASC')
+    conn = None
+    try:
+        conn = get_read_connection(telegram_handle)
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT l.application_id, l.leave_type, l.start_date, l.end_date, l.number_of_leaves_taken, l.day_portion,
+                   l.status, l.remarks
+            FROM leave_logs_new l
+            WHERE l.name = (SELECT name FROM interns_new WHERE telegram_handle = %(telegram_handle)s ORDER BY id DESC LIMIT 1)
+            -- The cursor row is found by application_id alone (one primary key probe per partition, once per page):
+            -- the cursor travels in Telegram callback data, which has no room for a start_date as well
+            AND (%(cursor)s::text IS NULL OR (l.start_date, l.application_id) {comparison} (
+                SELECT start_date, application_id FROM leave_logs_new WHERE application_id = %(cursor)s LIMIT 1
+            ))
+            ORDER BY l.start_date {order}, l.application_id {order}
+            LIMIT %(limit)s
+        """, {'telegram_handle': telegram_handle, 'cursor': cursor_application_id, 'limit': limit})
+        leaves = [
+            {
+                'application_id': row[0],
+                'leave_type': row[1],
+                'start_date': row[2],
+                'end_date': row[3],
+                'leave_duration': row[4],
+                'day_portion': row[5],
+                'status': row[6],
+                'remarks': row[7]
+            }
+            for row in cursor.fetchall()
+        ]
+        return leaves if direction == 'older' else leaves[::-1]
+    except Exception as e:
+        logger.error("Database error while reading the leave history of %s: %s", telegram_handle, e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+# This function cancels a leave application and restores the leave balance
+def cancel_leave_application(application_id, telegram_handle, notifications=None, start_date=None):
+    cancelled, _, _ = transition_leave_status(application_id, 'Cancelled', remarks_suffix=' [Cancelled by intern]',
+                                              telegram_handle=telegram_handle, notifications=notifications,
+                                              start_date=start_date)
+    return cancelled
+
 # This function deletes a user from the interns_new and leave_logs_new tables (for admin and coding use whenever needed)
 def delete_user(telegram_handle):
     conn = None
@@ -697,7 +3023,7 @@ def delete_user(telegram_handle):
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Database error when deleting user: {e}")
+        logger.error("Database error when deleting user: %s", e)
         return False
     finally:
         if conn:
@@ -0,0 +1,24 @@
+# email_utils.py (outgoing email for supervisor notifications)
+import os
+import smtplib
+
+# SMTP configuration from environment variables
+#   SMTP_HOST      mail server (smtp.gmail.com)
+#   SMTP_PORT      mail server port (587)
+#   SMTP_STARTTLS  upgrade the connection with STARTTLS before logging in (true)
+# SENDER_EMAIL / SENDER_PASSWORD are the account the mail is sent from; without a password no login is attempted
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() not in ("0", "false", "no")
+
+
+# This function sends a prepared email message through the configured SMTP server
+# Errors are raised to the caller, which decides how a failed notification is reported
+def send_email(msg):
+    sender_password = os.getenv('SENDER_PASSWORD')
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+        if SMTP_STARTTLS:
+            server.starttls()
+        if sender_password:
+            server.login(os.getenv('SENDER_EMAIL'), sender_password)
+        server.send_message(msg)
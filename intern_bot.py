@@ -1,15 +1,35 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, ConversationHandler, TypeHandler, filters
 import logging
-from datetime import datetime, timedelta,date
+
+# Load environment variables from .env file first, so the LOG_* settings in it reach setup_logging
+from dotenv import load_dotenv
+load_dotenv()
+
+# Logging has to be set up before db_utils is imported, as it talks to the database at import time
+from log_utils import setup_logging, dropped_log_records
+setup_logging()
+from datetime import datetime, timedelta,date, time as dt_time
 import uuid
 from decimal import Decimal
 
-from webserver import run_web_server
+from webserver import run_web_server, apply_supervisor_decision
+from team_calendar import get_team_availability, invalidate_team_availability, format_availability
+from leave_registry import LeaveApplication, LeaveRegistry
+from email_utils import send_email
+from approval_tokens import create_approval_token, create_bulk_review_token, create_supervisor_link_token
+from update_processing import PerChatUpdateProcessor
+from leave_log_writer import LeaveLogWriter, LEAVE_LOG_WRITE_MODE, LEAVE_LOG_WRITE_MODES
+from intern_cache import InternCache
+from notifications import telegram_notification, email_notification, notification_dispatch_job, wake_notification_dispatcher, NOTIFICATION_DISPATCH_INTERVAL_SECONDS
 import threading
-from db_utils import get_registered_interns, get_intern_by_telegram, update_leave_balance, save_leave_application, update_leave_taken, cancel_leave_application, get_approved_leaves,delete_user
+import asyncio
+import sys
+import html
+import re
+from collections import OrderedDict
+from db_utils import get_registered_interns, get_intern_by_telegram, get_intern_by_telegram_async, get_approved_leaves_async, lookup_coalescing_stats, update_leave_balance, save_leave_application, update_leave_taken, cancel_leave_application, get_approved_leaves,delete_user, get_leave_stats, check_leave_rollups, snapshot_leave_balances, find_overlapping_leave, discard_pending_application, transition_leave_status, advance_internship_statuses, ensure_leave_log_partitions, measure_replica_lag, prune_notification_outbox, get_notification_outbox_stats, enqueue_notifications, find_supervisor_email, get_supervisor_chat, get_pending_leave_applications, get_leave_history, get_supervisor_email_by_chat, unregister_supervisor_chat, set_intern_cache, check_leave_balance, leave_breakdown_remarks, LEAVE_TYPES, DB_REPLICA_DSN, REPLICA_MAX_LAG_SECONDS, APPROVED_STATUSES
 
-from dotenv import load_dotenv
 import os
 
 import uuid
@@ -17,22 +37,16 @@ import time
 from datetime import datetime
 
 
-# Load environment variables from .env file
-load_dotenv()
-
-
 # --------------------------------------
 # Section 1: Setup
 # --------------------------------------
 
-# Enable logging
-logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+# Enable logging (configured by log_utils.setup_logging above)
 logger = logging.getLogger(__name__)
 
 # Get registered interns from the database for verification purposes
 registered_interns = get_registered_interns()
-print(f"Loaded {len(registered_interns)} registered interns")
-print(registered_interns)
+logger.info("Loaded %s registered interns", len(registered_interns))
 
 # Initialize the bot with your token (put in env file in the future)
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -42,8 +56,19 @@ LEAVE_TYPE, DAY_PORTION, START_DATE, END_DATE, CONFIRMATION = range(5)  # Reorde
 CHOOSE_LEAVE_TO_CANCEL, CONFIRM_CANCEL = range(5, 7) 
 DOCUMENT_SUBMISSION = "document_submission"
 
+# Idle limits from environment variables
+#   CONVERSATION_TIMEOUT_MINUTES   an apply or cancel conversation left without a reply this long is ended (15)
+#   USER_STATE_IDLE_HOURS          the per-user state (user_data) of users idle this long is dropped (24)
+CONVERSATION_TIMEOUT_MINUTES = float(os.getenv("CONVERSATION_TIMEOUT_MINUTES", 15))
+USER_STATE_IDLE_HOURS = float(os.getenv("USER_STATE_IDLE_HOURS", 24))
+
+# user_data keys the apply and cancel conversations fill in, cleared when a conversation is abandoned
+CONVERSATION_STATE_KEYS = (
+    "leave_type", "day_portion", "is_half_day", "start_date", "end_date", "leave_duration", "new_balance",
+    "taken_type", "balance_type", "approved_leaves", "selected_leave"
+)
+
 # Leave types
-leave_types = ["Annual Leave", "Medical Leave", "No Pay Leave", "Compassionate Leave", "Off in Lieu"]  
 
 
 # Function to ensure username is always available
@@ -81,8 +106,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     username = user.username  # Get Telegram username
     global intern_info
-    intern_info = get_intern_by_telegram(username)
-    date_today = date.today()
+    intern_info = await get_intern_by_telegram_async(username)
 
     # lgoin checks
     """Unregistered interns check"""
@@ -90,11 +114,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("You are not registered in the system. Please contact HR.")
         return
 
-        # Check if today is before internship start date or after end date
-    elif date_today < intern_info["start_date"]:
+        # The daily lifecycle job keeps the internship status current, so it is trusted as is
+    elif intern_info["status"] == "Pending Start":
         await update.message.reply_text("Your internship has not started yet. Please contact HR.")
         return
-    elif date_today > intern_info["end_date"]:
+    elif intern_info["status"] != "Active":
         await update.message.reply_text("Your internship has ended. Please contact HR.")
         return
 
@@ -141,20 +165,16 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE, query=None
         return
     
     # Fetch intern leave balances and approved leaves
-    intern_info = get_intern_by_telegram(username)
-    approved_leaves = get_approved_leaves(username)
-    
-    # Retrieve the current leave balance
-    al_balance = intern_info["al_balance"]
-    mc_balance = intern_info["mc_balance"]
-    # compassionate_balance = intern_info["compassionate_balance"] --> compassionate leave is by default 3 
-    oil_balance = intern_info["oil_balance"]
+    intern_info, approved_leaves = await asyncio.gather(
+        get_intern_by_telegram_async(username), get_approved_leaves_async(username)
+    )
     
-    # Create the balance message to show leave balances
+    # Create the balance message to show the balances of the leave types /balance lists
     message = f"📊 *YOUR LEAVE BALANCE*\n\n"
-    message += f"Annual Leave: *{al_balance}* day(s)\n"
-    message += f"Medical Leave: *{mc_balance}* day(s)\n"
-    message += f"Off in Lieu: *{oil_balance}* day(s)\n\n"
+    for leave_type, policy in LEAVE_TYPES.items():
+        if policy.show_balance and policy.balance_column:
+            message += f"{leave_type}: *{intern_info[policy.balance_column]}* day(s)\n"
+    message += "\n"
     
     # Show upcoming approved leaves
     message += "👍❤ *UPCOMING APPROVED LEAVES*\n\n"
@@ -185,6 +205,318 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE, query=None
     elif update.message:
         await update.message.reply_text(message, reply_markup=reply_markup, parse_mode='Markdown')
 
+# Leave applications per /history page, and the per-user cache of pages already fetched: browsing back and forth
+# within HISTORY_CACHE_SECONDS reuses them instead of querying again
+HISTORY_PAGE_SIZE = 8
+HISTORY_CACHE_PAGES = 6
+HISTORY_CACHE_SECONDS = 120
+
+# This function returns a page of the intern's history, from their page cache when it is fresh enough.
+# cursor is the application the page starts after ('older') or ends before ('newer'); None is the newest page.
+# Returns (leaves newest first, has_newer, has_older), or None on a database error
+async def load_history_page(context: ContextTypes.DEFAULT_TYPE, username, cursor=None, direction="older"):
+    cache = context.user_data.setdefault("history_pages", OrderedDict())
+    key = (cursor, direction)
+    cached = cache.get(key)
+    if cached and time.monotonic() - cached[0] < HISTORY_CACHE_SECONDS:
+        cache.move_to_end(key)
+        return cached[1]
+
+    # One row past the page tells whether there is more beyond it without counting the history
+    leaves = await asyncio.to_thread(get_leave_history, username, cursor, direction, HISTORY_PAGE_SIZE + 1)
+    if leaves is None:
+        return None
+    if direction == "older":
+        page = (leaves[:HISTORY_PAGE_SIZE], cursor is not None, len(leaves) > HISTORY_PAGE_SIZE)
+    else:
+        page = (leaves[-HISTORY_PAGE_SIZE:], len(leaves) > HISTORY_PAGE_SIZE, True)
+
+    cache[key] = (time.monotonic(), page)
+    while len(cache) > HISTORY_CACHE_PAGES:
+        cache.popitem(last=False)
+    return page
+
+# This function renders a /history page with Newer/Older buttons (callback data hs:p:<id> / hs:n:<id>)
+def render_history_page(page):
+    leaves, has_newer, has_older = page
+    if not leaves:
+        text = "You have no leave applications yet." if not has_newer else "There are no older leave applications."
+    else:
+        lines = []
+        for leave in leaves:
+            start_date = leave['start_date'].strftime("%d %b %Y")
+            date_str = start_date if leave['end_date'] == leave['start_date'] else f"{start_date} to {leave['end_date'].strftime('%d %b %Y')}"
+            portion_str = f" {leave['day_portion']}" if leave['day_portion'] not in ['Full Day', None] else ""
+            lines.append(f"• {leave['leave_type']}: {date_str},{portion_str} {leave['leave_duration']} day(s) - {leave['status']}")
+        text = "🗂 YOUR LEAVE HISTORY\n\n" + "\n".join(lines)
+
+    navigation = []
+    if has_newer and leaves:
+        navigation.append(InlineKeyboardButton("◀ Newer", callback_data=f"hs:p:{leaves[0]['application_id']}"))
+    if has_older and leaves:
+        navigation.append(InlineKeyboardButton("Older ▶", callback_data=f"hs:n:{leaves[-1]['application_id']}"))
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("Back to Main Menu", callback_data="back")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+# Command: /history
+# Pages through all of the intern's leave applications, newest first
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    username = ensure_username(update, context)
+    if not username:
+        await update.message.reply_text("You are not registered in the system. Please contact HR.")
+        return
+    # A fresh /history starts from the database again
+    context.user_data.pop("history_pages", None)
+    page = await load_history_page(context, username)
+    if page is None:
+        await update.message.reply_text("Your leave history could not be loaded. Please try again later.")
+        return
+    text, reply_markup = render_history_page(page)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+# Handler for the Newer/Older buttons of /history
+async def history_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    username = ensure_username(update, context)
+    if not username:
+        await query.answer("You are not registered in the system. Please contact HR.", show_alert=True)
+        return
+    await query.answer()
+    _, code, cursor = query.data.split(":", 2)
+    page = await load_history_page(context, username, cursor, "newer" if code == "p" else "older")
+    if page is None:
+        await query.message.reply_text("Your leave history could not be loaded. Please try again later.")
+        return
+    text, reply_markup = render_history_page(page)
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+# Command: /stats
+# Shows supervisors this month's leave usage across the organisation and for their own team, read from the rollup tables.
+# Like /pending it is answered for chats linked with /supervisor only, as the team figures are not the interns' to see
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    supervisor_email = await asyncio.to_thread(get_supervisor_email_by_chat, update.effective_chat.id)
+    if not supervisor_email:
+        await update.message.reply_text("This chat is not linked to a supervisor. Send /supervisor <your email> first.")
+        return
+
+    this_month = date.today().replace(day=1)
+    overall = await asyncio.to_thread(get_leave_stats, this_month)
+    team = await asyncio.to_thread(get_leave_stats, this_month, supervisor_email)
+
+    if overall is None or team is None:
+        await update.message.reply_text("Leave statistics are unavailable right now. Please try again later.")
+        return
+
+    message = f"📈 *LEAVE STATISTICS ({this_month.strftime('%b %Y')})*\n\n"
+    message += "*All interns*\n"
+    if not overall["usage"]:
+        message += "No approved leave this month.\n"
+    for leave_type, usage in overall["usage"].items():
+        message += f"{leave_type}: *{usage['days_taken']}* day(s) across {usage['applications']} application(s)\n"
+
+    message += "\n*Your team*\n"
+    if not team["usage"]:
+        message += "No approved leave this month.\n"
+    for leave_type, usage in team["usage"].items():
+        message += f"{leave_type}: *{usage['days_taken']}* day(s) across {usage['applications']} application(s)\n"
+
+    entitlement = team["remaining_entitlement"]
+    message += (f"\nRemaining across {entitlement['interns']} intern(s): "
+                f"AL {entitlement['al_balance']}, MC {entitlement['mc_balance']}, OIL {entitlement['oil_balance']} day(s)")
+
+    await update.message.reply_text(message, reply_markup=back_button(), parse_mode='Markdown')
+
+# Command: /availability [DD-MM-YYYY] [days]
+# Shows who on the team is off, one row per intern and one column per day: a supervisor linked with /supervisor
+# sees their own team, an intern the team they are on (same supervisor)
+async def availability(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        start_date = datetime.strptime(context.args[0], "%d-%m-%Y").date() if context.args else date.today()
+        days = int(context.args[1]) if len(context.args) > 1 else 7
+    except ValueError:
+        await update.message.reply_text("Usage: /availability [DD-MM-YYYY] [days]")
+        return
+    days = max(1, min(days, 14))  # keep the grid readable in a chat bubble
+
+    supervisor_email = await asyncio.to_thread(get_supervisor_email_by_chat, update.effective_chat.id)
+    if not supervisor_email:
+        username = ensure_username(update, context)
+        intern_info = await get_intern_by_telegram_async(username) if username else None
+        # Interns without a current internship or a supervisor have no team to show
+        if not intern_info or not intern_info.get("supervisor_email"):
+            await update.message.reply_text("You are not registered in the system. Please contact HR.")
+            return
+        supervisor_email = intern_info["supervisor_email"]
+
+    team = await asyncio.to_thread(get_team_availability, supervisor_email, start_date, start_date + timedelta(days=days - 1))
+    if team is None:
+        await update.message.reply_text("Team availability is unavailable right now. Please try again later.")
+        return
+
+    message = f"👥 *TEAM AVAILABILITY* from {start_date.strftime('%d %b %Y')}\n"
+    message += "X = full day off, / = half day off, . = available\n\n"
+    message += f"```\n{format_availability(team)}\n```"
+    await update.message.reply_text(message, reply_markup=back_button(), parse_mode='Markdown')
+
+# Hourly job: evict decided applications past their retention period and report the registry's footprint
+async def registry_eviction_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    registry = context.bot_data['leave_registry']
+    evicted = registry.evict_finished()
+    footprint = registry.memory_footprint()
+    logger.info(
+        "Leave registry: evicted %s, holding %s application(s) (%s pending), ~%s KiB",
+        evicted, footprint["applications"], footprint["pending"], footprint["approx_bytes"] // 1024
+    )
+
+# This function estimates the memory held by users' user_data: the dicts, their keys and values, and what those contain
+def user_state_footprint(user_data):
+    seen = set()
+
+    def approx_size(value):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += sum(approx_size(key) + approx_size(item) for key, item in value.items())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(approx_size(item) for item in value)
+        return size
+
+    return {
+        "users": len(user_data),
+        "in_conversation": sum(1 for data in user_data.values() if any(key in data for key in CONVERSATION_STATE_KEYS)),
+        "approx_bytes": sum(approx_size(data) for data in user_data.values())
+    }
+
+# Handler for every update (group -1, before all others): stamp the user's state with the time they were last active
+async def record_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user:
+        context.user_data["last_active"] = time.monotonic()
+
+# Hourly job: drop the state of users idle for USER_STATE_IDLE_HOURS and report what the rest hold
+async def user_state_eviction_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    application = context.application
+    cutoff = time.monotonic() - USER_STATE_IDLE_HOURS * 60 * 60
+    idle_users = [user_id for user_id, data in application.user_data.items() if data.get("last_active", 0) < cutoff]
+    for user_id in idle_users:
+        application.drop_user_data(user_id)
+    footprint = user_state_footprint(application.user_data)
+    logger.info(
+        "User state: evicted %s idle user(s), holding %s user(s) (%s mid-conversation), ~%s KiB",
+        len(idle_users), footprint["users"], footprint["in_conversation"], footprint["approx_bytes"] // 1024,
+        extra={"user_state": footprint}
+    )
+
+# Minute job: report how long updates wait for their chat and for a processing slot
+async def update_processing_stats_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats = context.application.update_processor.stats(reset_max=True)
+    if stats["processed"] or stats["waiting"]:
+        logger.info(
+            "Update processing: %s running, %s waiting, queue wait p95 %s ms (max %s ms)",
+            stats["running"], stats["waiting"], stats["wait_p95_ms"], stats["max_wait_ms"], extra={"update_processing": stats}
+        )
+
+# Minute job: report the leave-log write-behind buffer's batch sizes and flush latency
+async def leave_log_writer_stats_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats = context.bot_data['leave_log_writer'].stats(reset_max=True)
+    if stats["flushes"] or stats["waiting"]:
+        logger.info(
+            "Leave log writer: %s flush(es), batch size p50 %s (max %s), flush p95 %s ms (max %s ms)",
+            stats["flushes"], stats["batch_size_p50"], stats["batch_size_max"], stats["flush_p95_ms"], stats["max_flush_ms"],
+            extra={"leave_log_writer": stats}
+        )
+
+# Minute job: report log records dropped because the log writer thread fell behind
+async def log_queue_stats_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    dropped = dropped_log_records(reset=True)
+    if dropped:
+        logger.warning("Logging: %s record(s) dropped because the log queue was full", dropped, extra={"dropped_log_records": dropped})
+
+# Flushes the leave-log write-behind buffer and stops the intern cache's listener when the bot stops
+async def stop_background_workers(application: Application) -> None:
+    leave_log_writer = application.bot_data.get('leave_log_writer')
+    if leave_log_writer is not None:
+        await asyncio.to_thread(leave_log_writer.stop)
+    intern_cache = application.bot_data.get('intern_cache')
+    if intern_cache is not None:
+        set_intern_cache(None)
+        await asyncio.to_thread(intern_cache.stop)
+
+# Hourly job: report how many intern lookups the intern cache answered
+async def intern_cache_stats_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats = context.bot_data['intern_cache'].stats()
+    logger.info(
+        "Intern cache: %s intern(s), hit ratio %s, %s notification(s), %s reload(s)",
+        stats["interns"], stats["hit_ratio"], stats["notifications"], stats["reloads"], extra={"intern_cache": stats}
+    )
+
+# Hourly job: report how many duplicate intern and leave lookups were answered by a query already in flight
+async def lookup_coalescing_stats_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats = lookup_coalescing_stats(reset=True)
+    for kind, counts in stats.items():
+        if kind != "in_flight" and counts["suppressed"]:
+            logger.info("Lookup coalescing: %s ran %s quer(ies), %s duplicate(s) suppressed", kind,
+                        counts["queries"], counts["suppressed"], extra={"lookup_coalescing": stats})
+
+# Minute job: measure and report the read replica's lag (reads fall back to the primary while it is too far behind)
+async def replica_lag_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    lag = await asyncio.to_thread(measure_replica_lag)
+    if lag is None:
+        logger.warning("Read replica unreachable; reads are served by the primary")
+    elif lag["lag_seconds"] > REPLICA_MAX_LAG_SECONDS:
+        logger.warning("Read replica is %.1f s behind; reads are served by the primary", lag["lag_seconds"], extra={"replica": lag})
+    else:
+        logger.info("Read replica lag %.1f s", lag["lag_seconds"], extra={"replica": lag})
+
+# Daily job: move internships along Pending Start -> Active -> Completed, expire the pending applications
+# of interns whose internship ended (their notices are queued in the outbox) and reload the registered intern index
+async def internship_lifecycle_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    global registered_interns
+    changes = await asyncio.to_thread(advance_internship_statuses)
+    if changes is None:
+        return
+
+    registry = context.bot_data['leave_registry']
+    for application_id, chat_id in changes["expired"]:
+        registry.transition(application_id, "Expired")
+        for job in context.job_queue.get_jobs_by_name(f"auto_approve_{application_id}"):
+            job.schedule_removal()
+    if changes["expired"]:
+        wake_notification_dispatcher(context.job_queue)
+
+    refreshed = await asyncio.to_thread(get_registered_interns)
+    if refreshed:
+        registered_interns = refreshed
+
+# Minute job: report a backlog of due notifications, or notifications that could not be sent at all
+async def notification_outbox_stats_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats = await asyncio.to_thread(get_notification_outbox_stats)
+    if stats and (stats["oldest_due_seconds"] > 60 or stats["failed"]):
+        logger.warning(
+            "Notification outbox: %s pending, oldest due for %.0f s, %s failed",
+            stats["pending"], stats["oldest_due_seconds"], stats["failed"], extra={"notification_outbox": stats}
+        )
+
+# Daily job: delete sent and failed notifications past their retention period
+async def notification_outbox_prune_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await asyncio.to_thread(prune_notification_outbox)
+
+# Daily job: compare the leave rollups with the base tables and repair any drift
+async def rollup_consistency_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    mismatches = await asyncio.to_thread(check_leave_rollups, repair=True)
+    if mismatches:
+        logger.warning("Leave rollup consistency check repaired %s row(s)", mismatches)
+
+# Daily job: create next years' leave log partitions ahead of time
+async def leave_log_partition_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await asyncio.to_thread(ensure_leave_log_partitions)
+
+# Daily job: snapshot intern balances so ledger replays only cover the events since the last snapshot
+async def ledger_snapshot_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await asyncio.to_thread(snapshot_leave_balances)
+
 # --------------------------------------
 # Section 4: Apply Leave
 # --------------------------------------
@@ -194,7 +526,7 @@ async def apply_leave_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Step 1: Choose leave type - This is the entry point triggered by command or callback"""
     # Ensure username is available
     username = ensure_username(update, context)
-    intern_info= get_intern_by_telegram(username)
+    intern_info= await get_intern_by_telegram_async(username)
     
     if not username:
         if update.callback_query:
@@ -204,7 +536,7 @@ async def apply_leave_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
     
     # list out leave types to choose from
-    keyboard = [[lt] for lt in leave_types]
+    keyboard = [[lt] for lt in LEAVE_TYPES]
     keyboard.append(["Cancel"])  
     reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True)
     
@@ -224,7 +556,7 @@ async def leave_type_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_input = update.message.text
 
     # Error handling for invalid leave type
-    if user_input not in leave_types and user_input != "Cancel":
+    if user_input not in LEAVE_TYPES and user_input != "Cancel":
         await update.message.reply_text("Invalid leave type. Please choose a valid leave type.")
         return LEAVE_TYPE
     
@@ -235,8 +567,9 @@ async def leave_type_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Store the selected leave type in user_data
     context.user_data["leave_type"] = user_input
     
-    # Check if user selected Medical or Compassionate Leave to facilitate document submission
-    if user_input in ["Medical Leave", "Compassionate Leave"]:
+    # Leave types that need documents (Medical, Compassionate) send the intern to the submission form first
+    document_type = LEAVE_TYPES[user_input].document
+    if document_type:
         # Create inline keyboard with document submission link and options
         inline_keyboard = [
             [InlineKeyboardButton("Submit Documents", url=os.getenv("FORM_URL"))],
@@ -244,8 +577,7 @@ async def leave_type_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             [InlineKeyboardButton("Cancel Application", callback_data="cancel_application")]
         ]
         reply_markup = InlineKeyboardMarkup(inline_keyboard)
-        
-        document_type = "medical certificate" if user_input == "Medical Leave" else "supporting documents"
+
         message_text = (
             f"For {user_input}, you need to submit {document_type}.\n\n"
             f"Please use the button below to submit your documents, then click 'Proceed' to continue with your application."
@@ -324,7 +656,7 @@ async def start_date_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Step 4: Save start date and ask for end date if full day, or go to confirmation if half day"""
     # Ensure username is available
     username = ensure_username(update, context)
-    intern_info = get_intern_by_telegram(username)
+    intern_info = await get_intern_by_telegram_async(username)
 
     today = date.today()
     user_input = update.message.text
@@ -377,7 +709,7 @@ async def end_date_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     """Step 5: Save end date and prepare confirmation"""
     # Ensure username is available
     username = ensure_username(update, context)
-    intern_info = get_intern_by_telegram(username)
+    intern_info = await get_intern_by_telegram_async(username)
     
     # Get reply from previous step
     user_input = update.message.text
@@ -432,11 +764,7 @@ async def prepare_confirmation(update: Update, context: ContextTypes.DEFAULT_TYP
         return ConversationHandler.END
     
     # Get intern leave balance from database
-    intern_info = get_intern_by_telegram(username)
-    al_balance = intern_info["al_balance"]
-    mc_balance = intern_info["mc_balance"]
-    compassionate_balance= intern_info["compassionate_balance"]
-    oil_balance = intern_info["oil_balance"]
+    intern_info = await get_intern_by_telegram_async(username)
 
     # Extract leave details from context
     leave_type = context.user_data["leave_type"]
@@ -458,113 +786,47 @@ async def prepare_confirmation(update: Update, context: ContextTypes.DEFAULT_TYP
     if has_weekends:
         weekends_message = "\n⚠️ Note: The selected leave period includes weekends. Leave is only counted for weekdays."
 
+    # Check the dates against the intern's pending and approved leaves (single indexed probe)
+    overlapping_leave = await asyncio.to_thread(find_overlapping_leave, intern_info["name"], start_date, end_date,
+                                                day_portion=day_portion)
+    if overlapping_leave:
+        cancel_keyboard = ReplyKeyboardMarkup([["Cancel"]], one_time_keyboard=True)
+        await update.message.reply_text(
+            f"These dates overlap your {overlapping_leave['status'].lower()} {overlapping_leave['leave_type']} "
+            f"from {overlapping_leave['start_date'].strftime('%d-%m-%Y')} to {overlapping_leave['end_date'].strftime('%d-%m-%Y')}. "
+            "Please enter a different start date (DD-MM-YYYY):",
+            reply_markup=cancel_keyboard
+        )
+        return START_DATE
 
-    # Check balance and prepare confirmation message for AL
-    if leave_type == "Annual Leave":
-        if leave_duration > al_balance:
-            await update.message.reply_text(
-                f"You do not have enough {leave_type} balance. Your current balance is {al_balance} days, but you've requested {leave_duration} days. Please apply for no pay leave instead.",
-                reply_markup=ReplyKeyboardRemove()
-            )
-            await update.message.reply_text("Leave application cancelled.", reply_markup=ReplyKeyboardRemove())
-            await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
-            return ConversationHandler.END
-        
-        new_balance = al_balance - Decimal(str(leave_duration))
-        confirmation_message = (f"Leave Type: {leave_type}\n"
-                                f"Start Date: {start_date.strftime('%d-%m-%Y')}\n"
-                                f"End Date: {end_date.strftime('%d-%m-%Y')}\n"
-                                f"Day Portion: {day_portion}\n"
-                                f"Leave Duration: {leave_duration} day{'s' if leave_duration > 1 else ''}\n {weekends_message}"
-                                f"Remaining AL Balance: {new_balance} days\n\n"
-                                "Do you confirm? (Yes/No)")
-        context.user_data["new_balance"] = new_balance
-        context.user_data["taken_type"] = "al_taken"
-        context.user_data["balance_type"] = "al_balance"
-        
-    # Check balance and prepare confirmation message for MC
-    elif leave_type == "Medical Leave":
-        if leave_duration > mc_balance:
-            await update.message.reply_text(
-                f"You do not have enough {leave_type} balance. Your current balance is {mc_balance} days, but you've requested {leave_duration} days. Please apply for no pay leave instead.",
-                reply_markup=ReplyKeyboardRemove()
-            )
-            await update.message.reply_text("Leave application cancelled.", reply_markup=ReplyKeyboardRemove())
-            await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
-            return ConversationHandler.END
-            
-        new_balance = mc_balance - Decimal(str(leave_duration))
-        confirmation_message = (f"Leave Type: {leave_type}\n"
-                                f"Start Date: {start_date.strftime('%d-%m-%Y')}\n"
-                                f"End Date: {end_date.strftime('%d-%m-%Y')}\n"
-                                f"Day Portion: {day_portion}\n"
-                                f"Leave Duration: {leave_duration} day{'s' if leave_duration > 1 else ''}\n {weekends_message}"
-                                f"Remaining MC Balance: {new_balance} days\n\n"
-                                "Do you confirm? (Yes/No)")
-        context.user_data["new_balance"] = new_balance
-        context.user_data["taken_type"] = "mc_taken"
-        context.user_data["balance_type"] = "mc_balance"
 
-    # Check balance and prepare confirmation message for Compassionate Leave
-    elif leave_type == "Compassionate Leave":
-        if leave_duration > compassionate_balance:
+    # Check the balance and word the confirmation by the leave type's policy
+    policy = LEAVE_TYPES[leave_type]
+    confirmation_message = (f"Leave Type: {leave_type}\n"
+                            f"Start Date: {start_date.strftime('%d-%m-%Y')}\n"
+                            f"End Date: {end_date.strftime('%d-%m-%Y')}\n"
+                            f"Day Portion: {day_portion}\n"
+                            f"Leave Duration: {leave_duration} day{'s' if leave_duration > 1 else ''}\n")
+    if policy.checks_balance:
+        current_balance = intern_info[policy.balance_column]
+        if leave_duration > current_balance:
             await update.message.reply_text(
-                f"You do not have enough {leave_type} balance. Your current balance is {compassionate_balance} days, but you've requested {leave_duration} days. Please apply for no pay leave instead.",
+                f"You do not have enough {leave_type} balance. Your current balance is {current_balance} days, but you've requested {leave_duration} days. Please apply for no pay leave instead.",
                 reply_markup=ReplyKeyboardRemove()
             )
             await update.message.reply_text("Leave application cancelled.", reply_markup=ReplyKeyboardRemove())
             await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
             return ConversationHandler.END
-            
-        new_balance = compassionate_balance - Decimal(str(leave_duration))
-        confirmation_message = (f"Leave Type: {leave_type}\n"
-                                f"Start Date: {start_date.strftime('%d-%m-%Y')}\n"
-                                f"End Date: {end_date.strftime('%d-%m-%Y')}\n"
-                                f"Day Portion: {day_portion}\n"
-                                f"Leave Duration: {leave_duration} day{'s' if leave_duration > 1 else ''}\n {weekends_message}"
-                                f"Remaining MC Balance: {new_balance} days\n\n"
-                                "Do you confirm? (Yes/No)")
-        context.user_data["new_balance"] = new_balance
-        context.user_data["taken_type"] = "compassionate_taken"
-        context.user_data["balance_type"] = "compassionate_balance"
 
-    # Check balance and prepare confirmation message for OIL
-    elif leave_type == "Off in Lieu":
-        if leave_duration > oil_balance:
-            await update.message.reply_text(
-                f"You do not have enough {leave_type} balance. Your current balance is {oil_balance} days, but you've requested {leave_duration} days. Please apply for no pay leave instead.",
-                reply_markup=ReplyKeyboardRemove()
-            )
-            await update.message.reply_text("Leave application cancelled.", reply_markup=ReplyKeyboardRemove())
-            await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
-            return ConversationHandler.END
-            
-        new_balance = oil_balance - Decimal(str(leave_duration))
-        confirmation_message = (f"Leave Type: {leave_type}\n"
-                                f"Start Date: {start_date.strftime('%d-%m-%Y')}\n"
-                                f"End Date: {end_date.strftime('%d-%m-%Y')}\n"
-                                f"Day Portion: {day_portion}\n"
-                                f"Leave Duration: {leave_duration} day{'s' if leave_duration > 1 else ''}\n {weekends_message}"
-                                f"Remaining MC Balance: {new_balance} days\n\n"
-                                "Do you confirm? (Yes/No)")
+        new_balance = current_balance - Decimal(str(leave_duration))
+        confirmation_message += (f" {weekends_message}"
+                                 f"Remaining {policy.abbreviation} Balance: {new_balance} days\n\n")
         context.user_data["new_balance"] = new_balance
-        context.user_data["taken_type"] = "oil_taken"
-        context.user_data["balance_type"] = "oil_balance"
-    
-    else:  # For other leave types (No Pay)
-        confirmation_message = (f"Leave Type: {leave_type}\n"
-                               f"Start Date: {start_date.strftime('%d-%m-%Y')}\n"
-                               f"End Date: {end_date.strftime('%d-%m-%Y')}\n"
-                               f"Day Portion: {day_portion}\n"
-                               f"Leave Duration: {leave_duration} day{'s' if leave_duration > 1 else ''}\n\n"
-                               "Do you confirm? (Yes/No)")
-        
-        # Set appropriate taken_type based on leave type
-        if leave_type == "No Pay Leave":
-            context.user_data["taken_type"] = "npl_taken"
-
-            
-        context.user_data["balance_type"] = ""
+    else:
+        confirmation_message += "\n"
+    confirmation_message += "Do you confirm? (Yes/No)"
+    context.user_data["taken_type"] = policy.taken_column
+    context.user_data["balance_type"] = policy.balance_column or ""
 
     # Add Cancel option to the confirmation keyboard
     confirmation_keyboard = ReplyKeyboardMarkup([["Yes", "No"], ["Cancel"]], one_time_keyboard=True)
@@ -595,62 +857,76 @@ async def confirmation_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         unique_id = str(uuid.uuid4())[:8]  # Use first 8 characters of UUID
         application_id = f"{timestamp}_{unique_id}_{username}"
         
-        print(f"Generated application ID: {application_id}")  # Debug logging
         
         # Get intern leave balance from database
-        intern_info = get_intern_by_telegram(username)
+        intern_info = await get_intern_by_telegram_async(username)
         employee_name = intern_info["name"]
         supervisor_email = intern_info["supervisor_email"]
 
-        leave_application = {
-            "chat_id": update.effective_chat.id, 
-            "id": application_id,
-            "username": username,
-            "employee_name": employee_name,
-            "leave_type": context.user_data["leave_type"],
-            "start_date": context.user_data["start_date"],
-            "end_date": context.user_data["end_date"],
-            "day_portion": context.user_data["day_portion"],
-            "leave_duration": context.user_data["leave_duration"],
-            "status": "Pending",
-            "submission_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "auto_approve_time": (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d %H:%M:%S"),
-            "balance_type": context.user_data.get("balance_type"),
-            "new_balance": context.user_data.get("new_balance"),
-            "taken_type": context.user_data.get("taken_type"),
-            "remarks": ""
-        }
-
-        print(f"Created leave application: {leave_application}")
-        
-        # Initialize leave_applications if it doesn't exist or get cancelled
-        if 'leave_applications' not in context.bot_data:
-            context.bot_data['leave_applications'] = {}
-        
-        # Store the application
-        context.bot_data['leave_applications'][application_id] = leave_application
-        
-        # Debug: Print all stored applications (for testing purposes) --> can be removed later
-        print(f"Total stored applications: {len(context.bot_data['leave_applications'])}")
-        for app_id, app in context.bot_data['leave_applications'].items():
-            print(f"App ID: {app_id}, Status: {app['status']}")
-        
-        # Send email to supervisor with approval/rejection links
-        email_sent = await send_supervisor_email(application_id, leave_application, supervisor_email)
+        leave_application = LeaveApplication(
+            chat_id=update.effective_chat.id,
+            id=application_id,
+            username=username,
+            employee_name=employee_name,
+            supervisor_email=supervisor_email,
+            leave_type=context.user_data["leave_type"],
+            start_date=context.user_data["start_date"],
+            end_date=context.user_data["end_date"],
+            day_portion=context.user_data["day_portion"],
+            leave_duration=context.user_data["leave_duration"],
+            status="Pending",
+            submission_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            auto_approve_time=(datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d %H:%M:%S"),
+            balance_type=context.user_data.get("balance_type"),
+            new_balance=context.user_data.get("new_balance"),
+            taken_type=context.user_data.get("taken_type"),
+            remarks=""
+        )
+
+        logger.debug("Created leave application %s for %s", application_id, username)
         
-        if not email_sent:
+        # Another application for these dates may have been submitted since the confirmation was shown
+        overlapping_leave = await asyncio.to_thread(find_overlapping_leave, employee_name, leave_application["start_date"],
+                                                    leave_application["end_date"], day_portion=leave_application["day_portion"])
+        if overlapping_leave:
+            await update.message.reply_text(
+                f"These dates overlap your {overlapping_leave['status'].lower()} {overlapping_leave['leave_type']} "
+                f"from {overlapping_leave['start_date'].strftime('%d-%m-%Y')} to {overlapping_leave['end_date'].strftime('%d-%m-%Y')}. "
+                "Leave application cancelled.",
+                reply_markup=ReplyKeyboardRemove()
+            )
+            await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
+            return ConversationHandler.END
+
+        # Record the pending application so later overlap checks can see it
+        leave_log_writer = context.bot_data.get('leave_log_writer')
+        if leave_log_writer is not None and LEAVE_LOG_WRITE_MODE == "buffered":
+            # Tell the intern now; the supervisor is emailed once the application's batch has committed
+            context.application.create_task(
+                dispatch_buffered_application(context, leave_application, leave_log_writer.submit(leave_application)),
+                update=update
+            )
+            await update.message.reply_text(
+                f"Your leave application has been submitted and will be sent to your supervisor for approval.\n"
+                "If your supervisor does not respond within 3 days, it will be automatically approved.",
+                reply_markup=ReplyKeyboardRemove()
+            )
+            await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
+            return ConversationHandler.END
+
+        if leave_log_writer is not None:
+            # Durable mode: the intern is only told once the batch holding the application has committed
+            saved = await asyncio.wrap_future(leave_log_writer.submit(leave_application))
+        else:
+            saved = await asyncio.to_thread(save_leave_application, leave_application)
+        if not saved:
+            await update.message.reply_text("Failed to submit your leave application. Please try again later.")
+            return ConversationHandler.END
+
+        if not await dispatch_leave_application(context, leave_application):
             await update.message.reply_text("Failed to send email to supervisor. Please try again later.")
             return ConversationHandler.END
         
-        # Schedule job to auto-approve after 3 days (simulated 15 minutes for testing)
-        job_queue = context.job_queue
-        job_queue.run_once(
-            auto_approve_leave,
-            when=timedelta(minutes=15),  # Change back to days=3 for production
-            data={"application_id": application_id, "chat_id": update.effective_chat.id},
-            name=f"auto_approve_{application_id}"
-        )
-        
         await update.message.reply_text(
             f"Your leave application has been submitted and sent to your supervisor for approval.\n"
             "If your supervisor does not respond within 3 days, it will be automatically approved.",
@@ -668,18 +944,267 @@ async def confirmation_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
     return ConversationHandler.END
 
+# This function hands a saved application to its supervisor: it is added to the registry, sent to the
+# supervisor and scheduled for auto-approval. Supervisors who linked their Telegram account get a message with
+# Approve/Reject buttons through the outbox, the others an email. If it cannot be sent the application is
+# withdrawn and False is returned
+async def dispatch_leave_application(context: ContextTypes.DEFAULT_TYPE, leave_application) -> bool:
+    application_id = leave_application.id
+    # Store the application in the registry shared with the web server
+    registry = context.bot_data['leave_registry']
+    registry.add(leave_application)
+    logger.info("Leave application %s submitted, %s pending in registry", application_id, registry.pending_count)
+    
+    supervisor_chat = await asyncio.to_thread(get_supervisor_chat, leave_application["supervisor_email"])
+    if supervisor_chat:
+        email_sent = await asyncio.to_thread(
+            enqueue_notifications, [supervisor_approval_notification(leave_application, supervisor_chat)]
+        )
+        if email_sent:
+            wake_notification_dispatcher(context.job_queue)
+    else:
+        # Send email to supervisor with approval/rejection links
+        email_sent = await send_supervisor_email(application_id, leave_application, leave_application["supervisor_email"])
+    
+    if not email_sent:
+        await asyncio.to_thread(discard_pending_application, application_id, leave_application["start_date"])
+        registry.remove(application_id)
+        return False
+    
+    # Schedule job to auto-approve after 3 days (simulated 15 minutes for testing)
+    job_queue = context.job_queue
+    job_queue.run_once(
+        auto_approve_leave,
+        when=timedelta(minutes=15),  # Change back to days=3 for production
+        data={"application_id": application_id, "chat_id": leave_application["chat_id"]},
+        name=f"auto_approve_{application_id}"
+    )
+    return True
+
+# This function finishes a submission in buffered write mode once the application's batch has committed,
+# and tells the intern if it could not be saved or sent after all
+async def dispatch_buffered_application(context: ContextTypes.DEFAULT_TYPE, leave_application, saved_future) -> None:
+    if await asyncio.wrap_future(saved_future) and await dispatch_leave_application(context, leave_application):
+        return
+    await context.bot.send_message(
+        chat_id=leave_application["chat_id"],
+        text=f"Your {leave_application['leave_type']} from {leave_application['start_date'].strftime('%d-%m-%Y')} "
+             f"to {leave_application['end_date'].strftime('%d-%m-%Y')} could not be submitted. Please try again later.",
+        reply_markup=main_menu()
+    )
+
+# This function applies a decision through the database's compare-and-set transition and mirrors the
+# resulting status in the registry. Returns (decided, status, refusal) as transition_leave_status does:
+# decided is False when another decider (a supervisor link) won, and an approval that fails the balance or
+# overlap check is moved to refusal_status instead, with refusal saying why.
+# notifications are queued in the decision's transaction, so they are only sent by the winner
+def decide_in_registry(registry, application_id, new_status, remarks, decision_time, notifications=None,
+                       refusal_status=None, refusal_notifications=None):
+    # The registry's start_date keeps the transition in the application's partition of the leave log
+    leave_application = registry.get(application_id)
+    decided, current_status, refusal = transition_leave_status(
+        application_id, new_status, remarks=remarks, decision_time=decision_time, notifications=notifications,
+        refusal_status=refusal_status, refusal_notifications=refusal_notifications,
+        start_date=leave_application["start_date"] if leave_application else None
+    )
+    if current_status:
+        registry.transition(application_id, current_status)
+    return decided, current_status, refusal
+
+# This function builds the Telegram message asking a linked supervisor to decide an application
+def supervisor_approval_notification(leave_application, supervisor_chat):
+    application_id = leave_application.id
+    text = (
+        f"Leave application from {leave_application['employee_name']}\n\n"
+        f"Leave Type: {leave_application['leave_type']}\n"
+        f"Start Date: {leave_application['start_date'].strftime('%d-%m-%Y')}\n"
+        f"End Date: {leave_application['end_date'].strftime('%d-%m-%Y')}\n"
+        f"Day Portion: {leave_application['day_portion']}\n"
+        f"Duration: {leave_application['leave_duration']} day{'s' if leave_application['leave_duration'] > 1 else ''}\n\n"
+        "If no action is taken within 3 days, this leave application will be automatically approved."
+    )
+    buttons = InlineKeyboardMarkup([[
+        InlineKeyboardButton("Approve", callback_data=f"lv:a:{application_id}"),
+        InlineKeyboardButton("Reject", callback_data=f"lv:r:{application_id}")
+    ]])
+    return telegram_notification(f"request:{application_id}:telegram", supervisor_chat, [(text, buttons)])
+
+# Handler for the Approve/Reject buttons on a supervisor's application message or /pending page
+# (callback data lv:a:<id> / lv:r:<id>)
+async def supervisor_decision_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Apply the supervisor's decision with the same checks as the email links"""
+    query = update.callback_query
+    _, code, application_id = query.data.split(":", 2)
+    action = "approve" if code == "a" else "reject"
+
+    # Only the chat linked to the application's supervisor may decide it
+    supervisor_email = await asyncio.to_thread(get_supervisor_email_by_chat, update.effective_chat.id)
+    if not supervisor_email:
+        await query.answer("This chat is no longer linked to a supervisor. Use the links in your email instead.", show_alert=True)
+        return
+
+    # Pending applications are in the registry, whose start_date keeps the lookups in the application's partition
+    leave_application = context.bot_data['leave_registry'].get(application_id)
+    message, status_code = await asyncio.to_thread(
+        apply_supervisor_decision, application_id, action, supervisor_email,
+        leave_application["start_date"] if leave_application else None
+    )
+    page_start = pending_page_start(query.message)
+    if page_start is not None:
+        # On a /pending page the outcome is shown as an alert and the same page is redrawn without the application
+        await query.answer(re.sub(r"<[^>]+>", "", message)[:200], show_alert=True)
+        page = await asyncio.to_thread(render_pending_page, supervisor_email, page_start)
+        if page and (page[0] != query.message.text or page[1] != query.message.reply_markup):
+            await query.edit_message_text(page[0], reply_markup=page[1])
+        return
+
+    await query.answer()
+    if status_code == 500:
+        # Leave the buttons in place so the supervisor can try again
+        await query.message.reply_text("This leave application could not be processed. Please try again later.")
+        return
+    await query.edit_message_text(f"{html.escape(query.message.text)}\n\n{message}", parse_mode="HTML")
+
+# Pending applications per /pending page; small pages keep each message and its keyboard short
+PENDING_PAGE_SIZE = 5
+
+# This function renders one page of a supervisor's pending queue, starting after application `after` (keyset
+# pagination, see get_pending_leave_applications). Each application gets Approve/Reject buttons; the page's
+# own start is kept in its Refresh button (pd:<after>) so it can be redrawn after a decision.
+# Returns (text, reply_markup), or None on a database error
+def render_pending_page(supervisor_email, after=None):
+    # One row past the page tells whether there is a next page without counting the whole queue
+    pending = get_pending_leave_applications(supervisor_email, after or None, PENDING_PAGE_SIZE + 1)
+    if pending is None:
+        return None
+    has_more = len(pending) > PENDING_PAGE_SIZE
+    pending = pending[:PENDING_PAGE_SIZE]
+
+    if not pending:
+        text = "There are no more pending leave applications." if after else "You have no pending leave applications."
+    else:
+        lines = [
+            f"{number}. {application['employee_name']}: {application['leave_type']}, "
+            f"{application['start_date'].strftime('%d-%m-%Y')} to {application['end_date'].strftime('%d-%m-%Y')} "
+            f"({application['leave_duration']} day(s), submitted {application['submission_date'].strftime('%d-%m-%Y')})"
+            for number, application in enumerate(pending, start=1)
+        ]
+        text = f"Pending leave applications for {supervisor_email}{', continued' if after else ''}:\n\n" + "\n".join(lines)
+
+    keyboard = [
+        [InlineKeyboardButton(f"Approve {number}", callback_data=f"lv:a:{application['application_id']}"),
+         InlineKeyboardButton(f"Reject {number}", callback_data=f"lv:r:{application['application_id']}")]
+        for number, application in enumerate(pending, start=1)
+    ]
+    navigation = [InlineKeyboardButton("Refresh", callback_data=f"pd:{after or ''}")]
+    if after:
+        navigation.insert(0, InlineKeyboardButton("First page", callback_data="pd:"))
+    if has_more:
+        navigation.append(InlineKeyboardButton("Next page", callback_data=f"pd:{pending[-1]['application_id']}"))
+    keyboard.append(navigation)
+    return text, InlineKeyboardMarkup(keyboard)
+
+# This function returns where a /pending page message starts ("" for the first page), or None for other messages
+def pending_page_start(message):
+    if message is None or message.reply_markup is None:
+        return None
+    for row in message.reply_markup.inline_keyboard:
+        for button in row:
+            if button.text == "Refresh" and button.callback_data and button.callback_data.startswith("pd:"):
+                return button.callback_data[3:]
+    return None
+
+# Command: /pending lists the pending applications of the supervisor linked to this chat
+async def pending(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    supervisor_email = await asyncio.to_thread(get_supervisor_email_by_chat, update.effective_chat.id)
+    if not supervisor_email:
+        await update.message.reply_text("This chat is not linked to a supervisor. Send /supervisor <your email> first.")
+        return
+    page = await asyncio.to_thread(render_pending_page, supervisor_email)
+    if page is None:
+        await update.message.reply_text("Your pending leave applications could not be loaded. Please try again later.")
+        return
+    await update.message.reply_text(page[0], reply_markup=page[1])
+
+# Handler for the paging buttons of /pending (callback data pd:<last application of the previous page>)
+async def pending_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    supervisor_email = await asyncio.to_thread(get_supervisor_email_by_chat, update.effective_chat.id)
+    if not supervisor_email:
+        await query.answer("This chat is no longer linked to a supervisor.", show_alert=True)
+        return
+    await query.answer()
+    page = await asyncio.to_thread(render_pending_page, supervisor_email, query.data[3:])
+    if page is None:
+        await query.message.reply_text("Your pending leave applications could not be loaded. Please try again later.")
+        return
+    if page[0] != query.message.text or page[1] != query.message.reply_markup:
+        await query.edit_message_text(page[0], reply_markup=page[1])
+
+# Command: /supervisor <email> links a supervisor's Telegram chat to their email once they open the emailed link;
+# /supervisor off unlinks it again
+async def supervisor(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.effective_chat.id
+    argument = context.args[0].strip() if context.args else ""
+
+    if argument.lower() == "off":
+        unlinked = await asyncio.to_thread(unregister_supervisor_chat, chat_id)
+        if unlinked:
+            await update.message.reply_text(f"Leave applications for {unlinked} will be sent by email again.")
+        else:
+            await update.message.reply_text("This chat is not linked to a supervisor.")
+        return
+    if not argument:
+        linked = await asyncio.to_thread(get_supervisor_email_by_chat, chat_id)
+        status = f"This chat receives the leave applications for {linked}." if linked else "This chat is not linked to a supervisor."
+        await update.message.reply_text(
+            f"{status}\nSend /supervisor <your email> to receive leave applications here, or /supervisor off to stop."
+        )
+        return
+
+    supervisor_email = await asyncio.to_thread(find_supervisor_email, argument)
+    if not supervisor_email:
+        await update.message.reply_text("No current intern reports to that email. Please check the address or contact HR.")
+        return
+
+    # The link goes to the supervisor's mailbox, so only its owner can send its applications to this chat
+    username = update.effective_user.username
+    token = create_supervisor_link_token(supervisor_email, chat_id, username)
+    link = f"{os.getenv('PUBLIC_BASE_URL', 'http://127.0.0.1:3000').rstrip('/')}/supervisor-link?token={token}"
+    body = f"""
+        Dear Supervisor,
+        
+        Telegram user {'@' + username if username else 'without a username'} asked to receive the leave applications
+        addressed to {supervisor_email} in Telegram, where they can be approved or rejected with a button.
+        
+        To confirm, open this link within 24 hours:
+        {link}
+        
+        If you did not ask for this, you can ignore this email.
+        
+        Thank you,
+        Leave Management System
+        """
+    queued = await asyncio.to_thread(enqueue_notifications, [email_notification(
+        f"supervisor-link:{supervisor_email}:{chat_id}:{token[-16:]}", supervisor_email,
+        "Receive leave applications in Telegram", body
+    )])
+    if not queued:
+        await update.message.reply_text("The confirmation email could not be sent. Please try again later.")
+        return
+    wake_notification_dispatcher(context.job_queue)
+    await update.message.reply_text(f"A confirmation link has been emailed to {supervisor_email}. Open it to finish linking this chat.")
+
 # Function to send email to supervisor
 async def send_supervisor_email(application_id, leave_application, supervisor_email):
     """Send an email to the supervisor with approve/reject links"""
     try:
         # Import email libraries
-        import smtplib
         from email.mime.text import MIMEText
         from email.mime.multipart import MIMEMultipart
         
         # Email configuration
         sender_email = os.getenv('SENDER_EMAIL') # Replace with your email
-        sender_password = os.getenv('SENDER_PASSWORD')  # Replace with your password or app password
 
         # Create message
         msg = MIMEMultipart()
@@ -688,10 +1213,13 @@ async def send_supervisor_email(application_id, leave_application, supervisor_em
         msg['Subject'] = f"Leave Application from {leave_application['employee_name']}"
         
         # Email content with approval/rejection links
-        # Note: In production, these would be secure links to your application server
-        base_url = "http://127.0.0.1:3000/leave-response"
-        approve_url = f"{base_url}?id={application_id}&action=approve"
-        reject_url = f"{base_url}?id={application_id}&action=reject"
+        # PUBLIC_BASE_URL is the address supervisors reach the web server on
+        base_url = f"{os.getenv('PUBLIC_BASE_URL', 'http://127.0.0.1:3000').rstrip('/')}/leave-response"
+        # Signed, expiring tokens let any web worker verify the link without the bot's memory
+        start_date = leave_application['start_date']
+        approve_url = f"{base_url}?token={create_approval_token(application_id, 'approve', start_date=start_date)}"
+        reject_url = f"{base_url}?token={create_approval_token(application_id, 'reject', start_date=start_date)}"
+        bulk_review_url = f"{base_url}/bulk?token={create_bulk_review_token(supervisor_email)}"
         
         body = f"""
         Dear Supervisor,
@@ -710,6 +1238,9 @@ async def send_supervisor_email(application_id, leave_application, supervisor_em
         APPROVE: {approve_url}
         REJECT: {reject_url}
         
+        To review all of your pending leave applications at once:
+        {bulk_review_url}
+        
         If no action is taken within 3 days, this leave application will be automatically approved.
         
         Thank you,
@@ -718,19 +1249,15 @@ async def send_supervisor_email(application_id, leave_application, supervisor_em
         
         msg.attach(MIMEText(body, 'plain'))
         
-        # Connect to SMTP server and send email
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:  # Adjust server settings as needed
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
+        await asyncio.to_thread(send_email, msg)
         
         # Log success
-        print(f"Email sent to {supervisor_email} for leave application {application_id}")
+        logger.info("Email sent to %s for leave application %s", supervisor_email, application_id)
         return True
         
     except Exception as e:
         # Log the error
-        print(f"Failed to send email: {str(e)}")
+        logger.error("Failed to send email for leave application %s: %s", application_id, e)
         return False
 
 async def auto_approve_leave(context):
@@ -741,78 +1268,26 @@ async def auto_approve_leave(context):
     chat_id = data["chat_id"]
 
     # Get leave application from storage
-    leave_applications = context.bot_data.get('leave_applications', {})
-    leave_application = leave_applications.get(application_id)
+    registry = context.bot_data['leave_registry']
+    leave_application = registry.get(application_id)
     
     if leave_application and leave_application["status"] == "Pending":
-        # **NEW: Check current balance before auto-approving**
-        username = leave_application["username"]
-        intern_info = get_intern_by_telegram(username)
         leave_duration = leave_application["leave_duration"]
         leave_type = leave_application["leave_type"]
-        
-        # Check if this is a leave type that requires balance verification
-        balance_check_failed = False
-        insufficient_balance_message = ""
-        
-        if leave_type == "Annual Leave":
-            current_balance = intern_info["al_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Annual Leave balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-                
-        elif leave_type == "Medical Leave":
-            current_balance = intern_info["mc_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Medical Leave balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-                
-        elif leave_type == "Compassionate Leave":
-            current_balance = intern_info["compassionate_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Compassionate Leave balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-                
-        elif leave_type == "Off in Lieu":
-            current_balance = intern_info["oil_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Off in Lieu balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-        
-        # If balance check failed, reject the application automatically
-        if balance_check_failed:
-            leave_application["status"] = "Auto-Rejected"
-            leave_application["decision_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            leave_application["remarks"] = f"Auto-rejected due to insufficient balance: {insufficient_balance_message}"
-            
-            # Save the rejected application
-            save_leave_application(leave_application)
-            
-            # Notify the employee about auto-rejection
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"Your leave application has been automatically rejected due to insufficient balance. {insufficient_balance_message}"
-            )
-            
-            # Notify the supervisor about auto-rejection
-            try:
-                import smtplib
-                from email.mime.text import MIMEText
-                from email.mime.multipart import MIMEMultipart
-                    
-                supervisor_email = intern_info["supervisor_email"]
-                sender_email = os.getenv('SENDER_EMAIL')
-                sender_password = os.getenv('SENDER_PASSWORD')
-                
-                msg = MIMEMultipart()
-                msg['From'] = sender_email
-                msg['To'] = supervisor_email
-                msg['Subject'] = f"Leave Application from {leave_application['employee_name']} (Auto-Rejected)"
-                
+        supervisor_email = leave_application["supervisor_email"]
+
+        # The balance and overlap checks run in the approval's transaction, under the intern's row lock;
+        # when they fail the application is auto-rejected instead and these notices are queued
+        def rejection_notifications(refusal):
+            # Notify the employee and the supervisor about auto-rejection
+            notifications = [telegram_notification(f"decision:{application_id}:Auto-Rejected:telegram", chat_id, [
+                (f"Your leave application has been automatically rejected due to {refusal.reason}. {refusal.message}", None)
+            ])]
+            if supervisor_email:
                 body = f"""
                 Dear Supervisor,
                 
-                The following leave application has been automatically rejected due to insufficient balance:
+                The following leave application has been automatically rejected due to {refusal.reason}:
                 
                 Employee: {leave_application['employee_name']}
                 Leave Type: {leave_application['leave_type']}
@@ -821,106 +1296,32 @@ async def auto_approve_leave(context):
                 Day Portion: {leave_application['day_portion']}
                 Duration: {leave_application['leave_duration']} day{'s' if leave_application['leave_duration'] > 1 else ''}
                 
-                Reason: {insufficient_balance_message}
+                Reason: {refusal.message}
                 
                 The employee has been notified of this rejection.
                 
                 This is an automated message from the Leave Management System.
                 """
-                
-                msg.attach(MIMEText(body, 'plain'))
-                
-                with smtplib.SMTP('smtp.gmail.com', 587) as server:
-                    server.starttls()
-                    server.login(sender_email, sender_password)
-                    server.send_message(msg)
-                    
-            except Exception as e:
-                print(f"Failed to send auto-rejection notification to supervisor: {str(e)}")
-            
-            return  # Exit function after auto-rejection
-        
-        # If balance check passed, proceed with auto-approval
-        leave_application["status"] = "Auto-Approved"
+                notifications.append(email_notification(
+                    f"decision:{application_id}:Auto-Rejected:email", supervisor_email,
+                    f"Leave Application from {leave_application['employee_name']} (Auto-Rejected)", body
+                ))
+            return notifications
+
         leave_application["approval_date"] = datetime.now()
         leave_application["decision_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        remarks_value = ""
-        
-        # Track no pay leaves by month if it's a No Pay Leave
-        if leave_application.get("leave_type") == "No Pay Leave":
-            # Generate monthly breakdown of no pay leaves
-            monthly_breakdown = {}
-            current_date = leave_application["start_date"]
-            end_date = leave_application["end_date"]
-            
-            while current_date <= end_date:
-                if current_date.weekday() < 5:  # Skip weekends
-                    month_key = current_date.strftime("%Y-%m")
-                    if month_key not in monthly_breakdown:
-                        monthly_breakdown[month_key] = 0
-                    
-                    # Add full day or half day based on day_portion
-                    day_portion = leave_application.get("day_portion", "Full Day")
-                    if day_portion in ["Half Day (AM)", "Half Day (PM)"]:
-                        monthly_breakdown[month_key] += 0.5
-                    else:
-                        monthly_breakdown[month_key] += 1
-                
-                current_date += timedelta(days=1)
-            
-            # Format monthly breakdown for remarks
-            remarks = "No Pay Leave breakdown: "
-            for month, days in monthly_breakdown.items():
-                month_name = datetime.strptime(month, "%Y-%m").strftime("%b %Y")
-                remarks += f"{month_name}: {days} day(s), "
-            remarks_value = remarks.rstrip(", ")
-            
-        # Update leave balance if needed (for AL and MC leaves) --> in intern data 
-        if leave_application.get("balance_type")=="al_balance" or leave_application.get("balance_type")=="mc_balance" or leave_application.get("balance_type")=="compassionate_balance" or leave_application.get("balance_type")=="oil_balance":
-            username = leave_application["username"]
-            balance_type = leave_application["balance_type"]
-            taken_type = leave_application["taken_type"]
-            new_balance = leave_application["new_balance"]
-            leave_duration = leave_application["leave_duration"]
-            print(new_balance,leave_duration)
-            # leave_application["remarks"] = remarks_value  # Add remarks to the application
+        remarks_value = leave_breakdown_remarks(
+            leave_type, leave_application["start_date"], leave_application["end_date"], leave_duration
+        )
             
-            if update_leave_balance(username, balance_type, leave_duration, taken_type) :
-                print(f"Leave balance updated for {username}.")
-        
-        else:
-            username = leave_application["username"]
-            leave_duration = leave_application["leave_duration"]
-            taken_type = leave_application["taken_type"]
-            update_leave_taken(username, leave_duration, taken_type)  # Update leave taken field in the database
-        
-        # Save the updated leave application
-        save_leave_application(leave_application)  
-        
         # Notify the employee
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"Your leave application (ID: {application_id[:8]}) has been automatically approved as your supervisor did not respond within 3 days."
-        )
+        notifications = [telegram_notification(f"decision:{application_id}:Auto-Approved:telegram", chat_id, [
+            (f"Your leave application (ID: {application_id[:8]}) has been automatically approved as your supervisor did not respond within 3 days.", None)
+        ])]
         
         # Notify the supervisor (optional)
-        try:
-            # Send notification email to supervisor
-            import smtplib
-            from email.mime.text import MIMEText
-            from email.mime.multipart import MIMEMultipart
-                
-            supervisor_email = intern_info["supervisor_email"]
-            sender_email = os.getenv('SENDER_EMAIL')
-            sender_password = os.getenv('SENDER_PASSWORD')
-            
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = sender_email
-            msg['To'] = supervisor_email
-            msg['Subject'] = f"Leave Application from {leave_application['employee_name']} (Auto-Approved)"
-            
+        if supervisor_email:
             body = f"""
             Dear Supervisor,
             
@@ -935,16 +1336,21 @@ async def auto_approve_leave(context):
             
             This is an automated message from the Leave Management System.
             """
+            notifications.append(email_notification(
+                f"decision:{application_id}:Auto-Approved:email", supervisor_email,
+                f"Leave Application from {leave_application['employee_name']} (Auto-Approved)", body
+            ))
             
-            msg.attach(MIMEText(body, 'plain'))
-            
-            with smtplib.SMTP('smtp.gmail.com', 587) as server:
-                server.starttls()
-                server.login(sender_email, sender_password)
-                server.send_message(msg)
-                
-        except Exception as e:
-            print(f"Failed to send auto-approval notification: {str(e)}")
+        # Approve and deduct the leave balance in one transaction, unless the supervisor decided first
+        decided, status, _ = await asyncio.to_thread(
+            decide_in_registry, registry, application_id, "Auto-Approved", remarks_value or None,
+            leave_application["decision_time"], notifications, "Auto-Rejected", rejection_notifications
+        )
+        if not decided:
+            return  # Decided by the supervisor in the meantime
+        if status == "Auto-Approved":
+            invalidate_team_availability(leave_application["employee_name"])
+        wake_notification_dispatcher(context.job_queue)
 
 # --------------------------------------
 # Section 5: Cancel Leave
@@ -964,7 +1370,7 @@ async def cancel_leave_start(update: Update, context: ContextTypes.DEFAULT_TYPE,
         return ConversationHandler.END
     
     # Get approved leaves from the database
-    approved_leaves = get_approved_leaves(username)
+    approved_leaves = await get_approved_leaves_async(username)
 
     if not approved_leaves:
         message = "You don't have any upcoming approved leaves to cancel."
@@ -1095,17 +1501,18 @@ async def confirm_cancel_handler(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
         return ConversationHandler.END
     
-    # Cancel the leave in the database
-    success = cancel_leave_application(selected_leave['application_id'], username)
+    # Cancel the leave in the database; the supervisor's notice is queued in the same transaction
+    notifications = await asyncio.to_thread(cancellation_notifications, selected_leave, username)
+    success = await asyncio.to_thread(cancel_leave_application, selected_leave['application_id'], username, notifications,
+                                      selected_leave['start_date'])
     
     if success:
+        invalidate_team_availability(selected_leave['name'])
+        wake_notification_dispatcher(context.job_queue)
         await update.message.reply_text(
             "Your leave has been successfully cancelled and your leave balance has been restored.",
             reply_markup=ReplyKeyboardRemove()
         )
-        
-        # Notify supervisor about cancellation
-        await notify_supervisor_of_cancellation(selected_leave, username)
     else:
         await update.message.reply_text(
             "There was an error cancelling your leave. Please contact HR for assistance.",
@@ -1116,36 +1523,19 @@ async def confirm_cancel_handler(update: Update, context: ContextTypes.DEFAULT_T
     return ConversationHandler.END
 
 # Alerting supervisor about leave cancellation
-async def notify_supervisor_of_cancellation(leave_details, username):
-    """Send an email to the supervisor about the leave cancellation"""
-    try:
-        # Get intern info including supervisor email
-        intern_info = get_intern_by_telegram(username)
-        if not intern_info or not intern_info.get('supervisor_email'):
-            print("Could not find supervisor email")
-            return False
-        
-        # Format dates
-        start_date = leave_details['start_date'].strftime('%d-%m-%Y') if isinstance(leave_details['start_date'], date) else leave_details['start_date']
-        end_date = leave_details['end_date'].strftime('%d-%m-%Y') if isinstance(leave_details['end_date'], date) else leave_details['end_date']
-        
-        # Import email libraries
-        import smtplib
-        from email.mime.text import MIMEText
-        from email.mime.multipart import MIMEMultipart
-        
-        # Email configuration
-        sender_email = os.getenv('SENDER_EMAIL') # Replace with your email
-        sender_password = os.getenv('SENDER_PASSWORD')  # Replace with your password or app password
-        supervisor_email = intern_info['supervisor_email']
-        
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = supervisor_email
-        msg['Subject'] = f"Leave Cancellation Notice - {intern_info['name']}"
-        
-        body = f"""
+def cancellation_notifications(leave_details, username):
+    """Build the outbox email telling the supervisor about the leave cancellation"""
+    # Get intern info including supervisor email
+    intern_info = get_intern_by_telegram(username)
+    if not intern_info or not intern_info.get('supervisor_email'):
+        logger.warning("Could not find supervisor email for %s", username)
+        return []
+    
+    # Format dates
+    start_date = leave_details['start_date'].strftime('%d-%m-%Y') if isinstance(leave_details['start_date'], date) else leave_details['start_date']
+    end_date = leave_details['end_date'].strftime('%d-%m-%Y') if isinstance(leave_details['end_date'], date) else leave_details['end_date']
+    
+    body = f"""
         Dear Supervisor,
         
         This is to inform you that {intern_info['name']} has cancelled the following leave:
@@ -1160,21 +1550,11 @@ async def notify_supervisor_of_cancellation(leave_details, username):
         Thank you,
         Leave Management System
         """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Connect to SMTP server and send email
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-        
-        print(f"Cancellation notification sent to {supervisor_email}")
-        return True
-        
-    except Exception as e:
-        print(f"Failed to send cancellation notification: {str(e)}")
-        return False
+    
+    return [email_notification(
+        f"cancel:{leave_details['application_id']}:email", intern_info['supervisor_email'],
+        f"Leave Cancellation Notice - {intern_info['name']}", body
+    )]
 
 
 
@@ -1182,17 +1562,48 @@ async def notify_supervisor_of_cancellation(leave_details, username):
 # Section 5: Main Function
 # --------------------------------------
 
+# This function forgets what an unfinished apply or cancel conversation collected
+def clear_conversation_state(user_data):
+    for key in CONVERSATION_STATE_KEYS:
+        user_data.pop(key, None)
+
 # cacnel function to go back to main menu
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel the conversation."""
+    clear_conversation_state(context.user_data)
     await update.message.reply_text("Leave application cancelled.", reply_markup=ReplyKeyboardRemove())
     await update.message.reply_text("Welcome! Choose an option:", reply_markup=main_menu())
     return ConversationHandler.END
 
+# Timeout handler of both conversations: runs once the user has not replied for CONVERSATION_TIMEOUT_MINUTES
+async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    clear_conversation_state(context.user_data)
+    if update.effective_chat:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Your request was closed after {CONVERSATION_TIMEOUT_MINUTES:g} minutes without a reply. Nothing was submitted.",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="Welcome! Choose an option:", reply_markup=main_menu())
+
 # Main function to start the bot and set up handlers
 def main() -> None:
     """Main function to start the bot"""
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = Application.builder().token(BOT_TOKEN)
+    # BOT_API_BASE_URL points the bot at a self-hosted or stand-in Bot API server instead of api.telegram.org
+    bot_api_base_url = os.getenv("BOT_API_BASE_URL")
+    if bot_api_base_url:
+        builder.base_url(f"{bot_api_base_url.rstrip('/')}/bot").base_file_url(f"{bot_api_base_url.rstrip('/')}/file/bot")
+    # Updates from different chats run concurrently; each chat's updates still run one at a time
+    application = builder.concurrent_updates(PerChatUpdateProcessor()).post_shutdown(stop_background_workers).build()
+    application.bot_data['leave_registry'] = LeaveRegistry()
+    if LEAVE_LOG_WRITE_MODE not in LEAVE_LOG_WRITE_MODES:
+        raise ValueError(f"LEAVE_LOG_WRITE_MODE must be one of {', '.join(LEAVE_LOG_WRITE_MODES)}")
+    if LEAVE_LOG_WRITE_MODE != "direct":
+        application.bot_data['leave_log_writer'] = LeaveLogWriter().start()
+    # Profiles of current interns are loaded before polling starts, so the first requests after a deploy are served from memory
+    application.bot_data['intern_cache'] = InternCache().start()
+    set_intern_cache(application.bot_data['intern_cache'])
 
     # Start Flask in a separate thread
     flask_thread = threading.Thread(target=run_web_server, args=(application,))
@@ -1212,8 +1623,10 @@ def main() -> None:
         START_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, start_date_handler)],
         END_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, end_date_handler)],
         CONFIRMATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirmation_handler)],
+        ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
+    conversation_timeout=timedelta(minutes=CONVERSATION_TIMEOUT_MINUTES),
     )
 
     # Add the new cancel leave conversation handler
@@ -1225,17 +1638,54 @@ def main() -> None:
         states={
             CHOOSE_LEAVE_TO_CANCEL: [MessageHandler(filters.TEXT & ~filters.COMMAND, choose_leave_handler)],
             CONFIRM_CANCEL: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_cancel_handler)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        conversation_timeout=timedelta(minutes=CONVERSATION_TIMEOUT_MINUTES)
     )
     
     # Register all handlers
+    # Every update first stamps its user's state as active, so idle state can be evicted
+    application.add_handler(TypeHandler(Update, record_user_activity), group=-1)
+    # Supervisors' Approve/Reject buttons come first so no conversation's catch-all callback handler takes them
+    application.add_handler(CallbackQueryHandler(supervisor_decision_handler, pattern=r"^lv:[ar]:"))
+    application.add_handler(CallbackQueryHandler(pending_page_handler, pattern=r"^pd:"))
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("supervisor", supervisor))
+    application.add_handler(CommandHandler("pending", pending))
+    application.add_handler(CallbackQueryHandler(history_page_handler, pattern=r"^hs:[np]:"))
+    application.add_handler(CommandHandler("history", history))
+    application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("availability", availability))
     application.add_handler(apply_leave_conversation)
     application.add_handler(cancel_leave_conversation)  # Add the new conversation handler
     
     # This handler should come after conversation handlers to avoid conflict
     application.add_handler(CallbackQueryHandler(button_handler))
+
+    # Internship statuses are advanced once at startup (covering any downtime) and then every night
+    application.job_queue.run_once(internship_lifecycle_job, when=0, name="internship_lifecycle_startup")
+    application.job_queue.run_daily(internship_lifecycle_job, time=dt_time(hour=0, minute=5), name="internship_lifecycle")
+
+    # Nightly consistency check of the leave analytics rollups
+    application.job_queue.run_daily(rollup_consistency_job, time=dt_time(hour=2), name="rollup_consistency")
+    application.job_queue.run_daily(ledger_snapshot_job, time=dt_time(hour=3), name="ledger_snapshot")
+    application.job_queue.run_daily(leave_log_partition_job, time=dt_time(hour=4), name="leave_log_partitions")
+    application.job_queue.run_repeating(registry_eviction_job, interval=timedelta(hours=1), name="registry_eviction")
+    application.job_queue.run_repeating(user_state_eviction_job, interval=timedelta(hours=1), name="user_state_eviction")
+    application.job_queue.run_repeating(intern_cache_stats_job, interval=timedelta(hours=1), name="intern_cache_stats")
+    application.job_queue.run_repeating(lookup_coalescing_stats_job, interval=timedelta(hours=1), name="lookup_coalescing_stats")
+    application.job_queue.run_repeating(update_processing_stats_job, interval=timedelta(minutes=1), name="update_processing_stats")
+    application.job_queue.run_repeating(log_queue_stats_job, interval=timedelta(minutes=1), name="log_queue_stats")
+    if 'leave_log_writer' in application.bot_data:
+        application.job_queue.run_repeating(leave_log_writer_stats_job, interval=timedelta(minutes=1), name="leave_log_writer_stats")
+    # Notifications queued with decisions are sent from the outbox; overlapping runs claim different rows
+    application.job_queue.run_repeating(notification_dispatch_job, interval=timedelta(seconds=NOTIFICATION_DISPATCH_INTERVAL_SECONDS),
+                                        name="notification_dispatch", job_kwargs={"max_instances": 3})
+    application.job_queue.run_repeating(notification_outbox_stats_job, interval=timedelta(minutes=1), name="notification_outbox_stats")
+    application.job_queue.run_daily(notification_outbox_prune_job, time=dt_time(hour=3, minute=30), name="notification_outbox_prune")
+    if DB_REPLICA_DSN:
+        application.job_queue.run_repeating(replica_lag_job, interval=timedelta(minutes=1), first=timedelta(seconds=10), name="replica_lag")
     
     # Run the bot
     application.run_polling()
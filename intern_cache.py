@@ -0,0 +1,161 @@
+# intern_cache.py (in-memory table of current interns' profiles, kept fresh by change notifications)
+import logging
+import os
+import select
+import threading
+import time
+
+from db_utils import (iter_current_interns, open_listen_connection, INTERN_PROFILE_COLUMNS, INTERN_CHANGES_CHANNEL)
+
+logger = logging.getLogger(__name__)
+
+# Intern cache configuration from environment variables
+#   INTERN_CACHE_RESYNC_SECONDS   full reload as a safety net for changes made while no notification could arrive (3600)
+#   INTERN_CACHE_BATCH_MS         how long notifications are collected before the handles they name are reloaded (100)
+INTERN_CACHE_RESYNC_SECONDS = int(os.getenv("INTERN_CACHE_RESYNC_SECONDS", 60 * 60))
+INTERN_CACHE_BATCH_MS = int(os.getenv("INTERN_CACHE_BATCH_MS", 100))
+# Above this many changed handles one full reload is cheaper than reloading them by name
+FULL_RELOAD_HANDLES = 500
+# Wait before reconnecting the listener after it lost the database
+RECONNECT_SECONDS = 5
+# Longest start() waits for the first warm-up before the bot starts without it
+WARM_UP_TIMEOUT_SECONDS = 60
+
+
+class InternCache:
+    """Profiles of every Active and Pending Start intern, keyed by telegram handle.
+
+    warm() loads them all with one streamed query; each profile is held as a tuple in INTERN_PROFILE_COLUMNS
+    order and get() hands out a fresh dict. A listener thread reloads the handles named by interns_new change
+    notifications, and reloads everything when it (re)connects, so nothing changed while it was away is missed.
+    Handles that are not cached (unknown, or no current internship) are misses and fall back to the database.
+    """
+
+    def __init__(self, resync_seconds=INTERN_CACHE_RESYNC_SECONDS, batch_ms=INTERN_CACHE_BATCH_MS):
+        self.resync_seconds = resync_seconds
+        self.batch = batch_ms / 1000
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+        self._warmed_at = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+        self._notifications = 0
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def start(self, timeout=WARM_UP_TIMEOUT_SECONDS):
+        """Start the listener thread and wait for its first warm-up, so the first requests are already served from memory"""
+        self._thread = threading.Thread(target=self._listen, name="intern-cache", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            logger.warning("Intern cache not warmed after %s s; lookups read the database until it is", timeout)
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def warm(self):
+        """Replace the whole table with one streamed read; returns the number of interns, or None on error"""
+        started = time.perf_counter()
+        try:
+            profiles = {row[2]: tuple(row) for row in iter_current_interns()}
+        except Exception as e:
+            logger.error("Failed to warm the intern cache: %s", e)
+            return None
+        with self._lock:
+            self._profiles = profiles
+        self._warmed_at = time.monotonic()
+        logger.info("Intern cache warmed with %s intern(s) in %.0f ms", len(profiles), (time.perf_counter() - started) * 1000)
+        return len(profiles)
+
+    def refresh(self, handles):
+        """Reload the given handles; those without a current internship any more are dropped"""
+        try:
+            rows = {row[2]: tuple(row) for row in iter_current_interns(handles)}
+        except Exception as e:
+            logger.error("Failed to refresh %s intern(s) in the cache: %s", len(handles), e)
+            # Dropping them sends their reads to the database until the next reload
+            with self._lock:
+                for handle in handles:
+                    self._profiles.pop(handle, None)
+            return
+        with self._lock:
+            for handle in handles:
+                if handle in rows:
+                    self._profiles[handle] = rows[handle]
+                else:
+                    self._profiles.pop(handle, None)
+        self._reloads += 1
+
+    def get(self, telegram_handle):
+        profile = self._profiles.get(telegram_handle)
+        if profile is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return dict(zip(INTERN_PROFILE_COLUMNS, profile))
+
+    def discard(self, telegram_handle):
+        """Forget a handle whose row was just written, until its change notification reloads it"""
+        with self._lock:
+            self._profiles.pop(telegram_handle, None)
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = open_listen_connection(INTERN_CHANGES_CHANNEL)
+                # Changes made before LISTEN took effect were not announced, so start from a full reload
+                self.warm()
+                self._ready.set()
+                while not self._stopping.is_set():
+                    handles = self._collect(conn)
+                    if handles is None:
+                        if time.monotonic() - self._warmed_at > self.resync_seconds:
+                            self.warm()
+                    elif "*" in handles or len(handles) > FULL_RELOAD_HANDLES:
+                        self.warm()
+                    elif handles:
+                        self.refresh(handles)
+            except Exception as e:
+                logger.error("Intern cache listener lost the database, reconnecting: %s", e)
+                self._stopping.wait(RECONNECT_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _collect(self, conn):
+        """Wait up to a second for notifications and gather the handles they name over the next batch window
+        Returns a set of handles, or None if nothing arrived"""
+        if not select.select([conn], [], [], 1.0)[0]:
+            return None
+        handles = set()
+        deadline = time.monotonic() + self.batch
+        while True:
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self._notifications += 1
+                handles.update(notify.payload.split(","))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([conn], [], [], remaining)[0]:
+                return handles
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            "interns": len(self._profiles),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0,
+            "notifications": self._notifications,
+            "reloads": self._reloads,
+            "warmed_seconds_ago": round(time.monotonic() - self._warmed_at) if self._warmed_at else None,
+        }
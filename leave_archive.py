@@ -0,0 +1,121 @@
+# leave_archive.py (archives old years of the partitioned leave log)
+#
+#   python leave_archive.py list
+#   python leave_archive.py archive --before 2024 --out-dir archive/
+#   python leave_archive.py restore archive/leave_logs_y2022.csv.gz
+#
+# archive detaches every yearly partition of leave_logs_new that starts before the given year, writes it to a
+# gzip-compressed CSV, checks the row count and drops the detached table (unless --keep-table), so the live
+# table only holds recent years and vacuum and backups no longer walk the old ones.
+# restore loads such a file back into a partition and attaches it again.
+import argparse
+import csv
+import gzip
+import logging
+import os
+import sys
+from datetime import date
+
+from log_utils import setup_logging
+setup_logging()
+from db_utils import (get_connection, release_connection, get_leave_log_partitions, detach_leave_log_partition,
+                      attach_leave_log_partition, LEAVE_LOG_COLUMNS, LEAVE_LOG_PARTITION_PREFIX)
+
+logger = logging.getLogger(__name__)
+
+
+# This function writes a detached partition to <out_dir>/<partition>.csv.gz and drops it once the file holds every row
+# Returns the archive path, or None if the export failed (the detached table is then left in place)
+def export_partition(partition, out_dir, keep_table=False):
+    path = os.path.join(out_dir, f"{partition}.csv.gz")
+    columns = ", ".join(LEAVE_LOG_COLUMNS)
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {partition}")
+        expected_rows = cursor.fetchone()[0]
+        with gzip.open(path, "wt", newline="") as archive:
+            cursor.copy_expert(f"COPY {partition} ({columns}) TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+
+        with gzip.open(path, "rt", newline="") as archive:
+            written_rows = sum(1 for _ in csv.reader(archive)) - 1
+        if written_rows != expected_rows:
+            raise RuntimeError(f"archive holds {written_rows} row(s), {partition} has {expected_rows}")
+
+        if not keep_table:
+            cursor.execute(f"DROP TABLE {partition}")
+        conn.commit()
+        logger.info("Archived %s row(s) of %s to %s", expected_rows, partition, path)
+        return path
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error("Failed to archive %s: %s", partition, e)
+        return None
+    finally:
+        if conn:
+            release_connection(conn)
+
+
+# This function loads an archive written by export_partition back into leave_logs_new as its year's partition
+def restore_partition(path):
+    partition = os.path.basename(path).split(".")[0]
+    with gzip.open(path, "rt", newline="") as archive:
+        return attach_leave_log_partition(int(partition[len(LEAVE_LOG_PARTITION_PREFIX):]), archive)
+
+
+def list_partitions():
+    partitions = get_leave_log_partitions()
+    if partitions is None:
+        return 1
+    for partition in partitions:
+        print(f"{partition['name']:<20}{partition['estimated_rows']:>10} rows{partition['size_bytes'] / 1024 / 1024:>10.1f} MB"
+              f"{partition['pending']:>6} pending")
+    return 0
+
+
+def archive_partitions(before_year, out_dir, keep_table=False):
+    partitions = get_leave_log_partitions()
+    if partitions is None:
+        return 1
+    os.makedirs(out_dir, exist_ok=True)
+    failures = 0
+    for partition in partitions:
+        if partition['year'] >= before_year:
+            continue
+        # Last year still takes backdated applications, and its partition would be recreated every night
+        if partition['year'] >= date.today().year - 1:
+            logger.warning("Skipping %s: only years before %s can be archived", partition['name'], date.today().year - 1)
+            continue
+        # Pending applications still need a decision, which has to find them in leave_logs_new
+        if partition['pending']:
+            logger.warning("Skipping %s: %s application(s) still pending", partition['name'], partition['pending'])
+            failures += 1
+            continue
+        if not detach_leave_log_partition(partition['year']) or not export_partition(partition['name'], out_dir, keep_table):
+            failures += 1
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old years of the leave log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the leave log partitions")
+    archive = commands.add_parser("archive", help="detach, compress and drop partitions before a year")
+    archive.add_argument("--before", type=int, required=True, help="archive partitions of years before this one")
+    archive.add_argument("--out-dir", default="archive", help="directory the .csv.gz files are written to")
+    archive.add_argument("--keep-table", action="store_true", help="keep the detached table after exporting it")
+    restore = commands.add_parser("restore", help="load an archived partition back into the leave log")
+    restore.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        return list_partitions()
+    if args.command == "archive":
+        return archive_partitions(args.before, args.out_dir, args.keep_table)
+    return 0 if restore_partition(args.path) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# leave_log_writer.py (write-behind buffer that groups leave-log inserts into batches)
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from db_utils import save_leave_application, save_leave_applications
+
+# Leave-log write configuration from environment variables
+#   LEAVE_LOG_WRITE_MODE          "direct" saves each application with its own INSERT and commit (default)
+#                                 "durable" batches the inserts and waits for the batch to commit before the intern is told
+#                                 "buffered" batches the inserts and tells the intern at once; the supervisor is emailed
+#                                 after the batch commits (an overlapping application submitted before then is only
+#                                 caught by the overlap check when it is decided)
+#   LEAVE_LOG_FLUSH_INTERVAL_MS   longest an application waits for its batch (50)
+#   LEAVE_LOG_MAX_BATCH           applications per INSERT (500)
+LEAVE_LOG_WRITE_MODES = ("direct", "durable", "buffered")
+LEAVE_LOG_WRITE_MODE = os.getenv("LEAVE_LOG_WRITE_MODE", "direct")
+LEAVE_LOG_FLUSH_INTERVAL_MS = int(os.getenv("LEAVE_LOG_FLUSH_INTERVAL_MS", 50))
+LEAVE_LOG_MAX_BATCH = int(os.getenv("LEAVE_LOG_MAX_BATCH", 500))
+
+# Number of recent flushes kept for the percentiles in stats()
+FLUSH_SAMPLES = 1000
+
+
+class LeaveLogWriter:
+    """Collects leave applications from any thread and saves them with one multi-row INSERT per flush.
+
+    submit() returns a Future that resolves to True once the application's batch has committed (False if
+    it could not be saved). A flush starts when the oldest waiting application has waited flush_interval_ms
+    or max_batch applications are waiting. If a batch fails, its applications are retried one by one, so a
+    single bad row only fails its own application.
+    """
+
+    def __init__(self, flush_interval_ms=LEAVE_LOG_FLUSH_INTERVAL_MS, max_batch=LEAVE_LOG_MAX_BATCH):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._flushes = 0
+        self._rows = 0
+        self._failed_batches = 0
+        self._batch_sizes = deque(maxlen=FLUSH_SAMPLES)
+        self._flush_latencies = deque(maxlen=FLUSH_SAMPLES)
+        self._max_flush_latency = 0.0
+        self._max_queue_wait = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="leave-log-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Flush what is waiting and stop the writer thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def submit(self, application):
+        future = Future()
+        with self._condition:
+            if self._stopping:
+                # Nothing will flush any more, so save it straight away
+                future.set_result(save_leave_application(application))
+                return future
+            self._pending.append((application, future, time.perf_counter()))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._condition.notify_all()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                deadline = self._pending[0][2] + self.flush_interval
+                while len(self._pending) < self.max_batch and not self._stopping:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        applications = [application for application, _, _ in batch]
+        saved = save_leave_applications(applications)
+        if saved or len(batch) == 1:
+            results = [saved] * len(batch)
+        else:
+            self._failed_batches += 1
+            results = [save_leave_application(application) for application in applications]
+        latency = time.perf_counter() - started
+
+        self._flushes += 1
+        self._rows += len(batch)
+        self._batch_sizes.append(len(batch))
+        self._flush_latencies.append(latency)
+        self._max_flush_latency = max(self._max_flush_latency, latency)
+        self._max_queue_wait = max(self._max_queue_wait, started - batch[0][2])
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self, reset_max=False):
+        """Batch size and flush latency figures; reset_max starts a new window for the max_* values"""
+        sizes = sorted(self._batch_sizes)
+        latencies = sorted(self._flush_latencies)
+
+        def percentile(samples, fraction):
+            return samples[min(len(samples) - 1, round(fraction * (len(samples) - 1)))] if samples else 0
+
+        stats = {
+            "waiting": len(self._pending),
+            "flushes": self._flushes,
+            "rows": self._rows,
+            "failed_batches": self._failed_batches,
+            "batch_size_p50": percentile(sizes, 0.50),
+            "batch_size_max": sizes[-1] if sizes else 0,
+            "flush_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "flush_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "max_flush_ms": round(self._max_flush_latency * 1000, 1),
+            "max_queue_wait_ms": round(self._max_queue_wait * 1000, 1),
+        }
+        if reset_max:
+            self._max_flush_latency = 0.0
+            self._max_queue_wait = 0.0
+        return stats
@@ -0,0 +1,180 @@
+# leave_registry.py (in-memory registry of submitted leave applications)
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# How long decided applications stay in memory before eviction (default 3 days)
+FINISHED_RETENTION_SECONDS = int(os.getenv("LEAVE_REGISTRY_RETENTION_SECONDS", 3 * 24 * 60 * 60))
+
+
+class LeaveApplication:
+    """A submitted leave application.
+
+    Fields are slots rather than a per-instance dict. Item access (application["status"]) is kept so
+    records can be passed straight to save_leave_application and the existing handlers; like the dicts
+    they replaced, fields that were never set read as None and only unknown fields raise KeyError.
+    Status changes go through LeaveRegistry.transition so the registry's indexes stay correct.
+    """
+
+    __slots__ = (
+        "id", "chat_id", "username", "employee_name", "supervisor_email", "leave_type",
+        "start_date", "end_date", "day_portion", "leave_duration", "status", "submission_time",
+        "auto_approve_time", "decision_time", "approval_date", "balance_type", "new_balance",
+        "taken_type", "remarks", "finished_at"
+    )
+
+    def __init__(self, **fields):
+        unknown = set(fields) - set(self.__slots__)
+        if unknown:
+            raise KeyError(f"Unknown leave application field(s): {', '.join(sorted(unknown))}")
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key == "status":
+            raise KeyError("status is changed through LeaveRegistry.transition")
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+
+class LeaveRegistry:
+    """Thread-safe registry of leave applications, shared by the bot loop and the web thread.
+
+    Applications are indexed by id, username and supervisor email. Status transitions are O(1) and
+    decided applications are queued in decision order, so evicting the ones past the retention
+    period only touches the evicted entries.
+    """
+
+    def __init__(self, retention_seconds=FINISHED_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._lock = threading.RLock()
+        self._applications = {}
+        self._by_username = {}
+        self._by_supervisor = {}
+        self._pending = 0
+        self._finished = deque()  # (finished_at, application_id) in decision order
+
+    def __len__(self):
+        return len(self._applications)
+
+    def __contains__(self, application_id):
+        return application_id in self._applications
+
+    @property
+    def pending_count(self):
+        return self._pending
+
+    def add(self, application):
+        with self._lock:
+            if application.id in self._applications:
+                self._remove(application.id)
+            self._applications[application.id] = application
+            self._by_username.setdefault(application.username, set()).add(application.id)
+            self._by_supervisor.setdefault(application.supervisor_email, set()).add(application.id)
+            if application.status == "Pending":
+                self._pending += 1
+            else:
+                application.finished_at = time.time()
+                self._finished.append((application.finished_at, application.id))
+        return application
+
+    def get(self, application_id):
+        return self._applications.get(application_id)
+
+    def remove(self, application_id):
+        with self._lock:
+            return self._remove(application_id)
+
+    def _remove(self, application_id):
+        application = self._applications.pop(application_id, None)
+        if application is None:
+            return None
+        for index, key in ((self._by_username, application.username), (self._by_supervisor, application.supervisor_email)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(application_id)
+                if not ids:
+                    del index[key]
+        if application.status == "Pending":
+            self._pending -= 1
+        return application
+
+    def for_username(self, username, status=None):
+        with self._lock:
+            return self._select(self._by_username.get(username, ()), status)
+
+    def for_supervisor(self, supervisor_email, status=None):
+        with self._lock:
+            return self._select(self._by_supervisor.get(supervisor_email, ()), status)
+
+    def _select(self, application_ids, status):
+        applications = (self._applications[application_id] for application_id in application_ids)
+        return [application for application in applications if status is None or application.status == status]
+
+    def transition(self, application_id, new_status, expected_status="Pending"):
+        """Move an application to new_status if it is currently expected_status; returns True on success"""
+        with self._lock:
+            application = self._applications.get(application_id)
+            if application is None:
+                return False
+            if expected_status is not None and application.status != expected_status:
+                return False
+            if application.status == "Pending" and new_status != "Pending":
+                self._pending -= 1
+                application.finished_at = time.time()
+                self._finished.append((application.finished_at, application_id))
+            elif application.status != "Pending" and new_status == "Pending":
+                self._pending += 1
+                application.finished_at = None
+            application.status = new_status
+            return True
+
+    def evict_finished(self, now=None):
+        """Drop decided applications older than the retention period; returns how many were evicted"""
+        cutoff = (now or time.time()) - self.retention_seconds
+        evicted = 0
+        with self._lock:
+            while self._finished and self._finished[0][0] <= cutoff:
+                finished_at, application_id = self._finished.popleft()
+                application = self._applications.get(application_id)
+                # Skip queue entries left behind by re-added or re-opened applications
+                if application is not None and application.finished_at == finished_at:
+                    self._remove(application_id)
+                    evicted += 1
+        return evicted
+
+    def memory_footprint(self):
+        """Approximate memory held by the registry (records, field values and indexes)"""
+        with self._lock:
+            record_bytes = 0
+            for application in self._applications.values():
+                record_bytes += sys.getsizeof(application)
+                record_bytes += sum(
+                    sys.getsizeof(value)
+                    for value in (getattr(application, name) for name in LeaveApplication.__slots__)
+                    if value is not None
+                )
+            index_bytes = sys.getsizeof(self._applications) + sys.getsizeof(self._finished)
+            for index in (self._by_username, self._by_supervisor):
+                index_bytes += sys.getsizeof(index) + sum(sys.getsizeof(ids) for ids in index.values())
+            return {
+                "applications": len(self._applications),
+                "pending": self._pending,
+                "finished": len(self._applications) - self._pending,
+                "approx_bytes": record_bytes + index_bytes
+            }
@@ -0,0 +1,153 @@
+# log_utils.py (structured, non-blocking logging for the bot, the web server and db_utils)
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Logging configuration from environment variables
+#   LOG_LEVEL              default level for every logger (INFO)
+#   LOG_LEVELS             per-module levels, e.g. "db_utils=DEBUG,webserver=WARNING"
+#   LOG_FORMAT             "json" (default) or "text"
+#   LOG_DEBUG_SAMPLE_RATE  fraction of DEBUG records kept (1.0 keeps all)
+#   LOG_QUEUE_SIZE         records buffered for the writer thread before new ones are dropped
+DEFAULT_MODULE_LEVELS = {"httpx": "WARNING"}
+
+# Attributes every LogRecord has; anything else came in through extra= and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any extra= fields"""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sample_rate":
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps a fraction of DEBUG records; a record may carry its own rate via extra={"sample_rate": ...}"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        return rate >= 1 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; when the queue is full the record is dropped, never waited on"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args into the message and render any traceback now, keeping extra= fields on the record
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# This function returns how many records were dropped because the queue was full, optionally resetting the count
+def dropped_log_records(reset=False):
+    if _queue_handler is None:
+        return 0
+    dropped = _queue_handler.dropped
+    if reset:
+        # Only subtract what was read, so records dropped meanwhile are reported next time
+        _queue_handler.dropped -= dropped
+    return dropped
+
+
+# This function stops the writer thread at exit and writes the total of records dropped since the last report
+# straight to the output, as nothing drains the queue any more
+def _stop_listener(writer):
+    _listener.stop()
+    dropped = dropped_log_records(reset=True)
+    if dropped:
+        writer.handle(logging.makeLogRecord({
+            "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+            "msg": "%s log record(s) dropped because the log queue was full", "args": (dropped,),
+        }))
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        if level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+# This function routes all logging through a queue drained by a background writer thread
+# Safe to call more than once; only the first call configures logging
+def setup_logging():
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    module_levels = dict(DEFAULT_MODULE_LEVELS)
+    module_levels.update(_parse_levels(os.getenv("LOG_LEVELS", "")))
+    for name, level in module_levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _queue_handler = queue_handler
+    _listener = logging.handlers.QueueListener(log_queue, writer)
+    _listener.start()
+    atexit.register(_stop_listener, writer)
+    return _listener
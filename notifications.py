@@ -0,0 +1,152 @@
+# notifications.py (transactional outbox for intern Telegram messages and supervisor emails)
+#
+# Decisions, cancellations and expiries write their notifications to notification_outbox in the same database
+# transaction as the change they report (see _enqueue_notifications in db_utils), so a request never waits for
+# the Bot API or SMTP and a notification is sent if and only if its change committed. The bot drains the outbox
+# with notification_dispatch_job: every NOTIFICATION_DISPATCH_INTERVAL_SECONDS, and at once when the bot process
+# itself queued something (wake_notification_dispatcher).
+import asyncio
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from db_utils import claim_notifications, complete_notifications
+from email_utils import send_email
+
+logger = logging.getLogger(__name__)
+
+# Dispatcher configuration from environment variables
+#   NOTIFICATION_DISPATCH_INTERVAL_SECONDS   how often the outbox is polled (1)
+#   NOTIFICATION_BATCH_SIZE                  notifications claimed per round (50)
+#   NOTIFICATION_RETRY_BASE_SECONDS          first retry delay, doubled per attempt up to an hour (5)
+NOTIFICATION_DISPATCH_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_DISPATCH_INTERVAL_SECONDS", 1))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 50))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", 5))
+NOTIFICATION_RETRY_MAX_SECONDS = 60 * 60
+
+
+# This function builds an outbox entry with one or more Telegram messages for a chat, sent in order;
+# messages is a list of (text, reply_markup) like the bot's own send_message calls
+def telegram_notification(idempotency_key, chat_id, messages):
+    return {
+        "idempotency_key": idempotency_key,
+        "channel": "telegram",
+        "recipient": str(chat_id),
+        "payload": {"messages": [
+            {"text": text, "reply_markup": reply_markup.to_dict() if reply_markup else None}
+            for text, reply_markup in messages
+        ]},
+    }
+
+
+# This function builds an outbox entry for a plain-text email
+def email_notification(idempotency_key, to, subject, body):
+    return {
+        "idempotency_key": idempotency_key,
+        "channel": "email",
+        "recipient": to,
+        "payload": {"subject": subject, "body": body},
+    }
+
+
+# This function sends a Telegram notification's messages from `progress` on
+# Returns how many of its messages have been delivered; a failure is raised with that count attached
+async def _send_telegram(bot, notification):
+    delivered = notification["progress"]
+    try:
+        for message in notification["payload"]["messages"][delivered:]:
+            reply_markup = InlineKeyboardMarkup.de_json(message["reply_markup"], bot) if message["reply_markup"] else None
+            await bot.send_message(chat_id=int(notification["recipient"]), text=message["text"], reply_markup=reply_markup)
+            delivered += 1
+    except Exception as e:
+        e.delivered = delivered
+        raise
+    return delivered
+
+
+def _send_email(notification):
+    sender_email = os.getenv('SENDER_EMAIL')
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = notification["recipient"]
+    msg['Subject'] = notification["payload"]["subject"]
+    # A retry carries the same Message-ID, so a mail server that accepted the first try can drop the duplicate
+    domain = sender_email.rsplit("@", 1)[-1] if sender_email and "@" in sender_email else "leave-bot.local"
+    msg['Message-ID'] = f"<{hashlib.sha256(notification['idempotency_key'].encode()).hexdigest()[:32]}@{domain}>"
+    msg.attach(MIMEText(notification["payload"]["body"], 'plain'))
+    send_email(msg)
+
+
+# This function sends one recipient's notifications in outbox order and reports each result
+# Returns a list of (notification, error, progress); error is None for a sent notification
+async def _send_to_recipient(bot, notifications):
+    results = []
+    for index, notification in enumerate(notifications):
+        try:
+            if notification["channel"] == "telegram":
+                progress = await _send_telegram(bot, notification)
+            else:
+                await asyncio.to_thread(_send_email, notification)
+                progress = 0
+            results.append((notification, None, progress))
+        except Exception as e:
+            results.append((notification, e, getattr(e, "delivered", notification["progress"])))
+            # Later messages to the same chat wait for this one, so they are not delivered out of order
+            if notification["channel"] == "telegram":
+                results.extend((later, e, later["progress"]) for later in notifications[index + 1:])
+                break
+    return results
+
+
+# This function returns when a failed notification is tried again, or None if retrying cannot help
+def _retry_in(notification, error):
+    if isinstance(error, RetryAfter):
+        return float(error.retry_after)
+    # A blocked bot or an unknown chat will not change by retrying
+    if isinstance(error, (Forbidden, BadRequest)):
+        return None
+    return min(NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (notification["attempts"] - 1), NOTIFICATION_RETRY_MAX_SECONDS)
+
+
+# This function claims one batch of due notifications and sends them, different recipients concurrently
+# Returns (sent, failed) counts, or None if the batch could not be claimed
+async def dispatch_notifications(bot, limit=NOTIFICATION_BATCH_SIZE):
+    notifications = await asyncio.to_thread(claim_notifications, limit)
+    if not notifications:
+        return None if notifications is None else (0, 0)
+
+    by_recipient = defaultdict(list)
+    for notification in notifications:
+        by_recipient[(notification["channel"], notification["recipient"])].append(notification)
+    batches = await asyncio.gather(*(_send_to_recipient(bot, queued) for queued in by_recipient.values()))
+
+    sent_ids, failures = [], []
+    for notification, error, progress in (result for batch in batches for result in batch):
+        if error is None:
+            sent_ids.append(notification["id"])
+        else:
+            logger.warning("Notification %s (%s) not sent on attempt %s: %s", notification["id"],
+                           notification["idempotency_key"], notification["attempts"], error)
+            failures.append((notification["id"], error, progress, _retry_in(notification, error)))
+    await asyncio.to_thread(complete_notifications, sent_ids, failures)
+    return len(sent_ids), len(failures)
+
+
+# Repeating job: drain the outbox batch by batch until nothing is due
+async def notification_dispatch_job(context) -> None:
+    while True:
+        dispatched = await dispatch_notifications(context.bot)
+        if dispatched is None or sum(dispatched) < NOTIFICATION_BATCH_SIZE:
+            return
+
+
+# This function runs the dispatcher right away, for notifications queued by the bot process (including its web
+# server thread); claiming skips rows another run holds, so it may overlap the repeating job
+def wake_notification_dispatcher(job_queue):
+    job_queue.run_once(notification_dispatch_job, when=0)
@@ -0,0 +1,79 @@
+# single_flight.py (coalesces concurrent identical lookups into one in-flight query)
+import asyncio
+import copy
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving while it runs wait for and share its result.
+
+    do() is for threads (the web server, asyncio.to_thread workers, handlers calling db_utils directly) and
+    do_async() for coroutines; both join the same flights, since a flight is a concurrent.futures.Future.
+    Followers get a deep copy of the leader's result, so no caller sees another's mutations, and an exception
+    is raised in every caller of the flight. forget() detaches a key's running flight so later callers start a
+    fresh one, for data that was just written.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._started = Counter()
+        self._shared = Counter()
+
+    def _join(self, key):
+        """Returns (future, leader): the key's running flight, or a new one this caller has to run"""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self._shared[key[0]] += 1
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            self._started[key[0]] += 1
+            return future, True
+
+    def _land(self, key, future, function, args):
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is future:
+                    del self._flights[key]
+
+    def do(self, key, function, *args):
+        """Return function(*args), sharing the call with concurrent callers of the same key.
+        key is a tuple whose first item names the kind of lookup in stats()"""
+        future, leader = self._join(key)
+        if leader:
+            self._land(key, future, function, args)
+            return future.result()
+        return copy.deepcopy(future.result())
+
+    async def do_async(self, key, function, *args):
+        """Like do(), for coroutines: the call runs in a worker thread and the event loop is never blocked"""
+        future, leader = self._join(key)
+        if leader:
+            await asyncio.to_thread(self._land, key, future, function, args)
+            return future.result()
+        return copy.deepcopy(await asyncio.wrap_future(future))
+
+    def forget(self, key):
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def stats(self, reset=False):
+        """Calls started and duplicate calls suppressed, per kind of lookup"""
+        with self._lock:
+            stats = {
+                kind: {"queries": self._started[kind], "suppressed": self._shared[kind]}
+                for kind in set(self._started) | set(self._shared)
+            }
+            stats["in_flight"] = len(self._flights)
+            if reset:
+                self._started.clear()
+                self._shared.clear()
+        return stats
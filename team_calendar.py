@@ -0,0 +1,105 @@
+# team_calendar.py (day-by-intern availability grids for a supervisor's team)
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from db_utils import get_team_leaves
+
+# Day portions that only take half of the day off
+HALF_DAY_PORTIONS = ("Half Day (AM)", "Half Day (PM)")
+
+# Cached grids per (supervisor, start date, end date); entries are dropped when a team member's leave
+# is approved or cancelled, and otherwise expire so roster changes are picked up
+CACHE_SECONDS = int(os.getenv("TEAM_CALENDAR_CACHE_SECONDS", 600))
+CACHE_MAX_ENTRIES = 256
+
+_cache = {}
+_cache_lock = threading.Lock()
+# Bumped on every invalidation so a grid read before an approve/cancel is never cached after it
+_generation = 0
+
+# This function builds the availability matrix: one row per intern, one column per day,
+# 0 = available, 0.5 = half day off, 1 = full day off
+def build_availability_grid(interns, leaves, start_date, end_date):
+    days = (end_date - start_date).days + 1
+    grid = np.zeros((len(interns), days), dtype=np.float32)
+
+    if leaves:
+        row_of = {intern['name']: row for row, intern in enumerate(interns)}
+        rows = np.array([row_of[leave['name']] for leave in leaves])
+        first_day = np.array([(leave['start_date'] - start_date).days for leave in leaves])
+        last_day = np.array([(leave['end_date'] - start_date).days for leave in leaves])
+        portion = np.array([0.5 if leave['day_portion'] in HALF_DAY_PORTIONS else 1.0 for leave in leaves],
+                           dtype=np.float32)
+
+        # leaves x days coverage mask, folded into the intern rows in one pass; an AM and a PM half day
+        # on the same date add up to a full day, and overlapping leaves never count for more than one
+        offsets = np.arange(days)
+        covered = (offsets >= first_day[:, None]) & (offsets <= last_day[:, None])
+        np.add.at(grid, rows, covered * portion[:, None])
+        np.minimum(grid, 1, out=grid)
+
+    # Leave is never counted on weekends
+    weekends = (np.arange(days) + start_date.weekday()) % 7 >= 5
+    grid[:, weekends] = 0
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'days': [start_date + timedelta(days=offset) for offset in range(days)],
+        'weekends': weekends,
+        'interns': [intern['name'] for intern in interns],
+        'grid': grid
+    }
+
+# This function returns the (cached) availability grid of a supervisor's team for a date window
+def get_team_availability(supervisor_email, start_date, end_date):
+    key = (supervisor_email, start_date, end_date)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and now - entry['cached_at'] < CACHE_SECONDS:
+            return entry['availability']
+        generation = _generation
+
+    interns, leaves = get_team_leaves(supervisor_email, start_date, end_date)
+    if interns is None:
+        return None
+    availability = build_availability_grid(interns, leaves, start_date, end_date)
+
+    with _cache_lock:
+        if generation != _generation:
+            return availability
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            _cache.pop(next(iter(_cache)))
+        _cache[key] = {
+            'cached_at': now,
+            'names': set(availability['interns']),
+            'availability': availability
+        }
+    return availability
+
+# This function drops every cached grid that includes the given intern (call on approve or cancel)
+def invalidate_team_availability(employee_name):
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for key in [key for key, entry in _cache.items() if employee_name in entry['names']]:
+            del _cache[key]
+
+# This function renders a grid as a monospace table for Telegram
+# X = full day off, / = half day off, . = available, blank = weekend
+def format_availability(availability, name_width=12):
+    header = " " * name_width + " " + "".join(day.strftime("%a")[0] for day in availability['days'])
+    dates = " " * name_width + " " + "".join(str(day.day % 10) for day in availability['days'])
+    lines = [header, dates]
+    for name, row in zip(availability['interns'], availability['grid']):
+        cells = "".join(
+            " " if weekend else ("X" if value >= 1 else "/" if value > 0 else ".")
+            for value, weekend in zip(row, availability['weekends'])
+        )
+        lines.append(f"{name[:name_width]:<{name_width}} {cells}")
+    return "\n".join(lines)
@@ -0,0 +1,126 @@
+# tests/test_approval_tokens.py (signing, expiry and kinds of the tokens in approval and review links)
+import time
+from datetime import date
+
+import pytest
+
+import approval_tokens
+from approval_tokens import (create_approval_token, create_bulk_review_token, create_supervisor_link_token,
+                             verify_approval_token, verify_bulk_review_token, verify_supervisor_link_token)
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setenv("APPROVAL_SECRET", "test-secret")
+    monkeypatch.delenv("BOT_TOKEN", raising=False)
+
+
+def tokens():
+    return {
+        "approval": create_approval_token("app-1", "approve"),
+        "bulk_review": create_bulk_review_token("boss@example.com"),
+        "supervisor_link": create_supervisor_link_token("boss@example.com", 42, "boss"),
+    }
+
+
+VERIFIERS = {
+    "approval": verify_approval_token,
+    "bulk_review": verify_bulk_review_token,
+    "supervisor_link": verify_supervisor_link_token,
+}
+
+
+def test_tokens_round_trip():
+    assert verify_approval_token(create_approval_token("app-1", "approve")) == ("app-1", "approve", None)
+    assert verify_approval_token(create_approval_token("app-1", "reject")) == ("app-1", "reject", None)
+    assert verify_bulk_review_token(create_bulk_review_token("boss@example.com")) == "boss@example.com"
+    assert verify_supervisor_link_token(create_supervisor_link_token("boss@example.com", 42, "boss")) == \
+        ("boss@example.com", 42, "boss")
+    assert verify_supervisor_link_token(create_supervisor_link_token("boss@example.com", 42, None)) == \
+        ("boss@example.com", 42, None)
+
+
+def test_approval_token_carries_the_start_date():
+    token = create_approval_token("app-1", "approve", start_date=date(2026, 3, 2))
+    assert verify_approval_token(token) == ("app-1", "approve", date(2026, 3, 2))
+
+
+def test_approval_token_without_a_start_date_still_verifies():
+    # Links sent before tokens carried the start date name only the application
+    payload = approval_tokens._b64encode(f"app-1|reject|{int(time.time()) + 60}".encode())
+    assert verify_approval_token(f"{payload}.{approval_tokens._signature(payload)}") == ("app-1", "reject", None)
+
+
+def test_unknown_approval_action_is_refused():
+    with pytest.raises(ValueError):
+        create_approval_token("app-1", "delete")
+
+
+@pytest.mark.parametrize("kind", VERIFIERS)
+def test_tampered_signature_is_rejected(kind):
+    payload, signature = tokens()[kind].split(".")
+    tampered = signature[:-1] + ("A" if signature[-1] != "A" else "B")
+    assert VERIFIERS[kind](f"{payload}.{tampered}") is None
+
+
+@pytest.mark.parametrize("kind", VERIFIERS)
+def test_token_signed_with_another_secret_is_rejected(kind, monkeypatch):
+    monkeypatch.setenv("APPROVAL_SECRET", "someone-elses-secret")
+    forged = tokens()[kind]
+    monkeypatch.setenv("APPROVAL_SECRET", "test-secret")
+    assert VERIFIERS[kind](forged) is None
+
+
+def test_rewritten_payload_keeps_no_signature():
+    # Turning a reject link into an approve link invalidates the signature
+    _, signature = create_approval_token("app-1", "reject").split(".")
+    payload, _ = create_approval_token("app-1", "approve").split(".")
+    assert verify_approval_token(f"{payload}.{signature}") is None
+
+
+@pytest.mark.parametrize("kind", VERIFIERS)
+def test_expired_token_is_rejected(kind):
+    token = tokens()[kind]
+    assert VERIFIERS[kind](token) is not None
+    assert VERIFIERS[kind](token, now=time.time() + 30 * 24 * 60 * 60) is None
+
+
+def test_ttl_sets_the_expiry():
+    token = create_approval_token("app-1", "approve", ttl_seconds=60)
+    assert verify_approval_token(token, now=time.time() + 30) == ("app-1", "approve", None)
+    assert verify_approval_token(token, now=time.time() + 120) is None
+
+
+@pytest.mark.parametrize("kind", VERIFIERS)
+@pytest.mark.parametrize("verifier", VERIFIERS)
+def test_token_kinds_cannot_be_swapped(kind, verifier):
+    result = VERIFIERS[verifier](tokens()[kind])
+    assert (result is not None) == (kind == verifier)
+
+
+def test_crafted_email_cannot_pass_as_an_approval():
+    # The kind and expiry are the last fields, written by the signer, whatever the email contains
+    token = create_bulk_review_token("app-1|approve|99999999999")
+    assert verify_approval_token(token) is None
+    assert verify_bulk_review_token(token) == "app-1|approve|99999999999"
+
+
+@pytest.mark.parametrize("token", [None, "", "no-signature", "a.b.c", "!!!.???", 12345])
+def test_malformed_tokens_are_rejected(token):
+    for verifier in VERIFIERS.values():
+        assert verifier(token) is None
+
+
+def test_secret_falls_back_to_the_bot_token(monkeypatch):
+    monkeypatch.delenv("APPROVAL_SECRET")
+    monkeypatch.setenv("BOT_TOKEN", "123:abc")
+    token = create_approval_token("app-1", "approve")
+    assert verify_approval_token(token) == ("app-1", "approve", None)
+    monkeypatch.setenv("BOT_TOKEN", "456:def")
+    assert verify_approval_token(token) is None
+
+
+def test_signing_without_any_secret_fails_loudly(monkeypatch):
+    monkeypatch.delenv("APPROVAL_SECRET")
+    with pytest.raises(RuntimeError):
+        approval_tokens.create_approval_token("app-1", "approve")
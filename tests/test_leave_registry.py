@@ -0,0 +1,102 @@
+# tests/test_leave_registry.py (LeaveApplication item access and LeaveRegistry indexes, transitions and eviction)
+import pytest
+
+from leave_registry import LeaveApplication, LeaveRegistry
+
+
+def application(application_id, username="alice", supervisor_email="boss@example.com", status="Pending", **fields):
+    return LeaveApplication(id=application_id, username=username, supervisor_email=supervisor_email, status=status,
+                            leave_type="Annual Leave", **fields)
+
+
+def test_unset_fields_read_as_none_and_unknown_fields_raise():
+    leave = application("app-1")
+    assert leave["remarks"] is None
+    assert leave.get("remarks", "") == ""
+    assert "remarks" not in leave
+    assert "leave_type" in leave
+    with pytest.raises(KeyError):
+        leave["no_such_field"]
+    with pytest.raises(KeyError):
+        LeaveApplication(no_such_field=1)
+
+
+def test_item_assignment_cannot_change_the_status():
+    leave = application("app-1")
+    leave["remarks"] = "ok"
+    assert leave["remarks"] == "ok"
+    with pytest.raises(KeyError):
+        leave["status"] = "Approved"
+    with pytest.raises(KeyError):
+        leave["no_such_field"] = 1
+
+
+def test_indexes_follow_adds_and_removes():
+    registry = LeaveRegistry()
+    registry.add(application("app-1"))
+    registry.add(application("app-2", username="bob"))
+    registry.add(application("app-3", supervisor_email="other@example.com"))
+    assert len(registry) == 3 and registry.pending_count == 3
+    assert {leave.id for leave in registry.for_username("alice")} == {"app-1", "app-3"}
+    assert {leave.id for leave in registry.for_supervisor("boss@example.com")} == {"app-1", "app-2"}
+
+    registry.remove("app-1")
+    assert "app-1" not in registry
+    assert registry.pending_count == 2
+    assert [leave.id for leave in registry.for_username("alice")] == ["app-3"]
+    assert registry.remove("app-1") is None
+
+
+def test_re_adding_an_application_replaces_it():
+    registry = LeaveRegistry()
+    registry.add(application("app-1"))
+    registry.add(application("app-1", username="bob"))
+    assert len(registry) == 1 and registry.pending_count == 1
+    assert registry.for_username("alice") == []
+    assert [leave.id for leave in registry.for_username("bob")] == ["app-1"]
+
+
+def test_transition_only_applies_from_the_expected_status():
+    registry = LeaveRegistry()
+    registry.add(application("app-1"))
+    assert registry.transition("app-1", "Approved")
+    assert not registry.transition("app-1", "Rejected")
+    assert registry.get("app-1")["status"] == "Approved"
+    assert registry.pending_count == 0
+    assert registry.for_supervisor("boss@example.com", status="Pending") == []
+    assert registry.transition("app-1", "Cancelled", expected_status="Approved")
+    assert not registry.transition("missing", "Approved")
+
+
+def test_eviction_drops_only_decided_applications_past_retention():
+    registry = LeaveRegistry(retention_seconds=60)
+    registry.add(application("app-1"))
+    registry.add(application("app-2"))
+    registry.transition("app-1", "Approved")
+    decided_at = registry.get("app-1").finished_at
+
+    assert registry.evict_finished(now=decided_at + 30) == 0
+    assert registry.evict_finished(now=decided_at + 61) == 1
+    assert "app-1" not in registry
+    assert "app-2" in registry and registry.pending_count == 1
+
+
+def test_eviction_skips_reopened_applications():
+    registry = LeaveRegistry(retention_seconds=60)
+    registry.add(application("app-1"))
+    registry.transition("app-1", "Approved")
+    decided_at = registry.get("app-1").finished_at
+    registry.transition("app-1", "Pending", expected_status="Approved")
+
+    assert registry.evict_finished(now=decided_at + 61) == 0
+    assert "app-1" in registry and registry.pending_count == 1
+
+
+def test_memory_footprint_counts_applications():
+    registry = LeaveRegistry()
+    registry.add(application("app-1"))
+    registry.add(application("app-2", status="Approved"))
+    footprint = registry.memory_footprint()
+    assert footprint["applications"] == 2
+    assert footprint["pending"] == 1 and footprint["finished"] == 1
+    assert footprint["approx_bytes"] > 0
@@ -0,0 +1,156 @@
+# tests/test_single_flight.py (coalescing of concurrent identical lookups)
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+class BlockingLookup:
+    """A lookup that holds its callers until released, counting how often it really ran"""
+
+    def __init__(self, result=None, error=None):
+        self.release = threading.Event()
+        self.calls = 0
+        self.result = result
+        self.error = error
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return {"args": list(args), "result": self.result}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+def run_callers(flight, key, lookup, count):
+    results = [None] * count
+    errors = [None] * count
+
+    def caller(index):
+        try:
+            results[index] = flight.do(key, lookup, "alice")
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    # Every caller but the leader has joined the flight before it lands
+    wait_for(lambda: flight.stats().get(key[0], {}).get("suppressed") == count - 1)
+    lookup.release.set()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    lookup = BlockingLookup(result=[1, 2])
+    results, errors = run_callers(flight, ("intern", "alice"), lookup, 8)
+
+    assert lookup.calls == 1
+    assert errors == [None] * 8
+    assert all(result == {"args": ["alice"], "result": [1, 2]} for result in results)
+    assert flight.stats() == {"intern": {"queries": 1, "suppressed": 7}, "in_flight": 0}
+
+
+def test_followers_get_their_own_copy():
+    flight = SingleFlight()
+    results, _ = run_callers(flight, ("intern", "alice"), BlockingLookup(result=[1]), 3)
+    results[0]["result"].append(2)
+    assert [result["result"] for result in results].count([1]) == 2
+
+
+def test_an_exception_reaches_every_caller_and_the_next_call_runs_again():
+    flight = SingleFlight()
+    lookup = BlockingLookup(error=RuntimeError("database down"))
+    _, errors = run_callers(flight, ("intern", "alice"), lookup, 4)
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+    lookup.error = None
+    assert flight.do(("intern", "alice"), lookup, "alice")["args"] == ["alice"]
+    assert lookup.calls == 2
+
+
+def test_different_keys_do_not_share():
+    flight = SingleFlight()
+    lookup = BlockingLookup()
+    lookup.release.set()
+    flight.do(("intern", "alice"), lookup, "alice")
+    flight.do(("intern", "bob"), lookup, "bob")
+    assert lookup.calls == 2
+
+
+def test_forget_starts_a_fresh_flight():
+    flight = SingleFlight()
+    stale = BlockingLookup(result="stale")
+    leader = threading.Thread(target=flight.do, args=(("intern", "alice"), stale, "alice"))
+    leader.start()
+    wait_for(lambda: stale.calls == 1)
+
+    flight.forget(("intern", "alice"))
+    fresh = BlockingLookup(result="fresh")
+    fresh.release.set()
+    assert flight.do(("intern", "alice"), fresh, "alice")["result"] == "fresh"
+    stale.release.set()
+    leader.join()
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_coroutines_join_the_flight_of_a_thread():
+    flight = SingleFlight()
+    lookup = BlockingLookup(result="shared")
+    leader_result = []
+    leader = threading.Thread(target=lambda: leader_result.append(flight.do(("intern", "alice"), lookup, "alice")))
+    leader.start()
+    wait_for(lambda: lookup.calls == 1)
+
+    async def follower():
+        task = asyncio.ensure_future(flight.do_async(("intern", "alice"), lookup, "alice"))
+        await asyncio.sleep(0.01)
+        lookup.release.set()
+        return await task
+
+    assert asyncio.run(follower())["result"] == "shared"
+    leader.join()
+    assert lookup.calls == 1
+    assert leader_result[0]["result"] == "shared"
+
+
+def test_stats_reset():
+    flight = SingleFlight()
+    lookup = BlockingLookup()
+    lookup.release.set()
+    flight.do(("leaves", "alice"), lookup)
+    assert flight.stats(reset=True)["leaves"] == {"queries": 1, "suppressed": 0}
+    assert flight.stats() == {"in_flight": 0}
+
+
+def test_async_leader_runs_in_a_worker_thread():
+    flight = SingleFlight()
+    loop_thread = []
+
+    def lookup():
+        loop_thread.append(threading.current_thread() is threading.main_thread())
+        return "ok"
+
+    assert asyncio.run(flight.do_async(("intern", "alice"), lookup)) == "ok"
+    assert loop_thread == [False]
+
+
+@pytest.mark.parametrize("count", [2, 16])
+def test_stats_count_every_follower(count):
+    flight = SingleFlight()
+    run_callers(flight, ("intern", "alice"), BlockingLookup(), count)
+    assert flight.stats()["intern"] == {"queries": 1, "suppressed": count - 1}
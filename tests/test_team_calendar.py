@@ -0,0 +1,54 @@
+# tests/test_team_calendar.py (availability grid folding; no database needed)
+import importlib
+import sys
+import types
+from datetime import date
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def team_calendar(monkeypatch):
+    # db_utils connects to PostgreSQL when imported; build_availability_grid only needs the leaves it is given
+    monkeypatch.setitem(sys.modules, "db_utils", types.SimpleNamespace(get_team_leaves=None))
+    monkeypatch.delitem(sys.modules, "team_calendar", raising=False)
+    return importlib.import_module("team_calendar")
+
+
+def leave(name, start_date, end_date, day_portion="Full Day"):
+    return {'name': name, 'leave_type': 'Annual Leave', 'start_date': start_date, 'end_date': end_date,
+            'day_portion': day_portion}
+
+
+INTERNS = [{'name': 'Alice'}, {'name': 'Bob'}]
+MONDAY = date(2026, 3, 2)
+FRIDAY = date(2026, 3, 6)
+
+
+def test_am_and_pm_half_days_on_one_date_are_a_full_day(team_calendar):
+    leaves = [leave('Alice', MONDAY, MONDAY, "Half Day (AM)"), leave('Alice', MONDAY, MONDAY, "Half Day (PM)")]
+    availability = team_calendar.build_availability_grid(INTERNS, leaves, MONDAY, FRIDAY)
+    assert availability['grid'][0].tolist() == [1, 0, 0, 0, 0]
+    assert team_calendar.format_availability(availability).splitlines()[2].endswith("X....")
+
+
+def test_single_half_day_is_half(team_calendar):
+    grid = team_calendar.build_availability_grid(INTERNS, [leave('Bob', MONDAY, MONDAY, "Half Day (PM)")],
+                                                 MONDAY, FRIDAY)['grid']
+    assert grid[1].tolist() == [0.5, 0, 0, 0, 0]
+    assert grid[0].tolist() == [0, 0, 0, 0, 0]
+
+
+def test_overlapping_leaves_never_exceed_a_full_day(team_calendar):
+    leaves = [leave('Alice', MONDAY, date(2026, 3, 3)), leave('Alice', MONDAY, MONDAY, "Half Day (AM)")]
+    grid = team_calendar.build_availability_grid(INTERNS, leaves, MONDAY, FRIDAY)['grid']
+    assert grid[0].tolist() == [1, 1, 0, 0, 0]
+
+
+def test_weekends_are_never_counted(team_calendar):
+    sunday = date(2026, 3, 8)
+    availability = team_calendar.build_availability_grid(INTERNS, [leave('Alice', FRIDAY, sunday)], FRIDAY, sunday)
+    assert availability['grid'][0].tolist() == [1, 0, 0]
+    assert availability['weekends'].tolist() == [False, True, True]
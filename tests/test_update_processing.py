@@ -0,0 +1,131 @@
+# tests/test_update_processing.py (per-chat ordering and the concurrency limit of PerChatUpdateProcessor)
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("telegram")
+from telegram import Chat, Message, Update, User
+
+from update_processing import PerChatUpdateProcessor
+
+
+def chat_update(chat_id, update_id=1):
+    user = User(id=chat_id, first_name="Intern", is_bot=False)
+    message = Message(message_id=update_id, date=datetime.now(), chat=Chat(id=chat_id, type=Chat.PRIVATE),
+                      from_user=user, text="hi")
+    return Update(update_id=update_id, message=message)
+
+
+class Recorder:
+    """Handler coroutines that log when they start and finish and track how many run at once"""
+
+    def __init__(self):
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+
+    async def handle(self, name, hold=0.01):
+        self.events.append(("start", name))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(hold)
+        self.running -= 1
+        self.events.append(("end", name))
+
+    def starts(self):
+        return [name for event, name in self.events if event == "start"]
+
+
+def process_all(processor, jobs):
+    """Hand (update, coroutine) pairs to the processor in order, as the application would, and wait for them"""
+    async def run():
+        await asyncio.gather(*(processor.do_process_update(update, coroutine) for update, coroutine in jobs))
+    asyncio.run(run())
+
+
+def test_updates_of_one_chat_run_one_at_a_time_in_arrival_order():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=8)
+    recorder = Recorder()
+    process_all(processor, [(chat_update(1, n), recorder.handle(n, hold=0.01 * (5 - n))) for n in range(5)])
+
+    # Each update finishes before the next one of the chat starts, even when the later ones are quicker
+    assert recorder.events == [(event, n) for n in range(5) for event in ("start", "end")]
+
+
+def test_different_chats_run_concurrently():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=8)
+    started = []
+
+    async def run():
+        event = asyncio.Event()
+
+        async def handle(chat_id):
+            started.append(chat_id)
+            if len(started) == 2:
+                event.set()
+            # Deadlocks (and times out) if the second chat had to wait for the first
+            await asyncio.wait_for(event.wait(), 1)
+
+        await asyncio.gather(processor.do_process_update(chat_update(1), handle(1)),
+                             processor.do_process_update(chat_update(2), handle(2)))
+
+    asyncio.run(run())
+    assert started == [1, 2]
+
+
+def test_concurrency_is_capped_across_chats():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+    recorder = Recorder()
+    process_all(processor, [(chat_update(chat_id), recorder.handle(chat_id)) for chat_id in range(6)])
+    assert recorder.max_running == 2
+    assert sorted(recorder.starts()) == list(range(6))
+
+
+def test_an_update_queued_behind_its_chat_holds_no_slot():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=1)
+    recorder = Recorder()
+    process_all(processor, [
+        (chat_update(1, 1), recorder.handle("chat 1, first")),
+        (chat_update(1, 2), recorder.handle("chat 1, second")),
+        (chat_update(2, 3), recorder.handle("chat 2")),
+    ])
+    # The only slot goes to chat 2 while chat 1's second update is still waiting for its chat
+    assert recorder.starts() == ["chat 1, first", "chat 2", "chat 1, second"]
+
+
+def test_updates_without_a_chat_are_processed():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+    recorder = Recorder()
+    process_all(processor, [("not an update", recorder.handle("job")), (chat_update(1), recorder.handle("chat"))])
+    assert sorted(recorder.starts()) == ["chat", "job"]
+
+
+def test_chat_state_is_released_and_counted():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=4)
+    recorder = Recorder()
+    process_all(processor, [(chat_update(n % 3, n), recorder.handle(n)) for n in range(9)])
+
+    stats = processor.stats(reset_max=True)
+    assert stats["processed"] == 9
+    assert stats["running"] == 0 and stats["waiting"] == 0
+    assert stats["chats_queued"] == 0
+    assert processor.stats()["max_wait_ms"] == 0.0
+
+
+def test_a_failing_update_does_not_block_its_chat():
+    processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+    recorder = Recorder()
+
+    async def fail():
+        raise RuntimeError("handler error")
+
+    async def run():
+        return await asyncio.gather(processor.do_process_update(chat_update(1, 1), fail()),
+                                    processor.do_process_update(chat_update(1, 2), recorder.handle("after")),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[0], RuntimeError)
+    assert recorder.starts() == ["after"]
+    assert processor.stats()["chats_queued"] == 0
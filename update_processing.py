@@ -0,0 +1,109 @@
+# update_processing.py (concurrent update processing that keeps each chat's updates in order)
+import asyncio
+import os
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Update processing configuration from environment variables
+#   MAX_CONCURRENT_UPDATES  updates handled at the same time across all chats (16)
+#   MAX_PENDING_UPDATES     updates accepted from the update queue before fetching pauses (1024)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", 16))
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", 1024))
+
+# Number of recent queue waits kept for the percentiles in stats()
+WAIT_SAMPLES = 1000
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates from different chats concurrently and updates from the same chat one at a time.
+
+    Each update first waits its turn in its chat, then for one of max_concurrent_updates slots, so
+    an update queued behind another from the same chat never holds a slot. ConversationHandler
+    state and context.user_data are therefore only touched by one update per chat at a time.
+    """
+
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES, max_pending_updates=MAX_PENDING_UPDATES):
+        # The base class semaphore bounds how many updates may be waiting or running at once
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.concurrency_limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks = {}
+        self._chat_waiters = {}
+        self._running = 0
+        self._waiting = 0
+        self._processed = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._max_wait = 0.0
+
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        if key is None:
+            await self._run(coroutine, queued_at)
+            return
+
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                await self._run(coroutine, queued_at)
+        finally:
+            self._chat_waiters[key] -= 1
+            if not self._chat_waiters[key]:
+                del self._chat_waiters[key]
+                del self._chat_locks[key]
+
+    async def _run(self, coroutine, queued_at):
+        async with self._slots:
+            wait = time.perf_counter() - queued_at
+            self._waiting -= 1
+            self._running += 1
+            self._waits.append(wait)
+            self._max_wait = max(self._max_wait, wait)
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+                self._processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self, reset_max=False):
+        """Queue wait and occupancy figures; reset_max starts a new window for max_wait_ms"""
+        waits = sorted(self._waits)
+
+        def percentile(fraction):
+            return round(waits[min(len(waits) - 1, round(fraction * (len(waits) - 1)))] * 1000, 1) if waits else 0.0
+
+        stats = {
+            "running": self._running,
+            "waiting": self._waiting,
+            "chats_queued": len(self._chat_locks),
+            "processed": self._processed,
+            "limit": self.concurrency_limit,
+            "wait_p50_ms": percentile(0.50),
+            "wait_p95_ms": percentile(0.95),
+            "max_wait_ms": round(self._max_wait * 1000, 1),
+        }
+        if reset_max:
+            self._max_wait = 0.0
+        return stats
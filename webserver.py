@@ -1,36 +1,126 @@
 from flask import Flask, request, jsonify
-import asyncio
+import html
+import logging
+from urllib.parse import urlencode
+from dotenv import load_dotenv
+load_dotenv()
+from log_utils import setup_logging
+setup_logging()
 import pandas as pd
 from datetime import datetime, timedelta
-from db_utils import get_registered_interns, get_intern_by_telegram, update_leave_balance, save_leave_application, update_leave_taken
+from db_utils import get_registered_interns, get_intern_by_telegram, get_leave_stats, get_leave_application_details, transition_leave_status, APPROVED_STATUSES, bulk_decide_leave_applications, get_pending_leave_applications, register_supervisor_chat, leave_breakdown_remarks, MAX_BULK_DECISIONS
 import os
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup  # Add these imports
 from decimal import Decimal
+from team_calendar import get_team_availability, invalidate_team_availability
+from approval_tokens import verify_approval_token, verify_bulk_review_token, verify_supervisor_link_token
+from leave_registry import LeaveApplication
+from notifications import telegram_notification, wake_notification_dispatcher
 
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-# This will be set by the main bot
+# Pending applications per page of the supervisor's review page
+REVIEW_PAGE_SIZE = 50
+
+# This will be set by the main bot; standalone web workers (python webserver.py, gunicorn webserver:app) run without it
 bot_context = None
 
 
+# This function applies a decision through the database's compare-and-set transition
+# Returns (decided, current_status, refusal); only the caller that moved the application out of Pending gets
+# decided=True. An approval the balance or overlap check turns down is rejected in the same transaction, with
+# current_status "Rejected" and refusal the LeaveRefusal saying why (see transition_leave_status).
+# The intern's notification is queued in the decision's transaction, so it is sent only if this caller won.
+# Inside the bot process the registry's copy is moved to the same status so its indexes stay correct
+def decide_leave_application(leave_application, new_status, remarks=None, intern_message=None):
+    notifications = None
+    if intern_message and leave_application.get("chat_id"):
+        notifications = [decision_notification(leave_application.id, new_status, leave_application["chat_id"], intern_message)]
+
+    def refusal_notifications(refusal):
+        if not leave_application.get("chat_id"):
+            return []
+        return [decision_notification(leave_application.id, "Rejected", leave_application["chat_id"],
+                                      refusal_message(leave_application, refusal))]
+
+    decided, current_status, refusal = transition_leave_status(
+        leave_application.id, new_status, remarks=remarks, decision_time=leave_application.get("decision_time"),
+        notifications=notifications, refusal_status="Rejected" if new_status in APPROVED_STATUSES else None,
+        refusal_notifications=refusal_notifications, start_date=leave_application["start_date"]
+    )
+    if decided:
+        if bot_context is not None:
+            bot_context.bot_data['leave_registry'].transition(leave_application.id, current_status)
+            if notifications or leave_application.get("chat_id"):
+                wake_notification_dispatcher(bot_context.job_queue)
+        leave_application.status = current_status
+        if refusal is not None:
+            leave_application["remarks"] = f"Auto-rejected due to {refusal.reason}: {refusal.message}"
+        elif remarks is not None:
+            leave_application["remarks"] = remarks
+    return decided, current_status, refusal
+
+
+# This function builds the result for an application decided by someone else first
+def already_decided_response(current_status):
+    if current_status is None:
+        return "This leave application could not be processed. Please try again later.", 500
+    return f"This leave application has already been {current_status.lower()}.", 409
+
+
+# This function builds the outbox entry telling an intern about a decision, followed by the main menu
+def decision_notification(application_id, status, chat_id, text):
+    return telegram_notification(f"decision:{application_id}:{status}:telegram", chat_id, [
+        (text, None),
+        ("Welcome! Choose an option:", main_menu_markup())
+    ])
+
+
+# This function builds the main menu keyboard sent after a decision - must match the bot's main_menu() function
+def main_menu_markup():
+    keyboard = [
+        [InlineKeyboardButton("Check Leave Balance", callback_data="balance")],
+        [InlineKeyboardButton("Apply for Leave", callback_data="apply_leave")],
+        [InlineKeyboardButton("Cancel Leave", callback_data="cancel_leave")],
+        [InlineKeyboardButton("Submit Documents", url=os.getenv("FORM_URL"))]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
 # Handling of the leave application response from the email link
 @app.route('/leave-response', methods=['GET'])
 def handle_leave_response():
     """Handle supervisor's approve/reject response from email links"""
-    application_id = request.args.get('id')
-    action = request.args.get('action')
-    
-    # Validate inputs and error handling
-    if not bot_context:
-        return jsonify({"status": "error", "message": "Bot not initialized"}), 500
-        
-    leave_applications = bot_context.bot_data.get('leave_applications', {})
-    leave_application = leave_applications.get(application_id)
-    
-    if not leave_application or leave_application["status"] != "Pending":
+    # The link carries a signed token naming the application and the action
+    verified = verify_approval_token(request.args.get('token'))
+    if not verified:
         message = "This leave application link is now invalid and has expired."
         return message, 400, {"Content-Type": "text/html"}
+    application_id, action, start_date = verified
+
+    message, status_code = apply_supervisor_decision(application_id, action, start_date=start_date)
+    return message, status_code, {"Content-Type": "text/html"}
+
+
+# This function applies a supervisor's approve/reject decision, from an email link or a Telegram button.
+# An approval is turned into a rejection when the balance is short or the dates overlap an approved leave.
+# supervisor_email, when given, must be the application's supervisor; start_date, when the link carries it,
+# narrows the lookup to the application's partition of the leave log.
+# Returns (message for the supervisor in HTML, HTTP status code)
+def apply_supervisor_decision(application_id, action, supervisor_email=None, start_date=None):
+    # The database is the source of truth, so any web worker can apply the decision
+    details = get_leave_application_details(application_id, start_date)
+    leave_application = LeaveApplication(**details) if details else None
+    
+    if not leave_application:
+        message = "This leave application link is now invalid and has expired."
+        return message, 400
+    if supervisor_email is not None and leave_application["supervisor_email"] != supervisor_email:
+        return "This leave application is not addressed to you.", 403
+    if leave_application["status"] != "Pending":
+        return already_decided_response(leave_application["status"])
     
 
     # Get Datetime of approval/rejection
@@ -41,212 +131,292 @@ def handle_leave_response():
 
     # Update status based on action
     if action == "approve":
+        # The balance and overlap checks run in the approval's transaction, under the intern's row lock
+        remarks_value = leave_breakdown_remarks(
+            leave_application["leave_type"], leave_application["start_date"], leave_application["end_date"],
+            leave_application["leave_duration"]
+        )
+
+        # Approve and deduct the leave balance in one transaction, unless someone else decided first
+        decided, current_status, refusal = decide_leave_application(
+            leave_application, "Approved", remarks=remarks_value, intern_message=decision_message(leave_application, "Approved")
+        )
+        if not decided:
+            return already_decided_response(current_status)
+
+        # The checks failed, so the application was rejected instead and the intern told why
+        if refusal is not None:
+            # Cancel auto-approval job (the bot's job also re-checks the status in the database)
+            if bot_context is not None:
+                current_jobs = bot_context.job_queue.get_jobs_by_name(f"auto_approve_{application_id}")
+                for job in current_jobs:
+                    job.schedule_removal()
 
-        # **Check current balance before approving**
-        username = leave_application["username"]
-        intern_info = get_intern_by_telegram(username)
-        leave_duration = leave_application["leave_duration"]
-        leave_type = leave_application["leave_type"]
-        
-        # Check if this is a leave type that requires balance verification
-        balance_check_failed = False
-        insufficient_balance_message = ""
-        
-        if leave_type == "Annual Leave":
-            current_balance = intern_info["al_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Annual Leave balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-                
-        elif leave_type == "Medical Leave":
-            current_balance = intern_info["mc_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Medical Leave balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-                
-        elif leave_type == "Compassionate Leave":
-            current_balance = intern_info["compassionate_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Compassionate Leave balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-                
-        elif leave_type == "Off in Lieu":
-            current_balance = intern_info["oil_balance"]
-            if leave_duration > current_balance:
-                balance_check_failed = True
-                insufficient_balance_message = f"Off in Lieu balance insufficient. Current: {current_balance} days, Required: {leave_duration} days."
-        
-        # If balance check failed, reject the application automatically
-        if balance_check_failed:
-            leave_application["status"] = "Rejected"
-            leave_application["remarks"] = f"Auto-rejected due to insufficient balance: {insufficient_balance_message}"
-            
-            # Save the rejected application
-            save_leave_application(leave_application)
-            
-            # Cancel auto-approval job
-            job_queue = bot_context.job_queue
-            current_jobs = job_queue.get_jobs_by_name(f"auto_approve_{application_id}")
-            for job in current_jobs:
-                job.schedule_removal()
-            
-            # Notify employee about rejection due to insufficient balance
-            if 'chat_id' in leave_application:
-                try:
-                    asyncio.run(
-                        bot_context.bot.send_message(
-                            chat_id=leave_application["chat_id"],
-                            text=f"Your {leave_application.get('leave_type', 'Unknown')} from {leave_application['start_date']} to {leave_application['end_date']} has been rejected due to insufficient balance. {insufficient_balance_message}"
-                        )
-                    )
-                    
-                    # Send main menu
-                    from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-                    
-                    keyboard = [
-                        [InlineKeyboardButton("Check Leave Balance", callback_data="balance")],
-                        [InlineKeyboardButton("Apply for Leave", callback_data="apply_leave")],
-                        [InlineKeyboardButton("Cancel Leave", callback_data="cancel_leave")],
-                        [InlineKeyboardButton("Submit Documents", url=os.getenv("FORM_URL"))]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    asyncio.run(
-                        bot_context.bot.send_message(
-                            chat_id=leave_application["chat_id"],
-                            text="Welcome! Choose an option:",
-                            reply_markup=reply_markup
-                        )
-                    )
-                except Exception as e:
-                    print(f"Failed to notify employee about balance rejection: {e}")
-            
             # Return message to supervisor
-            message = f'Leave application for {leave_application["employee_name"]} has been <b>automatically rejected</b> due to insufficient balance. {insufficient_balance_message} The intern has been notified.'
-            return message, 200, {"Content-Type": "text/html"}
-        
-        # If balance check passed, proceed with approval
-        leave_application["status"] = "Approved"
-        
-        # # Track no pay leaves by month 
-        # Generate monthly breakdown of no pay leaves
-        monthly_breakdown = {}
-        current_date = leave_application["start_date"]
-        end_date = leave_application["end_date"]
-        
-        while current_date <= end_date:
-            if current_date.weekday() < 5:  # Skip weekends
-                month_key = current_date.strftime("%Y-%m")
-                if month_key not in monthly_breakdown:
-                    monthly_breakdown[month_key] = 0
-                
-                # Add full day or half day based on day_portion
-                if current_date == leave_application["start_date"] and current_date == leave_application["end_date"]:
-                    # Single day leave with possibly AM/PM option
-                    day_portion = leave_application.get("day_portion", "Full Day")
-                    if day_portion in ["AM Only", "PM Only"]:
-                        monthly_breakdown[month_key] += 0.5
-                    else:
-                        monthly_breakdown[month_key] += 1
-                else:
-                    monthly_breakdown[month_key] += 1
-            
-            current_date += timedelta(days=1)
-        
-        # Format monthly breakdown for remarks
-        remarks = "Leave breakdown: "
-        for month, days in monthly_breakdown.items():
-            month_name = datetime.strptime(month, "%Y-%m").strftime("%b %Y")
-            remarks += f"{month_name}: {days} day(s), "
-        remarks_value = remarks.rstrip(", ")
-        leave_application["remarks"] = remarks_value
-
-        # Update leave balance if needed  --> in intern data 
-        if leave_application.get("balance_type")=="al_balance" or leave_application.get("balance_type")=="mc_balance" or leave_application.get("balance_type")=="compassionate_balance" or leave_application.get("balance_type")=="oil_balance":
-            username = leave_application["username"]
-            balance_type = leave_application["balance_type"]
-            taken_type = leave_application["taken_type"]
-            new_balance = leave_application["new_balance"]
-            leave_duration = leave_application["leave_duration"]
-            print(new_balance,leave_duration)
-            # leave_application["remarks"] = remarks_value  
-            
-            if update_leave_balance(username, balance_type, leave_duration, taken_type) :
-                print(f"Leave balance updated for {username}.")
-        
-        else:
-            username = leave_application["username"]
-            leave_duration = leave_application["leave_duration"]
-            taken_type = leave_application["taken_type"]
-            update_leave_taken(username, leave_duration, taken_type)  # Update leave taken field in the database
+            message = f'Leave application for {leave_application["employee_name"]} has been <b>automatically rejected</b> due to {refusal.reason}. {refusal.message} The intern has been notified.'
+            return message, 200
 
         message=f'You have <b>approved</b> {leave_application["leave_type"]} for {leave_application["employee_name"]} to be taken from {leave_application["start_date"]} to {leave_application["end_date"]}. Duration: {leave_application["leave_duration"]} days. The intern has been notified.'
-        
-            
-
 
     elif action == "reject":
-        leave_application["status"] = "Rejected"
+        decided, current_status, _ = decide_leave_application(
+            leave_application, "Rejected", intern_message=decision_message(leave_application, "Rejected")
+        )
+        if not decided:
+            return already_decided_response(current_status)
         message=f'You have <b>rejected</b> {leave_application["leave_type"]} for {leave_application["employee_name"]} to be taken from {leave_application["start_date"]} to {leave_application["end_date"]}. Duration: {leave_application["leave_duration"]} days. The intern has been notified.'
         
         
         
     else:
-        return jsonify({"status": "error", "message": "Invalid action"}), 400
+        return "Invalid action", 400
     
 
-    save_leave_application(leave_application)  # Save to database
-    
+    if leave_application["status"] == "Approved":
+        invalidate_team_availability(leave_application["employee_name"])
     
-    # Cancel auto-approval job
-    job_queue = bot_context.job_queue
-    current_jobs = job_queue.get_jobs_by_name(f"auto_approve_{application_id}")
-    for job in current_jobs:
-        job.schedule_removal()
     
-    # Notify employee
-    if 'chat_id' in leave_application:
-        try:
-            print("Notifying employee...")
-            
-            # First send the notification about leave approval/rejection
-            asyncio.run(
-                bot_context.bot.send_message(
-                    chat_id=leave_application["chat_id"],
-                    text=f"Your {leave_application.get('leave_type', 'Unknown')} from {leave_application['start_date']} to {leave_application['end_date']}, has been {leave_application['status'].lower()} by your supervisor."
-                )
-            )
-            
-            # Then send the main menu
-            from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-            
-            # Create main menu keyboard - must match your main_menu() function
-            keyboard = [
-                [InlineKeyboardButton("Check Leave Balance", callback_data="balance")],
-                [InlineKeyboardButton("Apply for Leave", callback_data="apply_leave")],
-                [InlineKeyboardButton("Cancel Leave", callback_data="cancel_leave")],
-                [InlineKeyboardButton("Submit Documents", url=os.getenv("FORM_URL"))]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            # Send main menu
-            asyncio.run(
-                bot_context.bot.send_message(
-                    chat_id=leave_application["chat_id"],
-                    text="Welcome! Choose an option:",
-                    reply_markup=reply_markup
-                )
-            )
-            
-            print("Notified employee and sent main menu.")
-        except Exception as e:
-            print(f"Failed to notify employee: {e}")
+    # Cancel auto-approval job (the bot's job also re-checks the status in the database)
+    if bot_context is not None:
+        current_jobs = bot_context.job_queue.get_jobs_by_name(f"auto_approve_{application_id}")
+        for job in current_jobs:
+            job.schedule_removal()
     
     # return jsonify({"status": "success", "action": action, "application_id": application_id})
+    return message, 200
+
+# This function words an intern's notification for an approval turned down by the balance or overlap check
+def refusal_message(leave_application, refusal):
+    return (f"Your {leave_application.get('leave_type', 'Unknown')} from {leave_application['start_date']} to "
+            f"{leave_application['end_date']} has been rejected due to {refusal.reason}. {refusal.message}")
+
+# This function words an intern's notification for a supervisor's decision
+def decision_message(leave_application, status):
+    return (f"Your {leave_application.get('leave_type', 'Unknown')} from {leave_application['start_date']} to "
+            f"{leave_application['end_date']}, has been {status.lower()} by your supervisor.")
+
+
+# This function builds the outbox entries for one application decided in a bulk request
+def bulk_outcome_notifications(outcome):
+    if not outcome["chat_id"]:
+        return []
+    return [decision_notification(outcome["application_id"], outcome["outcome"], outcome["chat_id"], bulk_outcome_message(outcome))]
+
+
+# This function words an intern's notification for one bulk decision outcome
+def bulk_outcome_message(outcome):
+    if outcome["reason"]:
+        return (f"Your {outcome['leave_type']} from {outcome['start_date']} to {outcome['end_date']} has been rejected "
+                f"due to {outcome['reason']}.")
+    return (f"Your {outcome['leave_type']} from {outcome['start_date']} to {outcome['end_date']}, has been "
+            f"{outcome['outcome'].lower()} by your supervisor.")
+
+
+# This function reads the decisions of a bulk request: JSON {"decisions": [{"application_id": ..., "action": ...}]}
+# or the review form's decision_<application_id> fields (left at "skip" for applications not decided yet)
+def parse_bulk_decisions():
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        entries = payload.get("decisions")
+        if not isinstance(entries, list):
+            return None
+        decisions = []
+        for entry in entries:
+            if not isinstance(entry, dict):
+                return None
+            decisions.append((str(entry.get("application_id")), entry.get("action")))
+    else:
+        decisions = [
+            (field[len("decision_"):], action)
+            for field, action in request.form.items()
+            if field.startswith("decision_") and action != "skip"
+        ]
+    if any(action not in ("approve", "reject") for _, action in decisions):
+        return None
+    return decisions
+
+
+# Supervisor's page listing their pending applications, with one approve/reject/skip choice each
+# It pages with ?after=<last application of the previous page> (keyset pagination, see get_pending_leave_applications)
+@app.route('/leave-response/bulk', methods=['GET'])
+def bulk_review_page():
+    """Show a page of the supervisor's pending leave applications as a form posting to the bulk decision endpoint"""
+    token = request.args.get('token', '')
+    supervisor_email = verify_bulk_review_token(token)
+    if not supervisor_email:
+        return "This review link is now invalid and has expired.", 400, {"Content-Type": "text/html"}
+
+    after = request.args.get('after') or None
+    # One row past the page tells whether there is a next page without counting the whole queue
+    pending = get_pending_leave_applications(supervisor_email, after, REVIEW_PAGE_SIZE + 1)
+    if pending is None:
+        return "Your pending leave applications could not be loaded. Please try again later.", 500, {"Content-Type": "text/html"}
+    if not pending:
+        if after:
+            return "There are no more pending leave applications.", 200, {"Content-Type": "text/html"}
+        return "You have no pending leave applications.", 200, {"Content-Type": "text/html"}
+    has_more = len(pending) > REVIEW_PAGE_SIZE
+    pending = pending[:REVIEW_PAGE_SIZE]
+
+    rows = "".join(
+        f"<tr><td>{html.escape(application['employee_name'])}</td><td>{html.escape(application['leave_type'])}</td>"
+        f"<td>{application['start_date']}</td><td>{application['end_date']}</td><td>{application['leave_duration']}</td>"
+        f"<td><select name=\"decision_{html.escape(application['application_id'])}\">"
+        f"<option value=\"skip\">Decide later</option><option value=\"approve\">Approve</option>"
+        f"<option value=\"reject\">Reject</option></select></td></tr>"
+        for application in pending
+    )
+    next_link = ""
+    if has_more:
+        next_url = f"?{urlencode({'token': token, 'after': pending[-1]['application_id']})}"
+        next_link = f"<p><a href=\"{html.escape(next_url)}\">Next page</a> (decisions on this page are not submitted)</p>"
+    page = (
+        f"<p>Pending leave applications for {html.escape(supervisor_email)}"
+        f"{', continued' if after else ''}.</p>"
+        f"<form method=\"post\"><input type=\"hidden\" name=\"token\" value=\"{html.escape(token)}\">"
+        f"<table><tr><th>Employee</th><th>Leave Type</th><th>Start</th><th>End</th><th>Days</th><th>Decision</th></tr>"
+        f"{rows}</table><button type=\"submit\">Submit decisions</button></form>{next_link}"
+    )
+    return page, 200, {"Content-Type": "text/html"}
+
+
+# Bulk decision endpoint: all decisions are applied in one database transaction
+@app.route('/leave-response/bulk', methods=['POST'])
+def handle_bulk_leave_response():
+    """Apply many approve/reject decisions of one supervisor and report the outcome of each application"""
+    wants_json = request.is_json
+    token = (request.get_json(silent=True) or {}).get("token") if wants_json else request.form.get("token")
+    supervisor_email = verify_bulk_review_token(token or request.args.get('token'))
+    if not supervisor_email:
+        if wants_json:
+            return jsonify({"status": "error", "message": "Invalid or expired review token"}), 400
+        return "This review link is now invalid and has expired.", 400, {"Content-Type": "text/html"}
+
+    decisions = parse_bulk_decisions()
+    if decisions is None:
+        return jsonify({"status": "error", "message": "Decisions must be a list of approve/reject actions"}), 400
+    if len(decisions) > MAX_BULK_DECISIONS:
+        return jsonify({"status": "error", "message": f"At most {MAX_BULK_DECISIONS} decisions per request"}), 400
+
+    decision_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    outcomes = bulk_decide_leave_applications(
+        supervisor_email, decisions, decision_time, notifications_for=bulk_outcome_notifications
+    ) if decisions else []
+    if outcomes is None:
+        if wants_json:
+            return jsonify({"status": "error", "message": "The decisions could not be applied. Please try again later."}), 500
+        return "The decisions could not be applied. Please try again later.", 500, {"Content-Type": "text/html"}
+
+    # Only the applications this request moved out of Pending carry their details
+    decided = [outcome for outcome in outcomes if outcome["employee_name"] is not None]
+    for outcome in decided:
+        if bot_context is not None:
+            bot_context.bot_data['leave_registry'].transition(outcome["application_id"], outcome["outcome"])
+            for job in bot_context.job_queue.get_jobs_by_name(f"auto_approve_{outcome['application_id']}"):
+                job.schedule_removal()
+        if outcome["outcome"] == "Approved":
+            invalidate_team_availability(outcome["employee_name"])
+    if decided and bot_context is not None:
+        wake_notification_dispatcher(bot_context.job_queue)
+
+    if wants_json:
+        return jsonify({
+            "status": "success",
+            "results": [
+                {"application_id": outcome["application_id"], "outcome": outcome["outcome"], "reason": outcome["reason"]}
+                for outcome in outcomes
+            ]
+        })
+
+    lines = "".join(
+        f"<li>{html.escape(outcome['employee_name'] or outcome['application_id'])}: "
+        + (f"<b>{outcome['outcome'].lower()}</b>" if outcome["employee_name"] else html.escape(
+            "not found" if outcome["outcome"] == "not_found" else f"already {outcome['outcome'].lower()}"))
+        + (f" due to {outcome['reason']}" if outcome["reason"] else "")
+        + "</li>"
+        for outcome in outcomes
+    )
+    review_url = f"?{urlencode({'token': token or request.args.get('token')})}"
+    message = (f"<p>{len(decided)} of {len(outcomes)} leave application(s) decided. The interns are being notified.</p>"
+               f"<ul>{lines}</ul><p><a href=\"{html.escape(review_url)}\">Back to pending applications</a></p>")
     return message, 200, {"Content-Type": "text/html"}
 
+# Link emailed to a supervisor who asked the bot for their applications: opening it proves they own the address
+@app.route('/supervisor-link', methods=['GET'])
+def supervisor_link():
+    """Send the supervisor's future leave applications to the Telegram chat named in the token"""
+    verified = verify_supervisor_link_token(request.args.get('token'))
+    if not verified:
+        return "This link is now invalid and has expired.", 400, {"Content-Type": "text/html"}
+    supervisor_email, chat_id, telegram_handle = verified
+
+    confirmation = telegram_notification(f"supervisor-link:{supervisor_email}:{chat_id}:{request.args.get('token')[-16:]}", chat_id, [
+        (f"Leave applications for {supervisor_email} will now be sent to this chat with Approve and Reject buttons. "
+         "Send /supervisor off to receive them by email again.", None)
+    ])
+    if not register_supervisor_chat(supervisor_email, telegram_handle, chat_id, [confirmation]):
+        return "Your Telegram account could not be linked. Please try again later.", 500, {"Content-Type": "text/html"}
+    if bot_context is not None:
+        wake_notification_dispatcher(bot_context.job_queue)
+    return (f"New leave applications for {html.escape(supervisor_email)} will be sent to Telegram"
+            f"{' (@' + html.escape(telegram_handle) + ')' if telegram_handle else ''}."), 200, {"Content-Type": "text/html"}
+
+# Leave analytics served from the rollup tables
+# Scoped to the team of the supervisor named by the signed review token; organisation-wide figures stay in the bot's /stats
+@app.route('/stats', methods=['GET'])
+def leave_stats():
+    """Return month-by-leave-type usage and remaining entitlement for ?token=<review token>&month=YYYY-MM"""
+    supervisor_email = verify_bulk_review_token(request.args.get('token'))
+    if not supervisor_email:
+        return jsonify({"status": "error", "message": "Invalid or expired review token"}), 403
+    month_str = request.args.get('month')
+
+    try:
+        month = datetime.strptime(month_str, "%Y-%m").date() if month_str else datetime.now().date()
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid month, expected YYYY-MM"}), 400
+
+    stats = get_leave_stats(month, supervisor_email)
+    if stats is None:
+        return jsonify({"status": "error", "message": "Stats unavailable"}), 500
+    return jsonify(stats)
+
+# Day-by-intern availability of a supervisor's team
+# The supervisor is the one named by the signed review token from their emails, so nobody else can read the team's leave
+@app.route('/team-availability', methods=['GET'])
+def team_availability():
+    """Return the availability grid for ?token=<review token>&start=YYYY-MM-DD&days=N"""
+    supervisor_email = verify_bulk_review_token(request.args.get('token'))
+    if not supervisor_email:
+        return jsonify({"status": "error", "message": "Invalid or expired review token"}), 403
+
+    try:
+        start_date = datetime.strptime(request.args['start'], "%Y-%m-%d").date() if request.args.get('start') else datetime.now().date()
+        days = int(request.args.get('days', 7))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid start (YYYY-MM-DD) or days"}), 400
+    if not 1 <= days <= 62:
+        return jsonify({"status": "error", "message": "days must be between 1 and 62"}), 400
+
+    availability = get_team_availability(supervisor_email, start_date, start_date + timedelta(days=days - 1))
+    if availability is None:
+        return jsonify({"status": "error", "message": "Availability unavailable"}), 500
+
+    return jsonify({
+        "supervisor": supervisor_email,
+        "days": [day.isoformat() for day in availability['days']],
+        "weekends": availability['weekends'].tolist(),
+        "interns": availability['interns'],
+        "grid": availability['grid'].tolist()
+    })
+
 def run_web_server(context):
     global bot_context
     bot_context = context
     port=int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0',port=port)
\ No newline at end of file
+    app.run(host='0.0.0.0',port=port)
+
+# Standalone web worker: decisions are applied from the database and the bot's dispatcher sends the notifications
+# they queue in the outbox
+if __name__ == "__main__":
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 3000)))
\ No newline at end of file